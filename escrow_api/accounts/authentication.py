@@ -0,0 +1,160 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .roles import ROLES_VERSION_CLAIM, role_claims_enabled, role_versions
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+def snapshot_fields():
+    """Concrete user columns kept in a snapshot; the password hash never leaves the database."""
+    return [field.attname for field in User._meta.concrete_fields if field.attname != 'password']
+
+
+class UserSnapshotCache:
+    """
+    Compact user rows keyed by primary key, shared through the
+    USER_SNAPSHOT_CACHE Django cache for USER_SNAPSHOT_CACHE_TTL seconds.
+
+    A snapshot is rebuilt into a CustomUser whose password is deferred, so
+    reading it costs one query and saving it writes only the loaded columns.
+    Saves and deletes of the user, soft deletes included, invalidate the entry
+    (accounts/signals.py), immediately and again on commit. Writes that bypass
+    signals (QuerySet.update) are bounded by the TTL.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'USER_SNAPSHOT_CACHE', 'default')]
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'USER_SNAPSHOT_CACHE_TTL', 60)
+
+    @staticmethod
+    def _key(user_id):
+        return f'user-snapshot:{user_id}'
+
+    def get(self, user_id):
+        """
+        Returns:
+            CustomUser built from the snapshot, or None if no such user exists
+        """
+        key = self._key(user_id)
+        try:
+            snapshot = self.cache.get(key)
+        except Exception as e:
+            logger.error(f"User snapshot cache lookup failed: {str(e)}")
+            snapshot = None
+
+        if snapshot is not None:
+            self._count(hit=True)
+            return self._build(snapshot)
+
+        self._count(hit=False)
+        snapshot = User.objects.filter(pk=user_id).values(*snapshot_fields()).first()
+        if snapshot is None:
+            return None
+        try:
+            self.cache.set(key, snapshot, self.ttl)
+        except Exception as e:
+            logger.error(f"User snapshot cache write failed: {str(e)}")
+        return self._build(snapshot)
+
+    @staticmethod
+    def _build(snapshot):
+        names = [name for name in snapshot_fields() if name in snapshot]
+        return User.from_db(DEFAULT_DB_ALIAS, names, [snapshot[name] for name in names])
+
+    def invalidate(self, user_id):
+        key = self._key(user_id)
+
+        def delete():
+            try:
+                self.cache.delete(key)
+            except Exception as e:
+                logger.error(f"User snapshot cache invalidation failed: {str(e)}")
+
+        delete()
+        transaction.on_commit(delete)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def _count(self, *, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+user_snapshots = UserSnapshotCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user from user_snapshots
+    instead of querying CustomUser on every request. DRF keeps the result on
+    the request, so the user is loaded at most once per request and, while
+    the snapshot is cached, not at all.
+
+    With JWT_ROLE_CLAIMS on, a token whose roles_version no longer matches the
+    user's roles is rejected with code 'roles_changed', so the client
+    refreshes it and gets current role claims.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is None:
+            return None
+        user, token = result
+        if role_claims_enabled() and ROLES_VERSION_CLAIM in token:
+            if token[ROLES_VERSION_CLAIM] != role_versions.current(user.pk):
+                raise AuthenticationFailed(_("Roles have changed; refresh the token"), code="roles_changed")
+        return result
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN or api_settings.USER_ID_FIELD != User._meta.pk.name:
+            # The revoke check needs the password hash, which snapshots leave out.
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = user_snapshots.get(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        return user
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from accounts.tokens import TokenBlacklistPruner, revoked_tokens
+
+
+class Command(BaseCommand):
+    help = "Deletes expired outstanding and blacklisted refresh tokens in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=int, help='Keep tokens this many hours past expiry (default TOKEN_PRUNE_GRACE)')
+        parser.add_argument('--chunk-size', type=int, help='Tokens deleted per transaction')
+        parser.add_argument('--limit', type=int, help='Stop after deleting this many tokens')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the tokens that would be deleted')
+        parser.add_argument('--warm-cache', action='store_true', help='Reload the revoked token cache afterwards')
+
+    def handle(self, *args, **options):
+        pruner = TokenBlacklistPruner(
+            chunk_size=options['chunk_size'],
+            grace=timedelta(hours=options['grace_hours']) if options['grace_hours'] is not None else None,
+        )
+        if options['dry_run']:
+            self.stdout.write(f"{pruner.expired_queryset().count()} expired tokens would be deleted")
+            return
+
+        report = pruner.run(limit=options['limit'])
+        self.stdout.write(
+            f"Deleted {report.outstanding} outstanding and {report.blacklisted} blacklisted tokens in {report.elapsed:.2f}s"
+        )
+        if options['warm_cache']:
+            self.stdout.write(f"Loaded {revoked_tokens.load()} revoked tokens into the cache")
+        self.stdout.write(self.style.SUCCESS("Token prune finished."))
@@ -0,0 +1,146 @@
+"""
+Stateless role claims for access tokens.
+
+With settings.JWT_ROLE_CLAIMS on, tokens carry the user's user_type, is_staff
+and moderator membership as signed claims, plus a roles_version claim that
+fingerprints them. Permission classes read roles through request_role(),
+which answers from the token and only falls back to the database for tokens
+issued without claims (or with the mode off).
+
+CachedJWTAuthentication compares roles_version with the user's current
+fingerprint, kept in the USER_ROLES_CACHE Django cache. When roles change
+(accounts/signals.py drops the entry) the token is rejected with code
+'roles_changed' and the client refreshes it, which re-issues the claims.
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+MODERATOR_GROUP = 'Moderators'
+
+ROLE_CLAIMS = ('user_type', 'is_staff', 'is_moderator')
+ROLES_VERSION_CLAIM = 'roles_version'
+
+
+def role_claims_enabled():
+    return getattr(settings, 'JWT_ROLE_CLAIMS', False)
+
+
+def load_roles(user_id):
+    """
+    Current roles of a user, with one query.
+
+    Returns:
+        Dict of ROLE_CLAIMS, or None if the user does not exist
+    """
+    moderator = Group.objects.filter(name=MODERATOR_GROUP, user=OuterRef('pk'))
+    return (
+        User.objects.filter(pk=user_id)
+        .annotate(is_moderator=Exists(moderator))
+        .values(*ROLE_CLAIMS)
+        .first()
+    )
+
+
+def roles_version(roles):
+    """Short fingerprint of a roles dict; changes whenever any role does."""
+    raw = '|'.join(f'{name}={roles[name]}' for name in ROLE_CLAIMS)
+    return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+
+def set_role_claims(token, roles):
+    for name in ROLE_CLAIMS:
+        token[name] = roles[name]
+    token[ROLES_VERSION_CLAIM] = roles_version(roles)
+
+
+class RoleVersionCache:
+    """
+    Current roles_version per user, in the USER_ROLES_CACHE Django cache for
+    USER_ROLES_CACHE_TTL seconds. Role changes that bypass signals
+    (QuerySet.update, deleting the Moderators group) are bounded by the TTL.
+    """
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'USER_ROLES_CACHE', 'default')]
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'USER_ROLES_CACHE_TTL', 300)
+
+    @staticmethod
+    def _key(user_id):
+        return f'user-roles-version:{user_id}'
+
+    def current(self, user_id):
+        """
+        Returns:
+            The user's current roles_version, or None if the user does not exist
+        """
+        key = self._key(user_id)
+        try:
+            version = self.cache.get(key)
+        except Exception as e:
+            logger.error(f"Role version cache lookup failed: {str(e)}")
+            version = None
+        if version is not None:
+            return version
+
+        roles = load_roles(user_id)
+        if roles is None:
+            return None
+        return self.remember(user_id, roles)
+
+    def remember(self, user_id, roles):
+        version = roles_version(roles)
+        try:
+            self.cache.set(self._key(user_id), version, self.ttl)
+        except Exception as e:
+            logger.error(f"Role version cache write failed: {str(e)}")
+        return version
+
+    def invalidate(self, user_id):
+        key = self._key(user_id)
+
+        def delete():
+            try:
+                self.cache.delete(key)
+            except Exception as e:
+                logger.error(f"Role version cache invalidation failed: {str(e)}")
+
+        delete()
+        transaction.on_commit(delete)
+
+
+role_versions = RoleVersionCache()
+
+
+def request_role(request, name):
+    """
+    One of ROLE_CLAIMS for the requesting user.
+
+    Read from the access token when role claims are enabled and the token
+    carries them (its roles_version was checked during authentication),
+    otherwise from the user row and, for is_moderator, its groups.
+    """
+    token = getattr(request, 'auth', None)
+    if role_claims_enabled() and token is not None and ROLES_VERSION_CLAIM in token:
+        return token.get(name)
+
+    user = request.user
+    if not user or not user.is_authenticated:
+        return None
+    if name == 'is_moderator':
+        return user.groups.filter(name=MODERATOR_GROUP).exists()
+    return getattr(user, name)
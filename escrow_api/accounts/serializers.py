@@ -1,9 +1,10 @@
 import logging
 
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 from django.contrib.auth import authenticate
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework_simplejwt.exceptions import TokenError
 from django.utils.http import urlsafe_base64_decode
 from django.utils.encoding import force_str
@@ -15,6 +16,8 @@ from django.core.exceptions import ValidationError as DjangoPasswordValidationEr
 
 
 from .models import CustomUser
+from .roles import load_roles, role_claims_enabled, role_versions, set_role_claims
+from .tokens import CachedBlacklistRefreshToken
 
 
 logger = logging.getLogger(__name__)
@@ -28,11 +31,16 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         - email (required)
         - password (required)
     Validates credentials and checks if account is active before issuing tokens.
+    With JWT_ROLE_CLAIMS on, the tokens also carry the user's role claims.
     """
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
         token['email'] = user.email
+        if role_claims_enabled():
+            roles = load_roles(user.pk)
+            set_role_claims(token, roles)
+            role_versions.remember(user.pk, roles)
         return token
 
     def validate(self, attrs):
@@ -61,6 +69,31 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         return data
     
 
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Token refresh that re-issues role claims from the user's current roles,
+    so a client told 'roles_changed' recovers with a plain refresh. The
+    refresh token's blacklist check is served by revoked_tokens.
+    """
+    token_class = CachedBlacklistRefreshToken
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        if not role_claims_enabled():
+            return data
+
+        # Signed by super() a moment ago; decoded only to replace the claims copied from the refresh token.
+        access = AccessToken(data['access'], verify=False)
+        user_id = access[jwt_settings.USER_ID_CLAIM]
+        roles = load_roles(user_id)
+        if roles is None:
+            raise AuthenticationFailed("No active account found for the given token.", "no_active_account")
+        set_role_claims(access, roles)
+        role_versions.remember(user_id, roles)
+        data['access'] = str(access)
+        return data
+
+
 class RegistrationSerializer(serializers.ModelSerializer):
     """
     Serializer for user registration.
@@ -178,7 +211,7 @@ class LogoutSerializer(serializers.Serializer):
     
     def save(self, **kwargs):
         try:
-            token = RefreshToken(self.token)
+            token = CachedBlacklistRefreshToken(self.token)
             token.blacklist()
         except TokenError:
             raise serializers.ValidationError("Token is invalid or expired.")
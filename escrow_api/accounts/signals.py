@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .authentication import user_snapshots
+from .roles import role_versions
+from .tokens import revoked_tokens
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_snapshot(sender, instance, **kwargs):
+    # Covers soft deletes too: they save deleted_at and is_active through the model.
+    user_snapshots.invalidate(instance.pk)
+    role_versions.invalidate(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_role_version(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if not reverse:
+        role_versions.invalidate(instance.pk)
+    elif action == 'pre_clear':
+        # group.user_set.clear() does not report which users it removes.
+        for user_id in instance.user_set.values_list('pk', flat=True):
+            role_versions.invalidate(user_id)
+    elif pk_set:
+        for user_id in pk_set:
+            role_versions.invalidate(user_id)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def remember_revoked_token(sender, instance, created, **kwargs):
+    if created:
+        revoked_tokens.add(instance.token.jti, instance.token.expires_at)
@@ -0,0 +1,11 @@
+from celery import shared_task
+
+from .tokens import TokenBlacklistPruner
+
+
+@shared_task
+def prune_token_blacklist(limit=None):
+    """
+    Delete expired outstanding and blacklisted refresh tokens; scheduled daily by beat.
+    """
+    return TokenBlacklistPruner().run(limit=limit).as_dict()
@@ -1,3 +1,291 @@
-from django.test import TestCase
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from disputes.permissions import IsModerator as IsDisputeModerator
+from payments.permissions import IsModerator as IsPaymentModerator
+from user_projects.permissions import IsClient, IsFreelancer
+
+from .authentication import CachedJWTAuthentication, user_snapshots
+from .roles import MODERATOR_GROUP, ROLE_CLAIMS, ROLES_VERSION_CLAIM, role_versions
+from .serializers import CustomTokenObtainPairSerializer, CustomTokenRefreshSerializer
+from .tasks import prune_token_blacklist
+from .tokens import CachedBlacklistRefreshToken, TokenBlacklistPruner, revoked_tokens
+
+User = get_user_model()
+
+
+class CachedJWTAuthenticationTests(TestCase):
+
+    def setUp(self):
+        user_snapshots.cache.clear()
+        user_snapshots.reset_stats()
+        self.user = User.objects.create_user(email='client@example.com', password='pw-12345', user_type='client')
+
+    def authenticate(self, token=None):
+        token = token or AccessToken.for_user(self.user)
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return CachedJWTAuthentication().authenticate(request)
+
+    def test_cached_user_costs_no_queries(self):
+        token = AccessToken.for_user(self.user)
+        with self.assertNumQueries(1):
+            self.authenticate(token)
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate(token)
+
+        self.assertEqual((user.pk, user.email), (self.user.pk, 'client@example.com'))
+        self.assertEqual(user_snapshots.stats()['hits'], 1)
+
+    def test_saving_the_user_invalidates_the_snapshot(self):
+        self.authenticate()
+        self.user.first_name = 'Renamed'
+        self.user.save()
+
+        user, _ = self.authenticate()
+        self.assertEqual(user.first_name, 'Renamed')
+        self.assertEqual(user_snapshots.stats()['misses'], 2)
+
+    def test_deactivated_user_is_rejected(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+
+        with self.assertRaises(AuthenticationFailed) as raised:
+            self.authenticate()
+        self.assertEqual(raised.exception.detail['code'], 'user_inactive')
+
+    def test_soft_deleted_user_is_rejected(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+        # As UserDeleteSerializer does it.
+        self.user.deleted_at = timezone.now()
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed) as raised:
+            self.authenticate(token)
+        self.assertEqual(raised.exception.detail['code'], 'user_inactive')
+
+    def test_snapshot_leaves_out_the_password_hash(self):
+        user, _ = self.authenticate()
+
+        snapshot = user_snapshots.cache.get(user_snapshots._key(self.user.pk))
+        self.assertNotIn('password', snapshot)
+        self.assertIn('password', user.get_deferred_fields())
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('pw-12345'))
+
+    # simplejwt modules keep the api_settings object they imported, so override_settings(SIMPLE_JWT=...) would not reach them.
+    @mock.patch.object(api_settings, 'CHECK_REVOKE_TOKEN', True)
+    def test_revoke_token_check_uses_the_database_lookup(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+        with self.assertNumQueries(1):
+            self.authenticate(token)
+        self.assertEqual(user_snapshots.stats(), {'hits': 0, 'misses': 0, 'hit_rate': 0.0})
+
+        self.user.set_password('pw-67890')
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed) as raised:
+            self.authenticate(token)
+        self.assertEqual(raised.exception.detail['code'], 'password_changed')
+
+
+@override_settings(JWT_ROLE_CLAIMS=True)
+class RoleClaimTests(TestCase):
+
+    def setUp(self):
+        user_snapshots.cache.clear()
+        role_versions.cache.clear()
+        self.moderators = Group.objects.create(name=MODERATOR_GROUP)
+        self.user = User.objects.create(email='client@example.com', user_type='client')
+
+    def request(self, access):
+        return Request(
+            APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {access}'),
+            authenticators=[CachedJWTAuthentication()],
+        )
+
+    def test_issued_tokens_carry_the_role_claims(self):
+        access = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        self.assertEqual(
+            {name: access[name] for name in ROLE_CLAIMS},
+            {'user_type': 'client', 'is_staff': False, 'is_moderator': False},
+        )
+        self.assertIn(ROLES_VERSION_CLAIM, access)
+
+        with override_settings(JWT_ROLE_CLAIMS=False):
+            access = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        self.assertNotIn(ROLES_VERSION_CLAIM, access)
+
+    def test_role_changes_reject_older_tokens(self):
+        changes = {
+            'added to moderators': lambda: self.user.groups.add(self.moderators),
+            'removed from moderators': lambda: self.user.groups.remove(self.moderators),
+            'user_type changed': lambda: self.save_user(user_type='freelancer'),
+            'is_staff changed': lambda: self.save_user(is_staff=not self.user.is_staff),
+        }
+        for label, change in changes.items():
+            with self.subTest(label):
+                access = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+                self.assertEqual(self.request(access).user, self.user)
+
+                change()
+                with self.assertRaises(AuthenticationFailed) as raised:
+                    self.request(access).user
+                self.assertEqual(raised.exception.detail['code'], 'roles_changed')
+
+    def save_user(self, **fields):
+        for name, value in fields.items():
+            setattr(self.user, name, value)
+        self.user.save()
+
+    def test_refresh_reissues_the_current_claims(self):
+        refresh = CustomTokenObtainPairSerializer.get_token(self.user)
+        self.user.groups.add(self.moderators)
+        self.save_user(user_type='freelancer')
+
+        serializer = CustomTokenRefreshSerializer(data={'refresh': str(refresh)})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        access = AccessToken(serializer.validated_data['access'])
+
+        self.assertEqual((access['user_type'], access['is_moderator']), ('freelancer', True))
+        self.assertEqual(self.request(access).user, self.user)
+
+    def test_role_permissions_agree_with_and_without_claims(self):
+        self.user.groups.add(self.moderators)
+        users = {
+            'client': self.user,
+            'freelancer': User.objects.create(email='freelancer@example.com', user_type='freelancer'),
+            'staff': User.objects.create(email='staff@example.com', user_type='client', is_staff=True),
+        }
+        permissions = (IsDisputeModerator, IsPaymentModerator, IsClient, IsFreelancer)
+
+        def decisions(enabled):
+            with override_settings(JWT_ROLE_CLAIMS=enabled):
+                results = {}
+                for label, user in users.items():
+                    request = self.request(CustomTokenObtainPairSerializer.get_token(user).access_token)
+                    request.user
+                    # With claims on, roles come from the token instead of the database.
+                    with self.assertNumQueries(0 if enabled else 1):
+                        results[label] = tuple(permission().has_permission(request, None) for permission in permissions)
+                return results
+
+        expected = {
+            'client': (True, False, True, False),
+            'freelancer': (False, False, False, True),
+            'staff': (False, True, True, False),
+        }
+        self.assertEqual(decisions(False), expected)
+        self.assertEqual(decisions(True), expected)
+
+
+class RevokedTokenTests(TestCase):
+
+    def setUp(self):
+        revoked_tokens.cache.clear()
+        self.user = User.objects.create_user(email='client@example.com', password='pw-12345', user_type='client')
+
+    def log_out(self, refresh):
+        response = self.client.post(
+            reverse('logout'),
+            HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}', HTTP_X_REFRESH_TOKEN=str(refresh),
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def assert_refresh_rejected(self, refresh):
+        response = self.client.post(reverse('token-refresh'), {'refresh': str(refresh)})
+        self.assertEqual(response.status_code, 401, response.data)
+
+    def test_logged_out_token_is_rejected_before_and_after_load(self):
+        refresh = RefreshToken.for_user(self.user)
+        self.log_out(refresh)
+
+        self.assert_refresh_rejected(refresh)
+        revoked_tokens.cache.clear()
+        self.assertEqual(revoked_tokens.load(), 1)
+        self.assert_refresh_rejected(refresh)
+
+    def test_process_local_cache_checks_misses_against_the_database(self):
+        revoked_tokens.load()
+        refresh = RefreshToken.for_user(self.user)
+        CachedBlacklistRefreshToken(str(refresh))
+
+        # Revoked by another process: bulk_create sends no post_save, so this cache never hears of it.
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=OutstandingToken.objects.get(jti=refresh['jti']))])
+        with self.assertRaises(TokenError):
+            CachedBlacklistRefreshToken(str(refresh))
+
+    def test_loaded_shared_cache_answers_without_queries(self):
+        with tempfile.TemporaryDirectory() as location:
+            caches = {
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'revocation': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+            }
+            with override_settings(CACHES=caches, TOKEN_REVOCATION_CACHE='revocation'):
+                revoked, active = RefreshToken.for_user(self.user), RefreshToken.for_user(self.user)
+                self.log_out(revoked)
+                revoked_tokens.load()
+
+                with self.assertNumQueries(0):
+                    self.assertTrue(revoked_tokens.is_revoked(revoked['jti']))
+                    self.assertFalse(revoked_tokens.is_revoked(active['jti']))
+                self.assert_refresh_rejected(revoked)
+
+
+class TokenBlacklistPrunerTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='client@example.com', user_type='client')
+
+    def create_token(self, expired_for, blacklisted=False):
+        token = OutstandingToken.objects.create(
+            user=self.user, jti=f'jti-{OutstandingToken.objects.count()}', token='token',
+            expires_at=timezone.now() - expired_for,
+        )
+        if blacklisted:
+            BlacklistedToken.objects.create(token=token)
+        return token
+
+    def test_only_tokens_expired_past_the_grace_are_deleted(self):
+        old = self.create_token(timedelta(hours=3), blacklisted=True)
+        recent = self.create_token(timedelta(minutes=30), blacklisted=True)
+        live = self.create_token(-timedelta(hours=1), blacklisted=True)
+
+        report = TokenBlacklistPruner(grace=timedelta(hours=1)).run()
+
+        self.assertEqual((report.outstanding, report.blacklisted), (1, 1))
+        self.assertEqual(set(OutstandingToken.objects.values_list('id', flat=True)), {recent.id, live.id})
+        self.assertFalse(BlacklistedToken.objects.filter(token_id=old.id).exists())
+
+    def test_limit_stops_after_that_many_tokens(self):
+        tokens = [self.create_token(timedelta(hours=1)) for _ in range(3)]
+
+        report = TokenBlacklistPruner(chunk_size=1, grace=timedelta(0)).run(limit=2)
+
+        self.assertEqual(report.outstanding, 2)
+        self.assertEqual(list(OutstandingToken.objects.values_list('id', flat=True)), [tokens[2].id])
+
+    @override_settings(TOKEN_PRUNE_GRACE=0)
+    def test_task_returns_the_report(self):
+        self.create_token(timedelta(hours=1), blacklisted=True)
+        self.create_token(-timedelta(hours=1))
+
+        result = prune_token_blacklist()
+
+        self.assertEqual((result['outstanding'], result['blacklisted']), (1, 1))
+        self.assertEqual(OutstandingToken.objects.count(), 1)
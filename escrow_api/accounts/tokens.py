@@ -0,0 +1,192 @@
+"""
+Refresh token revocation checks and blacklist pruning.
+
+simplejwt checks every refresh token against BlacklistedToken with a query,
+and neither OutstandingToken nor BlacklistedToken rows are ever removed.
+Here revoked JTIs are mirrored into the TOKEN_REVOCATION_CACHE Django cache
+until their token expires, so the check is a cache read, and expired rows
+are deleted in chunks by TokenBlacklistPruner.
+"""
+import logging
+import time
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+logger = logging.getLogger(__name__)
+
+
+class RevokedTokenCache:
+    """
+    Revoked refresh token JTIs, each cached until its token expires.
+
+    The set is only authoritative once it has been loaded from the blacklist,
+    which is marked by a sentinel key living TOKEN_REVOCATION_WARM_TTL
+    seconds. Until then, and whenever the sentinel has been evicted, misses
+    fall back to the database and the set is reloaded. New revocations are
+    added by a post_save receiver on BlacklistedToken (accounts/signals.py).
+
+    A process-local cache (LocMemCache) cannot see revocations made by other
+    processes, so with one only hits are trusted and every miss is checked
+    against the database.
+    """
+
+    SENTINEL_KEY = 'revoked-jti:loaded'
+    LOADING_KEY = 'revoked-jti:loading'
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'TOKEN_REVOCATION_CACHE', 'default')]
+
+    @property
+    def warm_ttl(self):
+        return getattr(settings, 'TOKEN_REVOCATION_WARM_TTL', 60 * 60)
+
+    @staticmethod
+    def _key(jti):
+        return f'revoked-jti:{jti}'
+
+    def add(self, jti, expires_at):
+        remaining = (expires_at - timezone.now()).total_seconds()
+        if remaining <= 0:
+            return
+        try:
+            self.cache.set(self._key(jti), 1, int(remaining) + 1)
+        except Exception as e:
+            logger.error(f"Revoked token cache write failed: {str(e)}")
+
+    def is_revoked(self, jti):
+        """
+        Returns:
+            True if the token with this JTI is blacklisted
+        """
+        cache = self.cache
+        try:
+            found = cache.get_many([self.SENTINEL_KEY, self._key(jti)])
+        except Exception as e:
+            logger.error(f"Revoked token cache lookup failed: {str(e)}")
+            return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+        if self._key(jti) in found:
+            return True
+        if self.SENTINEL_KEY in found and not isinstance(cache, LocMemCache):
+            return False
+
+        revoked = BlacklistedToken.objects.filter(token__jti=jti).exists()
+        # One request reloads the set; the others keep falling back meanwhile.
+        if self.SENTINEL_KEY not in found and cache.add(self.LOADING_KEY, 1, 60):
+            try:
+                self.load()
+            finally:
+                cache.delete(self.LOADING_KEY)
+        return revoked
+
+    def load(self, chunk_size=1000):
+        """
+        Copy every unexpired blacklisted JTI into the cache, then mark the set as loaded.
+
+        Returns:
+            Number of JTIs loaded
+        """
+        lifetime = int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()) + 1
+        queryset = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now()).order_by('id')
+        loaded = 0
+        last_id = 0
+        try:
+            while True:
+                chunk = list(queryset.filter(id__gt=last_id).values_list('id', 'token__jti')[:chunk_size])
+                if not chunk:
+                    break
+                # Entries may outlive their token by up to one lifetime; an expired token fails its exp check anyway.
+                self.cache.set_many({self._key(jti): 1 for _, jti in chunk}, lifetime)
+                loaded += len(chunk)
+                last_id = chunk[-1][0]
+            self.cache.set(self.SENTINEL_KEY, 1, self.warm_ttl)
+        except Exception as e:
+            logger.error(f"Revoked token cache load failed: {str(e)}")
+        return loaded
+
+
+revoked_tokens = RevokedTokenCache()
+
+
+class CachedBlacklistRefreshToken(RefreshToken):
+    """
+    RefreshToken whose blacklist check is served by revoked_tokens.
+    """
+
+    def check_blacklist(self):
+        if revoked_tokens.is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+
+@dataclass
+class TokenPruneReport:
+    outstanding: int = 0
+    blacklisted: int = 0
+    elapsed: float = 0.0
+
+    def as_dict(self):
+        data = asdict(self)
+        data['elapsed'] = round(self.elapsed, 3)
+        return data
+
+
+class TokenBlacklistPruner:
+    """
+    Deletes expired OutstandingToken rows, and with them (by cascade) their
+    BlacklistedToken rows, in id-ordered chunks of one short transaction each.
+
+    Expired tokens are rejected on their exp claim alone, so their rows no
+    longer serve any check. Tokens are issued with a fixed lifetime, so the
+    expired rows are the oldest ids, which the id-ordered chunk queries reach first.
+
+    Args:
+        chunk_size: Tokens deleted per transaction
+        grace: Keep tokens for this long after they expire
+    """
+
+    def __init__(self, *, chunk_size=None, grace=None):
+        self.chunk_size = chunk_size or getattr(settings, 'TOKEN_PRUNE_CHUNK_SIZE', 1000)
+        if grace is None:
+            grace = timedelta(seconds=getattr(settings, 'TOKEN_PRUNE_GRACE', 0))
+        self.grace = grace
+
+    def expired_queryset(self):
+        return OutstandingToken.objects.filter(expires_at__lt=timezone.now() - self.grace)
+
+    def run(self, limit=None):
+        """
+        Returns:
+            TokenPruneReport
+        """
+        report = TokenPruneReport()
+        started = time.perf_counter()
+        queryset = self.expired_queryset().order_by('id')
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+            # Deleted rows drop out of the queryset, so every chunk starts from the front.
+            ids = list(queryset.values_list('id', flat=True)[:size])
+            if not ids:
+                break
+            with transaction.atomic():
+                report.blacklisted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+                report.outstanding += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+            if remaining is not None:
+                remaining -= len(ids)
+
+        report.elapsed = time.perf_counter() - started
+        if report.outstanding:
+            logger.info(f"Token blacklist prune finished: {report.as_dict()}")
+        return report
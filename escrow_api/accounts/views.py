@@ -1,5 +1,5 @@
 from django.shortcuts import render
-from rest_framework_simplejwt import views as jwt_views, tokens, authentication
+from rest_framework_simplejwt import views as jwt_views, tokens
 from rest_framework import views as drf_Views, generics, permissions, status
 from django.db import transaction
 from rest_framework.response import Response
@@ -11,6 +11,8 @@ from drf_yasg import openapi
 
 
 from . import serializers as my_serializers
+from .authentication import CachedJWTAuthentication
+from .tokens import CachedBlacklistRefreshToken
 from .utils import send_reset_email, generate_password_reset_link, send_reactivation_email, generate_reactivation_link
 from . import models as my_models, throttles
 from .pagination import UserListPagination
@@ -69,7 +71,7 @@ class UserProfileRetrieveUpdateAPIView(generics.RetrieveUpdateAPIView):
     The 'id', 'email', and 'user_type' fields are read-only.
     """
     serializer_class = my_serializers.UserProfileSerializer
-    authentication_classes = [authentication.JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     @swagger_auto_schema(operation_summary="Retrieve user profile")
@@ -99,7 +101,7 @@ class ChangePasswordAPIView(drf_Views.APIView):
     Validates the current password and ensures new passwords match before updating.
     """
     serializer_class = my_serializers.ChangePasswordSerializer
-    authentication_classes = [authentication.JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     @swagger_auto_schema(
@@ -153,7 +155,7 @@ class LogoutAPIView(drf_Views.APIView):
             return Response({'detail': 'X-Refresh-Token header is required.'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            token = tokens.RefreshToken(refresh_token)
+            token = CachedBlacklistRefreshToken(refresh_token)
             token.blacklist()
         except tokens.TokenError:
             return Response({'detail': 'Invalid token.'}, status=status.HTTP_400_BAD_REQUEST)
@@ -279,7 +281,7 @@ class UserDeleteAPIView(generics.UpdateAPIView):
     """
     serializer_class = my_serializers.UserDeleteSerializer
     permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [authentication.JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     http_method_names = ['patch']
 
     def get_object(self):
@@ -307,7 +309,7 @@ class UserDeleteAPIView(generics.UpdateAPIView):
         refresh_token = request.headers.get('X-Refresh-Token')
         if refresh_token:
             try:
-                token = tokens.RefreshToken(refresh_token)
+                token = CachedBlacklistRefreshToken(refresh_token)
                 token.blacklist()
             except tokens.TokenError:
                 pass 
@@ -35,6 +35,12 @@ class Dispute(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Moderator queue: filter by status, most recently updated first.
+            models.Index(fields=['status', '-updated_at'], name='dispute_status_updated_idx'),
+        ]
+
     def __str__(self):
         return f"Dispute for {self.project.title} by {self.raised_by}"
 
@@ -1,4 +1,6 @@
 from rest_framework.permissions import BasePermission
+
+from accounts.roles import request_role
 from .models import Dispute
 
 class IsModerator(BasePermission):
@@ -8,7 +10,7 @@ class IsModerator(BasePermission):
     def has_permission(self, request, view):
         if not request.user.is_authenticated:
             return False
-        return request.user.groups.filter(name='Moderators').exists()
+        return bool(request_role(request, 'is_moderator'))
 
 
 class IsDisputeParticipantOrModerator(BasePermission):
@@ -21,7 +23,7 @@ class IsDisputeParticipantOrModerator(BasePermission):
         project = obj.project
         
         is_participant = (user == project.client or user == project.freelancer)
-        is_moderator = user.groups.filter(name='Moderators').exists()
+        is_moderator = bool(request_role(request, 'is_moderator'))
         
         return is_participant or is_moderator
 
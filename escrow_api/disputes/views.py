@@ -1,6 +1,7 @@
 from rest_framework import generics, permissions, status, filters
 from rest_framework.response import Response
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from accounts.authentication import CachedJWTAuthentication
+from accounts.roles import request_role
 from django.shortcuts import get_object_or_404
 from django.db.models import Q
 from django.core.exceptions import PermissionDenied
@@ -25,7 +26,7 @@ class CreateDisputeAPIView(generics.CreateAPIView):
     """
     serializer_class = my_serializers.DisputeCreateSerializer
     permission_classes = [permissions.IsAuthenticated, IsClientOrAssignedFreelancer, IsOwner]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
 
     def get_serializer_context(self):
         """
@@ -69,7 +70,7 @@ class ListDisputesAPIView(generics.ListAPIView):
     """
     serializer_class = my_serializers.DisputeDetailSerializer
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     filter_backends = [filters.OrderingFilter, DjangoFilterBackend]
     filterset_fields = ['status', 'dispute_type']
     ordering_fields = ['created_at', 'updated_at']
@@ -104,7 +105,7 @@ class ListDisputesAPIView(generics.ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        if user.is_staff or user.groups.filter(name='Moderators').exists():
+        if request_role(self.request, 'is_staff') or request_role(self.request, 'is_moderator'):
             return Dispute.objects.all()
         
         return Dispute.objects.filter(
@@ -119,7 +120,7 @@ class RetrieveDisputeAPIView(generics.RetrieveAPIView):
     """
     serializer_class = my_serializers.DisputeDetailSerializer
     permission_classes = [IsAuthenticated, IsDisputeParticipantOrModerator]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     queryset = Dispute.objects.select_related('project', 'raised_by', 'resolved_by')
     lookup_field = 'id'
 
@@ -137,7 +138,7 @@ class ModeratorUpdateDisputeAPIView(generics.UpdateAPIView):
     """
     serializer_class = my_serializers.ModeratorDisputeUpdateSerializer
     permission_classes = [permissions.IsAuthenticated, IsModerator]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     queryset = Dispute.objects.all()
     lookup_field = 'id'
 
@@ -174,7 +175,7 @@ class UpdateDeleteDisputeAPIView(generics.UpdateDestroyAPIView):
     """
     serializer_class = my_serializers.UpdateDisputeSerializer
     permission_classes = [IsAuthenticated, IsDisputeOwner]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     queryset = Dispute.objects.all()
     lookup_field = 'id'
 
@@ -1,3 +1,16 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import LedgerEntry
+
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'escrow', 'posting_id', 'entry_type', 'account', 'direction', 'amount', 'created_at')
+    list_filter = ('entry_type', 'account', 'direction')
+    search_fields = ('posting_id',)
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
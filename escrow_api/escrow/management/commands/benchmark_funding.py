@@ -0,0 +1,151 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from escrow.management.commands.benchmark_lifecycle import percentile
+from escrow.management.testdb import threaded_test_database
+from escrow.services import EscrowService
+from user_projects.models import UserProject
+
+User = get_user_model()
+
+MODES = ('two-phase', 'single-transaction')
+
+
+class TransactionMeter:
+    """
+    Measures how long each database transaction stays open, from its first
+    statement to its commit, and how many are open at once.
+
+    Installed per thread with connection.execute_wrapper().
+    """
+
+    def __init__(self):
+        self.holds = []
+        self.open = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __call__(self, execute, sql, params, many, context):
+        conn = context['connection']
+        if conn.in_atomic_block and getattr(self._local, 'started', None) is None:
+            self._local.started = time.perf_counter()
+            with self._lock:
+                self.open += 1
+                self.peak = max(self.peak, self.open)
+            conn.on_commit(self.close)
+        return execute(sql, params, many, context)
+
+    def close(self):
+        started = getattr(self._local, 'started', None)
+        if started is None:
+            return
+        self._local.started = None
+        with self._lock:
+            self.open -= 1
+            self.holds.append(time.perf_counter() - started)
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs concurrent escrow funding initiations against a slow fake provider and reports how long "
+        "database transactions stay open, comparing the two-phase flow with one transaction around the provider call."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Funding initiations per mode')
+        parser.add_argument('--workers', type=int, default=16, help='Concurrent request threads')
+        parser.add_argument('--provider-latency-ms', type=float, default=100.0, help='Fixed fake provider latency per call')
+        parser.add_argument('--mode', choices=MODES + ('both',), default='both')
+        parser.add_argument('--output', type=str, help='Write the results as JSON')
+
+    def handle(self, *args, **options):
+        modes = MODES if options['mode'] == 'both' else (options['mode'],)
+        results = {}
+        with threaded_test_database(), override_settings(
+            PAYMENT_FAKE_PROVIDER_ENABLED=True,
+            PAYMENT_FAKE_PROVIDER={'latency': options['provider_latency_ms']},
+        ):
+            for mode in modes:
+                projects = self.seed(mode, options['requests'])
+                results[mode] = self.run_mode(mode, projects, options['workers'])
+
+        self.stdout.write(f"{'mode':<20}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'txn p50':>10}{'txn p95':>10}{'txn max':>10}{'open avg':>10}{'open max':>10}{'errors':>8}")
+        for mode, stats in results.items():
+            self.stdout.write(
+                f"{mode:<20}{stats['requests_per_sec']:>9}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+                f"{stats['txn_p50_ms']:>10}{stats['txn_p95_ms']:>10}{stats['txn_max_ms']:>10}"
+                f"{stats['open_transactions_avg']:>10}{stats['open_transactions_max']:>10}{stats['errors']:>8}"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        if any(stats['errors'] for stats in results.values()):
+            raise CommandError("Some funding initiations failed")
+
+    def seed(self, mode, count):
+        client = User.objects.create(email=f'funding-{mode}@example.com', password=make_password('benchmark'), user_type='client')
+        UserProject.objects.bulk_create([
+            UserProject(client=client, title=f'{mode} project {i}', description='Funding benchmark', amount=Decimal('250.00'))
+            for i in range(count)
+        ])
+        return list(UserProject.objects.filter(client=client).select_related('client').order_by('id'))
+
+    def run_mode(self, mode, projects, workers):
+        service = EscrowService()
+        meter = TransactionMeter()
+        latencies = []
+        errors = []
+
+        def initiate(project):
+            with connection.execute_wrapper(meter):
+                started = time.perf_counter()
+                if mode == 'single-transaction':
+                    # The pre-two-phase shape: everything, provider call included, in one transaction.
+                    with transaction.atomic():
+                        result = service.initiate_funding(user=project.client, project=project, amount=project.amount, provider_name='fake')
+                else:
+                    result = service.initiate_funding(user=project.client, project=project, amount=project.amount, provider_name='fake')
+                meter.close()  # no-op after a commit; closes the measurement if the transaction rolled back
+                latencies.append(time.perf_counter() - started)
+                if result.get('status') != 'success':
+                    errors.append(result.get('message'))
+
+        def initiate_in_thread(project):
+            try:
+                initiate(project)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='funding-bench') as executor:
+            list(executor.map(initiate_in_thread, projects))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        holds = sorted(meter.holds)
+        return {
+            'requests': len(projects),
+            'errors': len(errors),
+            'elapsed_sec': round(elapsed, 3),
+            'requests_per_sec': round(len(projects) / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'transactions': len(holds),
+            'txn_p50_ms': round(percentile(holds, 50) * 1000, 2),
+            'txn_p95_ms': round(percentile(holds, 95) * 1000, 2),
+            'txn_max_ms': round(holds[-1] * 1000, 2) if holds else 0.0,
+            # Total open-transaction time over wall time: the connections a pool must keep busy on average.
+            'open_transactions_avg': round(sum(holds) / elapsed, 2) if elapsed else 0.0,
+            'open_transactions_max': meter.peak,
+        }
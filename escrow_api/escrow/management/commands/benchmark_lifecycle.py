@@ -0,0 +1,295 @@
+import json
+import platform
+import subprocess
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from escrow import ledger
+from escrow.models import EscrowTransaction
+from payments.models import Payment
+from payments.outbox import PayoutDispatcher
+from payments.webhooks import WebhookInboxProcessor
+from user_projects.models import Milestone, UserProject
+
+User = get_user_model()
+
+STEPS = (
+    'create_project',
+    'submit_proposal',
+    'list_proposals',
+    'accept_proposal',
+    'create_milestone',
+    'submit_milestone',
+    'approve_milestone',
+    'fund',
+    'verify',
+    'release',
+    'dispatch',
+    'webhook',
+    'webhook_process',
+)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class StepRecorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def measure(self, step, func, expected_status=None):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+        self.latencies[step].append(elapsed)
+        self.queries[step].append(len(queries))
+        if expected_status is not None and getattr(result, 'status_code', None) not in expected_status:
+            self.errors[step] += 1
+            raise CommandError(f"{step} returned {result.status_code}: {getattr(result, 'data', '')}")
+        return result
+
+    def summary(self):
+        steps = {}
+        for step in STEPS:
+            latencies = sorted(self.latencies[step])
+            if not latencies:
+                continue
+            total = sum(latencies)
+            queries = self.queries[step]
+            steps[step] = {
+                'count': len(latencies),
+                'errors': self.errors[step],
+                'requests_per_sec': round(len(latencies) / total, 2) if total else 0.0,
+                'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+                'queries_avg': round(sum(queries) / len(queries), 2),
+                'queries_max': max(queries),
+            }
+        return steps
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the escrow lifecycle (project -> proposal -> milestone -> fund -> verify -> release -> dispatch -> webhook) "
+        "through the real API views against a seeded test database and the fake payment provider."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Number of full lifecycles to run')
+        parser.add_argument('--users', type=int, default=10, help='Clients and freelancers to rotate through')
+        parser.add_argument('--seed-projects', type=int, default=1000, help='Funded background projects created before measuring')
+        parser.add_argument('--provider-latency-ms', type=float, default=0.0, help='Fixed fake provider latency per call')
+        parser.add_argument('--warmup', type=int, default=3, help='Lifecycles run before measuring')
+        parser.add_argument('--output', type=str, default='benchmark-lifecycle.json', help='Where to write the JSON results')
+        parser.add_argument('--compare', type=str, help='Previous results file to compare against')
+        parser.add_argument('--max-regression', type=float, default=20.0, help='Allowed p95 regression in percent when comparing')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=['testserver'],
+                EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                PAYMENT_FAKE_PROVIDER_ENABLED=True,
+                PAYMENT_FAKE_PROVIDER={'latency': options['provider_latency_ms']},
+            ):
+                results = self.run_benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        with open(options['output'], 'w') as fh:
+            json.dump(results, fh, indent=2)
+        self.print_summary(results)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+        if options['compare']:
+            self.compare(results, options['compare'], options['max_regression'])
+
+    def run_benchmark(self, options):
+        clients, freelancers = self.seed(options['users'], options['seed_projects'])
+        tokens = {user.id: str(RefreshToken.for_user(user).access_token) for user in clients + freelancers}
+
+        for index in range(options['warmup']):
+            self.lifecycle(StepRecorder(), clients[index % len(clients)], freelancers[index % len(freelancers)], tokens)
+
+        recorder = StepRecorder()
+        started = time.perf_counter()
+        for index in range(options['iterations']):
+            self.lifecycle(recorder, clients[index % len(clients)], freelancers[index % len(freelancers)], tokens)
+        elapsed = time.perf_counter() - started
+
+        return {
+            'meta': {
+                'commit': self.git_commit(),
+                'timestamp': datetime.now(dt_timezone.utc).isoformat(),
+                'iterations': options['iterations'],
+                'seed_projects': options['seed_projects'],
+                'provider_latency_ms': options['provider_latency_ms'],
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'lifecycle': {
+                'total_sec': round(elapsed, 3),
+                'lifecycles_per_sec': round(options['iterations'] / elapsed, 2) if elapsed else 0.0,
+            },
+            'steps': recorder.summary(),
+        }
+
+    def seed(self, user_count, project_count):
+        # Rows are re-read after each bulk_create since not every backend returns primary keys.
+        password = make_password('benchmark')
+        User.objects.bulk_create([
+            User(email=f'bench-{user_type}-{i}@example.com', password=password, user_type=user_type, first_name=user_type.title(), last_name=str(i))
+            for user_type in ('client', 'freelancer')
+            for i in range(user_count)
+        ])
+        clients = list(User.objects.filter(user_type='client').order_by('id'))
+        freelancers = list(User.objects.filter(user_type='freelancer').order_by('id'))
+
+        UserProject.objects.bulk_create([
+            UserProject(
+                client=clients[i % user_count],
+                freelancer=freelancers[i % user_count],
+                title=f'Seed project {i}',
+                description='Seeded for benchmarking',
+                amount=Decimal('500.00'),
+                status='active',
+            )
+            for i in range(project_count)
+        ])
+        EscrowTransaction.objects.bulk_create([
+            EscrowTransaction(project=project, status='funded')
+            for project in UserProject.objects.all()
+        ])
+        Payment.objects.bulk_create([
+            Payment(
+                escrow=escrow,
+                user_id=escrow.project.client_id,
+                amount=escrow.project.amount,
+                provider_transactionn_id=f'seed-fund-{escrow.id}',
+                transaction_type='funding',
+                provider='fake',
+                status='completed',
+            )
+            for escrow in EscrowTransaction.objects.select_related('project')
+        ])
+        ledger.post_many([
+            (payment.escrow_id, 'funding', payment.amount, payment)
+            for payment in Payment.objects.filter(transaction_type='funding')
+        ])
+        return clients, freelancers
+
+    def lifecycle(self, recorder, client_user, freelancer_user, tokens):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens[client_user.id]}')
+        freelancer = APIClient()
+        freelancer.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens[freelancer_user.id]}')
+        ok = (200, 201)
+
+        recorder.measure('create_project', lambda: client.post('/projects/client/create/', {
+            'title': 'Benchmark project', 'description': 'Lifecycle benchmark', 'amount': '300.00',
+        }, format='json'), ok)
+        project_id = UserProject.objects.filter(client=client_user).latest('id').id
+
+        recorder.measure('submit_proposal', lambda: freelancer.post(f'/projects/freelancer/projects/{project_id}/proposal/create/', {
+            'cover_letter': 'Benchmark proposal', 'bid_amount': '300.00', 'estimated_delivery_days': 7,
+        }, format='json'), ok)
+
+        proposals = recorder.measure('list_proposals', lambda: client.get(f'/projects/client/projects/{project_id}/proposals/'), ok)
+        proposal_id = proposals.data[0]['id'] if isinstance(proposals.data, list) else proposals.data['results'][0]['id']
+
+        recorder.measure('accept_proposal', lambda: client.post(f'/projects/client/proposals/{proposal_id}/accept/'), ok)
+
+        recorder.measure('create_milestone', lambda: client.post(f'/projects/client/projects/{project_id}/milestone/create/', {
+            'title': 'Benchmark milestone', 'description': 'Deliverable', 'amount': '300.00',
+        }, format='json'), ok)
+        milestone_id = Milestone.objects.filter(project_id=project_id).latest('id').id
+
+        recorder.measure('submit_milestone', lambda: freelancer.patch(
+            f'/projects/freelancer/projects/{project_id}/milestones/{milestone_id}/submit/', {}, format='json'), ok)
+        recorder.measure('approve_milestone', lambda: client.patch(
+            f'/projects/client/projects/{project_id}/milestones/{milestone_id}/approve/', {}, format='json'), ok)
+
+        funding = recorder.measure('fund', lambda: client.post('/payments/funding/initiate/', {
+            'project_id': project_id, 'amount': '300.00', 'provider_name': 'fake',
+        }, format='json'), ok)
+        tx_ref, escrow_id = funding.data['tx_ref'], funding.data['escrow_id']
+
+        recorder.measure('verify', lambda: client.post('/payments/funding/verify/', {'tx_ref': tx_ref}, format='json'), ok)
+
+        release = recorder.measure('release', lambda: client.post(f'/escrows/{escrow_id}/release/', {'amount': '300.00'}, format='json'), ok)
+        reference = release.data['transfer_reference']
+
+        dispatched = recorder.measure('dispatch', PayoutDispatcher(workers=1).process_batch)
+        if dispatched['sent'] != 1:
+            recorder.errors['dispatch'] += 1
+
+        recorder.measure('webhook', lambda: APIClient().post('/payments/webhooks/fake/', {
+            'id': f'evt-{reference}', 'type': 'transfer.success', 'reference': reference, 'status': 'success',
+        }, format='json'), ok)
+
+        processor = WebhookInboxProcessor(workers=1)
+        recorder.measure('webhook_process', processor.process_batch)
+        if not EscrowTransaction.objects.filter(id=escrow_id, status='released').exists():
+            recorder.errors['webhook_process'] += 1
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def print_summary(self, results):
+        self.stdout.write(f"{'step':<18}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'errors':>8}")
+        for step, stats in results['steps'].items():
+            self.stdout.write(
+                f"{step:<18}{stats['requests_per_sec']:>10}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+                f"{stats['p99_ms']:>10}{stats['queries_avg']:>9}{stats['errors']:>8}"
+            )
+        self.stdout.write(f"Lifecycles/sec: {results['lifecycle']['lifecycles_per_sec']}")
+
+    def compare(self, results, baseline_path, max_regression):
+        with open(baseline_path) as fh:
+            baseline = json.load(fh)
+
+        regressions = []
+        for step, stats in results['steps'].items():
+            before = baseline.get('steps', {}).get(step)
+            if not before:
+                continue
+            if before['p95_ms'] and (stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 > max_regression:
+                regressions.append(f"{step}: p95 {before['p95_ms']}ms -> {stats['p95_ms']}ms")
+            if stats['queries_max'] > before['queries_max']:
+                regressions.append(f"{step}: queries {before['queries_max']} -> {stats['queries_max']}")
+
+        if regressions:
+            for line in regressions:
+                self.stdout.write(self.style.ERROR(line))
+            raise CommandError(f"{len(regressions)} regression(s) against {baseline_path}")
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {baseline_path}"))
@@ -0,0 +1,96 @@
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from disputes.models import Dispute
+from escrow.management.testdb import threaded_test_database
+from payments.models import Payment
+from user_projects.models import Milestone, Proposal, UserProject
+
+# Plan lines that mean a whole table (or a whole index, in SQLite) is read.
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (?!CONSTANT ROW)'),
+    'postgresql': re.compile(r'\bSeq Scan on '),
+}
+
+
+def hot_queries():
+    """
+    The hottest lookups, as issued by escrow/services.py, the webhook inbox,
+    reconciliation and the list views, each expected to be served by an index.
+
+    Returns:
+        List of (label, queryset)
+    """
+    now = timezone.now()
+    payouts = ['release', 'commission', 'refund']
+    unsettled = ['pending', 'active']
+    return [
+        ('verify funding by tx_ref', Payment.objects.filter(provider_transactionn_id='tx', transaction_type='funding')),
+        ('payout webhook by transfer reference', Payment.objects.filter(provider_transactionn_id='tx', transaction_type='release', provider='stripe')),
+        ('failed payment webhook', Payment.objects.filter(provider_transactionn_id='tx', provider='stripe')),
+        ('webhook inbox escrow grouping', Payment.objects.filter(provider_transactionn_id__in=['tx-1', 'tx-2'])),
+        ('pending payout for milestone', Payment.objects.filter(escrow_id=1, transaction_type='release', status__in=unsettled, milestone_id=1)),
+        ('reserved escrow balance', Payment.objects.filter(escrow_id=1, transaction_type__in=payouts, status__in=unsettled)),
+        ('latest completed funding', Payment.objects.filter(escrow_id=1, transaction_type='funding', status='completed').order_by('-timestamp')[:1]),
+        ('escrow payment history page', Payment.objects.filter(escrow_id=1).order_by('-timestamp', '-id')[:50]),
+        ('finance export date range', Payment.objects.filter(timestamp__gte=now - timedelta(days=30), timestamp__lt=now).order_by('timestamp', 'id')),
+        ('stale pending funding (reconciliation)', Payment.objects.filter(transaction_type='funding', status='pending', timestamp__lte=now)),
+        ('unconfirmed payouts (transfer poller)', Payment.objects.filter(transaction_type='release', status__in=unsettled, timestamp__lte=now)),
+        ('stale funding reservations', Payment.objects.filter(transaction_type='funding', status='initiating', timestamp__lte=now)),
+        ('stale pending refunds', Payment.objects.filter(transaction_type='refund', status='pending', timestamp__lte=now)),
+        ('funding refunded against', Payment.objects.filter(escrow_id=1, transaction_type='funding', status='completed', timestamp__lte=now).order_by('-timestamp')[:1]),
+        ('accepted proposal on project', Proposal.objects.filter(project_id=1, status='accepted')),
+        ('duplicate proposal check', Proposal.objects.filter(project_id=1, freelancer_id=1)),
+        ('client proposal list', Proposal.objects.filter(project_id=1, is_withdrawn=False).order_by('-submitted_at')),
+        ('open public projects', UserProject.objects.filter(is_public=True, freelancer__isnull=True)),
+        ('project milestones', Milestone.objects.filter(project_id=1)),
+        ('disputes by status', Dispute.objects.filter(status='open').order_by('-updated_at')),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs EXPLAIN on the hot escrow, payment, proposal, project and dispute lookups against a throwaway "
+        "test database built from the current models, and fails if any of them needs a full table scan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan, not only failing ones')
+
+    def handle(self, *args, **options):
+        with threaded_test_database():
+            pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+            if pattern is None:
+                raise CommandError(f"Query plan checks are not implemented for {connection.vendor}")
+            plans = self.explain_all()
+
+        failures = 0
+        for label, plan in plans:
+            scans = [line for line in plan.splitlines() if pattern.search(line)]
+            if scans:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"FULL SCAN  {label}"))
+            else:
+                self.stdout.write(f"ok         {label}")
+            if scans or options['verbose_plans']:
+                for line in plan.splitlines():
+                    self.stdout.write(f"           {line}")
+
+        if failures:
+            raise CommandError(f"{failures} of {len(plans)} hot queries need a full table scan")
+        self.stdout.write(self.style.SUCCESS(f"All {len(plans)} hot queries use an index"))
+
+    def explain_all(self):
+        plans = []
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Empty test tables make a sequential scan the cheapest plan; we want to know whether an index exists.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for label, queryset in hot_queries():
+                plans.append((label, queryset.explain()))
+        return plans
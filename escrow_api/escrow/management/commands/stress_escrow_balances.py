@@ -0,0 +1,217 @@
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q, Sum
+from django.test.utils import override_settings
+
+from escrow import ledger
+from escrow.management.testdb import threaded_test_database
+from escrow.models import EscrowTransaction
+from escrow.services import EscrowService
+from payments.models import Payment, PayoutOutbox
+from payments.outbox import PayoutDispatcher
+from payments.providers import get_payment_provider
+from user_projects.models import Milestone, UserProject
+
+User = get_user_model()
+
+MILESTONE_AMOUNT = Decimal('100.00')
+REFUND_AMOUNT = Decimal('25.00')
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs concurrent milestone releases, payout dispatches, duplicate payout webhooks and refunds against the same escrows "
+        "in a throwaway test database, then checks every escrow balance against its payments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escrows', type=int, default=50, help='Escrows to contend on')
+        parser.add_argument('--milestones', type=int, default=10, help='Approved milestones released per escrow')
+        parser.add_argument('--refunds', type=int, default=5, help='Refund attempts per escrow')
+        parser.add_argument('--duplicates', type=int, default=3, help='Deliveries of each payout webhook')
+        parser.add_argument('--workers', type=int, default=16, help='Concurrent threads')
+        parser.add_argument('--transfer-failure-rate', type=float, default=0.1, help='Share of payouts the provider reports as failed')
+        parser.add_argument('--provider-latency-ms', type=float, default=0.0, help='Fixed fake provider latency per call')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for operation order and outcomes')
+
+    def handle(self, *args, **options):
+        with threaded_test_database(), override_settings(
+            PAYMENT_FAKE_PROVIDER_ENABLED=True,
+            PAYMENT_FAKE_PROVIDER={
+                'latency': options['provider_latency_ms'],
+                'payment_failure_rate': options['transfer_failure_rate'],
+                'seed': options['seed'],
+            },
+        ):
+            escrow_ids = self.seed(options['escrows'], options['milestones'], options['refunds'])
+            counts, elapsed = self.run_load(escrow_ids, options)
+            problems = self.check_balances(escrow_ids)
+
+        operations = sum(counts.values())
+        self.stdout.write(f"Operations: {operations} in {elapsed:.2f}s ({operations / elapsed if elapsed else 0:.1f} ops/sec)")
+        for key in sorted(counts):
+            self.stdout.write(f"  {key:<24}{counts[key]:>8}")
+
+        if problems:
+            for line in problems[:50]:
+                self.stdout.write(self.style.ERROR(line))
+            raise CommandError(f"{len(problems)} escrow invariant violation(s)")
+        self.stdout.write(self.style.SUCCESS(f"All {len(escrow_ids)} escrow balances reconcile with their payments"))
+
+    def seed(self, escrow_count, milestone_count, refund_count):
+        password = make_password('stress')
+        client = User.objects.create(email='stress-client@example.com', password=password, user_type='client')
+        freelancer = User.objects.create(email='stress-freelancer@example.com', password=password, user_type='freelancer')
+
+        # Funded for every milestone plus only half the refund attempts, so some refunds must be rejected.
+        funded = MILESTONE_AMOUNT * milestone_count + REFUND_AMOUNT * (refund_count // 2)
+        UserProject.objects.bulk_create([
+            UserProject(client=client, freelancer=freelancer, title=f'Stress project {i}', description='Stress test', amount=funded, status='active')
+            for i in range(escrow_count)
+        ])
+        projects = list(UserProject.objects.order_by('id'))
+        EscrowTransaction.objects.bulk_create([
+            EscrowTransaction(project=project, status='funded')
+            for project in projects
+        ])
+        Milestone.objects.bulk_create([
+            Milestone(project=project, title=f'Milestone {i}', description='Stress test', amount=MILESTONE_AMOUNT, status='approved')
+            for project in projects
+            for i in range(milestone_count)
+        ])
+        escrows = list(EscrowTransaction.objects.order_by('id'))
+        Payment.objects.bulk_create([
+            Payment(
+                escrow=escrow,
+                user=client,
+                amount=funded,
+                provider_transactionn_id=f'stress-fund-{escrow.id}',
+                transaction_type='funding',
+                provider='fake',
+                status='completed',
+            )
+            for escrow in escrows
+        ])
+        ledger.post_many([
+            (payment.escrow_id, 'funding', payment.amount, payment)
+            for payment in Payment.objects.filter(transaction_type='funding')
+        ])
+        return [escrow.id for escrow in escrows]
+
+    def run_load(self, escrow_ids, options):
+        service = EscrowService()
+        dispatcher = PayoutDispatcher(workers=1, escrow_service=service)
+        provider = get_payment_provider('fake')
+        rng = random.Random(options['seed'])
+        counts = Counter()
+        counts_lock = threading.Lock()
+
+        def count(key):
+            with counts_lock:
+                counts[key] += 1
+
+        def release(milestone_id):
+            milestone = Milestone.objects.get(id=milestone_id)
+            escrow = EscrowTransaction.objects.select_related('project__client', 'project__freelancer').get(project_id=milestone.project_id)
+            result = service.release_funds(escrow, milestone=milestone)
+            if result.get('status') != 'pending':
+                count('release_rejected')
+                return []
+            count('release_initiated')
+            return [(dispatch, result['transfer_reference'])]
+
+        def dispatch(reference):
+            outbox = PayoutOutbox.objects.get(idempotency_key=reference)
+            if dispatcher.process_batch(ids=[outbox.id])['sent'] != 1:
+                count('dispatch_failed')
+                return []
+            success = provider.get_transfer_status(reference)['status'] == 'success'
+            return [(confirm, reference, success)] * options['duplicates']
+
+        def confirm(reference, success):
+            result = service.verify_transfer_to_freelancer(provider_name='fake', transfer_reference=reference, success=success)
+            if not success:
+                count('payout_failed')
+            elif result.get('message') == 'Payout already processed':
+                count('webhook_duplicate')
+            elif result.get('status') == 'success':
+                count('payout_confirmed')
+            else:
+                count('payout_error')
+            return []
+
+        def refund(escrow_id):
+            escrow = EscrowTransaction.objects.select_related('project__client').get(id=escrow_id)
+            result = service.refund(user=escrow.project.client, escrow=escrow, amount=REFUND_AMOUNT)
+            count('refund_completed' if result.get('status') == 'success' else 'refund_rejected')
+            return []
+
+        jobs = [(release, milestone_id) for milestone_id in Milestone.objects.values_list('id', flat=True)]
+        jobs += [(refund, escrow_id) for escrow_id in escrow_ids for _ in range(options['refunds'])]
+        rng.shuffle(jobs)
+
+        workers = options['workers']
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='escrow-stress') as executor:
+            pending = {executor.submit(func, *args) for func, *args in jobs}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        follow_ups = future.result()
+                    except Exception as e:
+                        count('exception')
+                        self.stderr.write(f"Operation raised: {e}")
+                        continue
+                    pending |= {executor.submit(func, *args) for func, *args in follow_ups}
+            elapsed = time.perf_counter() - started
+
+            # One close per worker thread, so no connection outlives the test database.
+            barrier = threading.Barrier(workers)
+            for _ in range(workers):
+                executor.submit(lambda: (barrier.wait(), connection.close()))
+        return counts, elapsed
+
+    def check_balances(self, escrow_ids):
+        problems = []
+        for escrow in EscrowTransaction.objects.filter(id__in=escrow_ids):
+            totals = Payment.objects.filter(escrow=escrow).aggregate(
+                paid_out=Sum('amount', filter=Q(transaction_type__in=['release', 'commission'], status='completed')),
+                refunded=Sum('amount', filter=Q(transaction_type='refund', status='completed')),
+                in_flight=Sum('amount', filter=~Q(transaction_type='funding') & Q(status__in=['pending', 'active'])),
+            )
+            expected = escrow.funded_amount - (totals['paid_out'] or 0) - (totals['refunded'] or 0)
+            if escrow.current_balance != expected:
+                problems.append(f"Escrow {escrow.id}: balance {escrow.current_balance}, payments imply {expected}")
+            if escrow.current_balance < 0:
+                problems.append(f"Escrow {escrow.id}: negative balance {escrow.current_balance}")
+            if totals['in_flight']:
+                problems.append(f"Escrow {escrow.id}: {totals['in_flight']} still reserved after all webhooks were delivered")
+
+        paid_twice = (
+            Payment.objects.filter(escrow_id__in=escrow_ids, transaction_type='release', status='completed')
+            .values('milestone_id').annotate(total=Sum('amount')).filter(total__gt=MILESTONE_AMOUNT)
+        )
+        problems += [f"Milestone {row['milestone_id']} paid out more than once" for row in paid_twice]
+
+        paid_milestones = set(
+            Payment.objects.filter(escrow_id__in=escrow_ids, transaction_type='release', status='completed')
+            .values_list('milestone_id', flat=True)
+        )
+        for milestone_id, is_paid in Milestone.objects.filter(project__escrowtransaction__id__in=escrow_ids).values_list('id', 'is_paid'):
+            if is_paid != (milestone_id in paid_milestones):
+                problems.append(f"Milestone {milestone_id}: is_paid={is_paid} disagrees with its release payments")
+
+        replay = ledger.replay(escrow_ids)
+        problems += [f"Escrow {row['escrow_id']}: snapshot {row['snapshot']} != ledger {row['ledger']}" for row in replay.mismatches]
+        problems += [f"Escrow {escrow_id}: posting {posting_id} does not balance" for escrow_id, posting_id in replay.unbalanced_postings]
+        return problems
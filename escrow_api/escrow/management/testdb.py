@@ -0,0 +1,34 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def threaded_test_database():
+    """
+    Create a throwaway test database that worker threads can share, and destroy it on exit.
+
+    SQLite's default in-memory test database cannot take concurrent writers, so on
+    SQLite the test database is a temporary file opened with IMMEDIATE transactions,
+    which makes writers queue on the database lock instead of failing.
+    """
+    settings_dict = connection.settings_dict
+    db_path = None
+    if connection.vendor == 'sqlite':
+        fd, db_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        settings_dict.setdefault('TEST', {})['NAME'] = db_path
+        settings_dict.setdefault('OPTIONS', {}).update({'transaction_mode': 'IMMEDIATE', 'timeout': 60})
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        if db_path and os.path.exists(db_path):
+            os.remove(db_path)
@@ -19,11 +19,84 @@ class EscrowTransaction(models.Model):
     funded_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     current_balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     is_locked = models.BooleanField(default=False)  # Lock during disputes
+    # Commission expected on the funded amount, set when funding completes.
     commission_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Commission actually posted to the ledger by confirmed releases.
+    commission_posted = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending_funding')
 
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(current_balance__gte=0),
+                name='escrow_current_balance_non_negative',
+            ),
+        ]
+
     def __str__(self):
         return f"Escrow for {self.project.title} ({self.funded_amount})"
 
+
+class LedgerEntryQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        raise TypeError("Ledger entries are immutable")
+
+    def delete(self):
+        raise TypeError("Ledger entries are immutable")
+
+
+class LedgerEntry(models.Model):
+    """
+    One side of a balanced posting. Entries are append-only; corrections are new postings.
+    Written only through escrow.ledger, which keeps the EscrowTransaction balance fields in step.
+    """
+    ENTRY_TYPE_CHOICES = (
+        ('funding', 'Funding'),
+        ('release', 'Release'),
+        ('commission', 'Commission'),
+        ('refund', 'Refund'),
+    )
+
+    ACCOUNT_CHOICES = (
+        ('client', 'Client'),
+        ('escrow', 'Escrow'),
+        ('freelancer', 'Freelancer'),
+        ('platform', 'Platform'),
+    )
+
+    DIRECTION_CHOICES = (
+        ('debit', 'Debit'),
+        ('credit', 'Credit'),
+    )
+
+    escrow = models.ForeignKey(EscrowTransaction, on_delete=models.PROTECT, related_name='ledger_entries')
+    posting_id = models.UUIDField(db_index=True)
+    entry_type = models.CharField(max_length=20, choices=ENTRY_TYPE_CHOICES)
+    account = models.CharField(max_length=20, choices=ACCOUNT_CHOICES)
+    direction = models.CharField(max_length=6, choices=DIRECTION_CHOICES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    payment = models.ForeignKey('payments.Payment', on_delete=models.PROTECT, null=True, blank=True, related_name='ledger_entries')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = LedgerEntryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['escrow', 'id'], name='ledger_escrow_id_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(amount__gt=0), name='ledger_amount_positive'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise TypeError("Ledger entries are immutable")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise TypeError("Ledger entries are immutable")
+
+    def __str__(self):
+        return f"{self.direction} {self.account} {self.amount} ({self.entry_type}) for escrow {self.escrow_id}"
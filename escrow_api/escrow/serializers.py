@@ -1,5 +1,7 @@
 from decimal import Decimal
 
+from django.conf import settings
+from django.db.models import Count, Prefetch
 from rest_framework import serializers
 
 from .models import EscrowTransaction
@@ -7,7 +9,7 @@ from payments.models import Payment
 
 
 class PaymentSummarySerializer(serializers.ModelSerializer):
-    milestone_id = serializers.IntegerField(source="milestone.id", read_only=True)
+    milestone_id = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Payment
@@ -31,7 +33,8 @@ class EscrowTransactionSerializer(serializers.ModelSerializer):
     client_email = serializers.EmailField(source="project.client.email", read_only=True)
     freelancer_id = serializers.IntegerField(source="project.freelancer_id", read_only=True)
     freelancer_email = serializers.EmailField(source="project.freelancer.email", read_only=True)
-    payments = PaymentSummarySerializer(many=True, read_only=True)
+    payment_count = serializers.IntegerField(read_only=True)
+    payments = PaymentSummarySerializer(source="recent_payments", many=True, read_only=True)
 
     class Meta:
         model = EscrowTransaction
@@ -46,15 +49,35 @@ class EscrowTransactionSerializer(serializers.ModelSerializer):
             "funded_amount",
             "current_balance",
             "commission_amount",
+            "commission_posted",
             "is_locked",
             "status",
             "created_at",
             "updated_at",
+            "payment_count",
             "payments",
         )
         read_only_fields = fields
 
 
+def with_payment_summary(queryset):
+    """
+    Prepare an escrow queryset for EscrowTransactionSerializer: related users,
+    the total payment count, and only the ESCROW_RECENT_PAYMENTS_LIMIT most
+    recent payments per escrow (one windowed query for the whole page).
+    """
+    limit = getattr(settings, "ESCROW_RECENT_PAYMENTS_LIMIT", 5)
+    recent = Payment.objects.order_by("-timestamp", "-id")[:limit]
+    return queryset.select_related(
+        "project",
+        "project__client",
+        "project__freelancer",
+    ).annotate(
+        payment_count=Count("payments"),
+    ).prefetch_related(
+        Prefetch("payments", queryset=recent, to_attr="recent_payments"),
+    )
+
 
 class EscrowReleaseSerializer(serializers.Serializer):
     amount = serializers.DecimalField(
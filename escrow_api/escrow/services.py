@@ -1,7 +1,11 @@
+from asgiref.sync import sync_to_async
 from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
 from decimal import Decimal
+from . import ledger
 from .models import EscrowTransaction
-from payments.models import Payment
+from payments.models import Payment, PayoutOutbox
 from payments.services import PaymentService
 from disputes.models import Dispute
 import logging
@@ -16,123 +20,344 @@ class EscrowService:
     
     def initiate_funding(self, *, user, project, amount, provider_name=None, **kwargs):
         """
-        Orchestrate escrow funding initiation.
-        - Validates requester (must be project.client)
-        - Delegates payment init to PaymentService
-        NOTE: PaymentService currently creates the escrow; we keep that for now.
+        Orchestrate escrow funding initiation in three phases, so no database
+        transaction or lock is held while the provider is called:
+        - reserve: a short transaction creates (or reuses) the escrow and an
+          'initiating' funding payment whose reference is passed to the provider
+        - provider: PaymentService.init_charge, outside any transaction
+        - commit: a short transaction records the provider reference and moves
+          the payment to 'pending', or cancels the reservation if the provider failed
+        Reservations left 'initiating' by a crash are resolved by expire_funding_reservations().
         """
         if user.id != project.client_id:
             return {"status": "error", "message": "Only the project client can fund the escrow"}
 
         try:
-            with transaction.atomic():
-                commission_amount = amount * Decimal(str(settings.PLATFORM_COMMISSION_RATE))
-
-                escrow = EscrowTransaction.objects.create(
-                    project=project,
-                    funded_amount=amount,
-                    current_balance=amount,
-                    commission_amount=commission_amount,
-                    is_locked=False,
-                )
+            reservation, error = self._reserve_funding(user=user, project=project, amount=amount, provider_name=provider_name)
+            if error:
+                return error
 
+            try:
                 init = self.payment_service.init_charge(
                     user=user,
                     amount=amount,
                     provider_name=provider_name,
                     project_title=getattr(project, 'title', ''),
+                    tx_ref=reservation.provider_transactionn_id,
+                    idempotency_key=reservation.provider_transactionn_id,
                     **kwargs,
                 )
+            except Exception as e:
+                init = {'status': 'error', 'message': str(e)}
 
-                if init.get('status') != 'success':
-                    raise ValueError(init.get('message') or 'Payment initialization failed')
+            return self._commit_funding(reservation, init, amount, provider_name)
+        except Exception as e:
+            logger.error(f"Escrow funding initiation failed: {str(e)}")
+            return {"status": "error", "message": str(e)}
 
-                # Resolve provider transaction id across providers
-                tx_ref = init.get('tx_ref') or init.get('payment_intent_id') or init.get('id')
-                if not tx_ref:
-                    raise ValueError('Missing provider transaction reference')
+    async def ainitiate_funding(self, *, user, project, amount, provider_name=None, **kwargs):
+        """
+        Async counterpart of initiate_funding(), with the same reserve/provider/commit phases.
+        """
+        if user.id != project.client_id:
+            return {"status": "error", "message": "Only the project client can fund the escrow"}
 
-                Payment.objects.create(
-                    escrow=escrow,
+        try:
+            reservation, error = await sync_to_async(self._reserve_funding)(
+                user=user, project=project, amount=amount, provider_name=provider_name
+            )
+            if error:
+                return error
+
+            try:
+                init = await self.payment_service.ainit_charge(
                     user=user,
                     amount=amount,
-                    provider_transactionn_id=tx_ref,
-                    transaction_type='funding',
-                    provider=provider_name or init.get('provider') or '',
-                    status='pending',
+                    provider_name=provider_name,
+                    project_title=getattr(project, 'title', ''),
+                    tx_ref=reservation.provider_transactionn_id,
+                    idempotency_key=reservation.provider_transactionn_id,
+                    **kwargs,
                 )
+            except Exception as e:
+                init = {'status': 'error', 'message': str(e)}
 
-                return {
-                    'status': 'success',
-                    'payment_url': (init.get('data') or {}).get('checkout_url'),
-                    'client_secret': (init.get('data') or {}).get('client_secret'),
-                    'tx_ref': tx_ref,
-                    'escrow_id': escrow.id,
-                    'provider': provider_name or init.get('provider'),
-                    'total_amount': str(amount),
-                    'commission_rate': str(settings.PLATFORM_COMMISSION_RATE),
-                    'commission_amount': str(commission_amount),
-                }
+            return await sync_to_async(self._commit_funding)(reservation, init, amount, provider_name)
         except Exception as e:
             logger.error(f"Escrow funding initiation failed: {str(e)}")
             return {"status": "error", "message": str(e)}
 
+    @staticmethod
+    def _charge_reference(init):
+        """Resolve provider transaction id across providers."""
+        return init.get('tx_ref') or init.get('payment_intent_id') or init.get('id')
+
+    def _reserve_funding(self, *, user, project, amount, provider_name):
+        """
+        Reserve phase: create or reuse the project's escrow and record an 'initiating' funding payment.
+        An escrow is reused only while unfunded and with no other funding attempt outstanding.
+        Returns (payment, None) or (None, error_response).
+        """
+        with transaction.atomic():
+            escrow, created = EscrowTransaction.objects.select_for_update().get_or_create(
+                project=project,
+                defaults={'is_locked': False},
+            )
+            if not created:
+                outstanding = Payment.objects.filter(
+                    escrow=escrow,
+                    transaction_type='funding',
+                    status__in=['initiating', 'pending', 'active', 'completed'],
+                ).exists()
+                if escrow.status != 'pending_funding' or outstanding:
+                    return None, {"status": "error", "message": "An escrow already exists for this project"}
+
+            payment = Payment.objects.create(
+                escrow=escrow,
+                user=user,
+                amount=amount,
+                provider_transactionn_id=f'escrow-fund-{uuid.uuid4().hex[:16]}',
+                transaction_type='funding',
+                provider=provider_name or '',
+                status='initiating',
+            )
+        return payment, None
+
+    def _commit_funding(self, reservation, init, amount, provider_name):
+        """
+        Commit phase: attach the provider's reference to the reserved payment, or cancel it.
+        """
+        if init.get('status') != 'success':
+            Payment.objects.filter(id=reservation.id, status='initiating').update(status='cancelled')
+            raise ValueError(init.get('message') or 'Payment initialization failed')
+
+        tx_ref = self._charge_reference(init) or reservation.provider_transactionn_id
+        with transaction.atomic():
+            committed = Payment.objects.filter(id=reservation.id, status='initiating').update(
+                provider_transactionn_id=tx_ref,
+                provider=provider_name or init.get('provider') or reservation.provider,
+                status='pending',
+            )
+        if not committed:
+            # expire_funding_reservations() gave up on it while the provider call was running.
+            raise ValueError('Funding reservation expired; please retry')
+
+        commission_amount = self._expected_commission(amount)
+        return self._funding_initiated(init, reservation.escrow, amount, commission_amount, provider_name, tx_ref)
+
+    @staticmethod
+    def _expected_commission(amount):
+        """Platform commission on a funding amount, as reported in commission_amount."""
+        return (Decimal(str(amount)) * Decimal(str(settings.PLATFORM_COMMISSION_RATE))).quantize(Decimal('0.01'))
+
+    def expire_funding_reservations(self, older_than):
+        """
+        Compensate reservations stuck in 'initiating' (the process died between phases).
+
+        Each is checked with the provider under its reserved reference first: a
+        charge the provider already settled is completed, anything else is cancelled
+        and the escrow can be funded again.
+
+        Args:
+            older_than: timedelta after which an 'initiating' reservation is abandoned
+
+        Returns:
+            Dict with completed and cancelled counts
+        """
+        cutoff = timezone.now() - older_than
+        stale = Payment.objects.filter(transaction_type='funding', status='initiating', timestamp__lte=cutoff)
+        counts = {'completed': 0, 'cancelled': 0}
+        for payment in stale.iterator():
+            try:
+                verified = bool(payment.provider) and self.payment_service.verify_payment(
+                    provider_name=payment.provider,
+                    provider_transaction_id=payment.provider_transactionn_id,
+                )
+            except Exception as e:
+                logger.error(f"Verifying abandoned funding reservation {payment.id} failed: {str(e)}")
+                verified = False
+
+            if verified:
+                if Payment.objects.filter(id=payment.id, status='initiating').update(status='pending'):
+                    self.complete_funding(payment.id)
+                    counts['completed'] += 1
+            elif Payment.objects.filter(id=payment.id, status='initiating').update(status='cancelled'):
+                counts['cancelled'] += 1
+
+        if counts['completed'] or counts['cancelled']:
+            logger.info(f"Expired funding reservations: {counts}")
+        return counts
+
+    @staticmethod
+    def _funding_initiated(init, escrow, amount, commission_amount, provider_name, tx_ref):
+        return {
+            'status': 'success',
+            'payment_url': (init.get('data') or {}).get('checkout_url'),
+            'client_secret': (init.get('data') or {}).get('client_secret'),
+            'tx_ref': tx_ref,
+            'escrow_id': escrow.id,
+            'provider': provider_name or init.get('provider'),
+            'total_amount': str(amount),
+            'commission_rate': str(settings.PLATFORM_COMMISSION_RATE),
+            'commission_amount': str(commission_amount),
+        }
+
     def verify_funding(self, *, tx_ref: str):
         """Verify provider-side payment and mark escrow as funded."""
         try:
-            with transaction.atomic():
-                payment = Payment.objects.select_related('escrow', 'escrow__project').get(
-                    provider_transactionn_id=tx_ref,
-                    transaction_type='funding',
-                )
-                provider_name = payment.provider
-                verified = self.payment_service.verify_payment(
-                    provider_name=provider_name,
-                    provider_transaction_id=tx_ref,
-                )
-                if not verified:
-                    return {"status": "error", "message": "Payment verification failed"}
+            payment = Payment.objects.get(
+                provider_transactionn_id=tx_ref,
+                transaction_type='funding',
+            )
+            verified = self.payment_service.verify_payment(
+                provider_name=payment.provider,
+                provider_transaction_id=tx_ref,
+            )
+            if not verified:
+                return {"status": "error", "message": "Payment verification failed"}
 
-                escrow = payment.escrow
-                escrow.funded_amount = payment.amount
-                escrow.current_balance = payment.amount
-                escrow.status = 'funded'
-                escrow.save()
+            return self.complete_funding(payment.id)
+        except Payment.DoesNotExist:
+            return {"status": "error", "message": "Funding payment not found"}
+        except Exception as e:
+            logger.error(f"Escrow verify funding failed: {str(e)}")
+            return {"status": "error", "message": str(e)}
 
-                payment.status = 'completed'
-                payment.save()
+    async def averify_funding(self, *, tx_ref: str):
+        """Async counterpart of verify_funding()."""
+        try:
+            payment = await Payment.objects.aget(
+                provider_transactionn_id=tx_ref,
+                transaction_type='funding',
+            )
+            verified = await self.payment_service.averify_payment(
+                provider_name=payment.provider,
+                provider_transaction_id=tx_ref,
+            )
+            if not verified:
+                return {"status": "error", "message": "Payment verification failed"}
 
-                return {
-                    'status': 'success',
-                    'message': 'Escrow funded successfully',
-                    'escrow_id': escrow.id,
-                    'funded_amount': str(escrow.funded_amount),
-                    'available_balance': str(escrow.current_balance),
-                    'commission_amount': str(escrow.commission_amount),
-                }
+            return await sync_to_async(self.complete_funding)(payment.id)
         except Payment.DoesNotExist:
             return {"status": "error", "message": "Funding payment not found"}
         except Exception as e:
             logger.error(f"Escrow verify funding failed: {str(e)}")
             return {"status": "error", "message": str(e)}
 
+    def complete_funding(self, payment_id):
+        """
+        Mark a provider-verified funding payment completed and its escrow funded.
+        """
+        with transaction.atomic():
+            payment = Payment.objects.select_for_update().select_related('escrow').get(id=payment_id)
+
+            escrow = payment.escrow
+            # Redelivered webhooks and reconciliation can both get here; post the funding once.
+            if payment.status != 'completed':
+                ledger.post(escrow.id, 'funding', payment.amount, payment=payment)
+                EscrowTransaction.objects.filter(pk=escrow.pk).update(
+                    status='funded',
+                    commission_amount=F('commission_amount') + self._expected_commission(payment.amount),
+                )
+
+                payment.status = 'completed'
+                payment.save(update_fields=['status'])
+            escrow.refresh_from_db()
+
+        return {
+            'status': 'success',
+            'message': 'Escrow funded successfully',
+            'escrow_id': escrow.id,
+            'funded_amount': str(escrow.funded_amount),
+            'available_balance': str(escrow.current_balance),
+            'commission_amount': str(escrow.commission_amount),
+        }
+
+    def complete_funding_batch(self, payment_ids):
+        """
+        Bulk form of complete_funding() for reconciliation.
+        Applies every still-pending payment in one transaction and returns how many were applied.
+        """
+        with transaction.atomic():
+            payments = list(
+                Payment.objects.select_for_update()
+                .filter(id__in=payment_ids, transaction_type='funding', status='pending')
+            )
+            if not payments:
+                return 0
+
+            ledger.post_many([(payment.escrow_id, 'funding', payment.amount, payment) for payment in payments])
+            funded = {}
+            for payment in payments:
+                funded[payment.escrow_id] = funded.get(payment.escrow_id, Decimal('0')) + payment.amount
+            for escrow_id, amount in funded.items():
+                EscrowTransaction.objects.filter(id=escrow_id).update(
+                    status='funded',
+                    commission_amount=F('commission_amount') + self._expected_commission(amount),
+                )
+            Payment.objects.filter(id__in=[payment.id for payment in payments]).update(status='completed')
+        return len(payments)
+
     def release_funds(self, escrow, amount=None, provider=None, milestone=None):
         """
         Release funds from escrow to freelancer
         Commission is deducted at the time of release.
+        The transfer itself is queued in the payout outbox and sent by payments.outbox.PayoutDispatcher.
         """
         try:
+            plan, error = self._prepare_release(escrow, amount=amount, milestone=milestone)
+            if error:
+                return error
+            return self._release_queued(plan)
+                
+        except Exception as e:
+            logger.error(f"Escrow release failed: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
+
+    async def arelease_funds(self, escrow, amount=None, provider=None, milestone=None):
+        """Async counterpart of release_funds()."""
+        try:
+            plan, error = await sync_to_async(self._prepare_release)(escrow, amount=amount, milestone=milestone)
+            if error:
+                return error
+            return self._release_queued(plan)
+
+        except Exception as e:
+            logger.error(f"Escrow release failed: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
+
+    def _reserved_balance(self, escrow):
+        """Amount held by payouts and refunds that the provider has not confirmed yet."""
+        return Payment.objects.filter(
+            escrow=escrow,
+            transaction_type__in=['release', 'commission', 'refund'],
+            status__in=['pending', 'active'],
+        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+
+    def _prepare_release(self, escrow, amount=None, milestone=None):
+        """
+        Validate a release request, work out amounts and provider, and reserve
+        the payout by creating its pending payments and outbox row.
+
+        The escrow row is locked while checking and reserving, so concurrent
+        release requests cannot both pass the pending-release and balance checks.
+        The outbox row commits with the payments, so no release is recorded
+        without its transfer queued, and no transfer is sent without a record.
+        Returns (plan, None) or (None, error_response).
+        """
+        with transaction.atomic():
+            escrow = EscrowTransaction.objects.select_for_update().get(pk=escrow.pk)
             if escrow.is_locked:
-                return {'status': 'error', 'message': 'Escrow is locked due to dispute'}
-            
+                return None, {'status': 'error', 'message': 'Escrow is locked due to dispute'}
+
             milestone_instance = milestone
             if milestone_instance:
                 if milestone_instance.project_id != escrow.project_id:
-                    return {'status': 'error', 'message': 'Milestone does not belong to this escrow project'}
+                    return None, {'status': 'error', 'message': 'Milestone does not belong to this escrow project'}
                 if milestone_instance.is_paid:
-                    return {'status': 'error', 'message': 'Milestone has already been paid'}
+                    return None, {'status': 'error', 'message': 'Milestone has already been paid'}
                 if milestone_instance.status not in {'approved', 'submitted'}:
-                    return {'status': 'error', 'message': 'Milestone must be approved before releasing funds'}
+                    return None, {'status': 'error', 'message': 'Milestone must be approved before releasing funds'}
 
                 pending_for_milestone = Payment.objects.filter(
                     escrow=escrow,
@@ -141,7 +366,7 @@ class EscrowService:
                     milestone=milestone_instance,
                 ).exists()
                 if pending_for_milestone:
-                    return {'status': 'error', 'message': 'A payout for this milestone is already pending confirmation'}
+                    return None, {'status': 'error', 'message': 'A payout for this milestone is already pending confirmation'}
             else:
                 # Prevent duplicate releases while one is pending (global)
                 pending_release_exists = Payment.objects.filter(
@@ -150,24 +375,25 @@ class EscrowService:
                     status__in=['pending', 'active']
                 ).exists()
                 if pending_release_exists:
-                    return {'status': 'error', 'message': 'A payout is already pending confirmation'}
+                    return None, {'status': 'error', 'message': 'A payout is already pending confirmation'}
 
+            available_balance = escrow.current_balance - self._reserved_balance(escrow)
             if milestone_instance and amount is None:
                 release_amount = Decimal(str(milestone_instance.amount)).quantize(Decimal('0.01'))
             elif amount is None or amount == '':
-                release_amount = escrow.current_balance
+                release_amount = available_balance
             else:
                 release_amount = Decimal(str(amount)).quantize(Decimal('0.01'))
 
             if release_amount <= 0:
-                return {"status": "error", "message": "No available balance to release"}
-            if release_amount > escrow.current_balance:
-                return {'status': 'error', 'message': 'Insufficient escrow balance'}
-            
+                return None, {"status": "error", "message": "No available balance to release"}
+            if release_amount > available_balance:
+                return None, {'status': 'error', 'message': 'Insufficient escrow balance'}
+
             commission_rate = Decimal(str(settings.PLATFORM_COMMISSION_RATE))
             commission_on_release = (release_amount * commission_rate).quantize(Decimal('0.01'))
             freelancer_amount = (release_amount - commission_on_release).quantize(Decimal('0.01'))
-            
+
             # Determine provider
             funding_payment = (
                 Payment.objects.filter(
@@ -179,78 +405,112 @@ class EscrowService:
 
             resolved_provider = (funding_payment.provider if funding_payment else None)
             if not resolved_provider:
-                return {"status": "error", "message": "No provider available for payout"}
-
-            transfer_result = self.payment_service.transfer_to_freelancer(
-                freelancer=escrow.project.freelancer,
+                return None, {"status": "error", "message": "No provider available for payout"}
+
+            project = escrow.project
+            # The reference doubles as the transfer idempotency key; providers that
+            # assign their own reference get it recorded once the transfer is sent.
+            transfer_reference = f'escrow-release-{uuid.uuid4().hex[:16]}'
+            payout_payment = Payment.objects.create(
+                escrow=escrow,
+                user=project.freelancer,
                 amount=freelancer_amount,
-                provider_name=resolved_provider,
-                project_title=getattr(escrow.project, 'title', ''),
+                provider_transactionn_id=transfer_reference,
+                transaction_type='release',
+                provider=resolved_provider,
+                status='pending',
+                milestone=milestone_instance,
+            )
+            commission_payment = Payment.objects.create(
+                escrow=escrow,
+                user=project.client,
+                amount=commission_on_release,
+                provider_transactionn_id=f'commission-{payout_payment.id}',
+                transaction_type='commission',
+                provider=resolved_provider,
+                status='pending',
+                milestone=milestone_instance,
+            )
+            PayoutOutbox.objects.create(
+                payment=payout_payment,
+                provider=resolved_provider,
+                idempotency_key=transfer_reference,
             )
+            escrow.status = 'release_pending'
+            escrow.save(update_fields=['status', 'updated_at'])
+
+        return {
+            'release_amount': release_amount,
+            'commission_amount': commission_on_release,
+            'freelancer_amount': freelancer_amount,
+            'provider': resolved_provider,
+            'milestone': milestone_instance,
+            'payout_payment': payout_payment,
+            'commission_payment': commission_payment,
+            'escrow_balance': escrow.current_balance,
+        }, None
 
-            if transfer_result.get("status") != "success":
-                return {
-                    "status": transfer_result.get("status", "error"),
-                    "message": transfer_result.get("message", "Transfer initiation failed"),
-                    "provider": resolved_provider,
-                    "transfer_result": transfer_result,
-                }
+    @staticmethod
+    def _release_queued(plan):
+        payout_payment = plan['payout_payment']
+        milestone_instance = plan['milestone']
+        return {
+            "status": "pending",
+            "message": "Payout queued, awaiting provider confirmation",
+            "total_released": str(plan['release_amount']),
+            "freelancer_amount": str(plan['freelancer_amount']),
+            "commission_deducted": str(plan['commission_amount']),
+            "escrow_balance": str(plan['escrow_balance']),
+            "provider": plan['provider'],
+            "transfer_reference": payout_payment.provider_transactionn_id,
+            "release_payment_id": payout_payment.id,
+            "commission_payment_id": plan['commission_payment'].id,
+            "milestone_id": milestone_instance.id if milestone_instance else None,
+        }
+
+    def record_payout_sent(self, payment_id, transfer_result):
+        """
+        Attach the provider's transfer reference to a dispatched payout.
 
+        Returns:
+            str: The reference webhooks for this transfer will carry
+        """
+        with transaction.atomic():
+            payment = Payment.objects.select_for_update().get(id=payment_id)
             transfer_reference = (
                 transfer_result.get('reference')
                 or transfer_result.get('transfer_id')
                 or transfer_result.get('tx_ref')
-                or f'escrow-release-{uuid.uuid4().hex[:10]}'
+                or payment.provider_transactionn_id
             )
+            if transfer_reference != payment.provider_transactionn_id:
+                payment.provider_transactionn_id = transfer_reference
+                payment.save(update_fields=['provider_transactionn_id'])
+        return transfer_reference
 
-            with transaction.atomic():
-                payout_payment = Payment.objects.create(
-                    escrow=escrow,
-                    user=escrow.project.freelancer,
-                    amount=freelancer_amount,
-                    provider_transactionn_id=transfer_reference,
-                    transaction_type='release',
-                    provider=resolved_provider,
-                    status='pending',
-                    milestone=milestone_instance,
-                )
-
-                commission_payment = Payment.objects.create(
-                    escrow=escrow,
-                    user=escrow.project.client,
-                    amount=commission_on_release,
-                    provider_transactionn_id=f'commission-{payout_payment.id}',
-                    transaction_type='commission',
-                    provider=resolved_provider,
-                    status='pending',
-                    milestone=milestone_instance,
-                )
-
-                escrow.status = 'release_pending'
-                escrow.save(update_fields=['status'])
-
-            return {
-                "status": "pending",
-                "message": "Transfer initiated, awaiting provider confirmation",
-                "total_released": str(release_amount),
-                "freelancer_amount": str(freelancer_amount),
-                "commission_deducted": str(commission_on_release),
-                "escrow_balance": str(escrow.current_balance),
-                "provider": resolved_provider,
-                "transfer_reference": transfer_reference,
-                "release_payment_id": payout_payment.id,
-                "commission_payment_id": commission_payment.id,
-                "milestone_id": milestone_instance.id if milestone_instance else None,
-                "transfer_result": transfer_result,
-            }
-                
-        except Exception as e:
-            logger.error(f"Escrow release failed: {str(e)}")
-            return {'status': 'error', 'message': str(e)}
+    def cancel_release(self, payment_id):
+        """
+        Cancel a reserved payout the provider never accepted and return its amount to the available balance.
+        """
+        with transaction.atomic():
+            payment = Payment.objects.get(id=payment_id)
+            escrow = EscrowTransaction.objects.select_for_update().get(pk=payment.escrow_id)
+            Payment.objects.filter(
+                Q(id=payment.id) | Q(transaction_type='commission', provider_transactionn_id=f'commission-{payment.id}'),
+                escrow=escrow,
+                status='pending',
+            ).update(status='cancelled')
+            if escrow.status == 'release_pending' and not self._reserved_balance(escrow):
+                escrow.status = 'funded'
+                escrow.save(update_fields=['status', 'updated_at'])
 
     def verify_transfer_to_freelancer(self, *, provider_name: str, transfer_reference: str, success: bool, details: dict | None = None):
         """
         Finalize freelancer payout after provider confirmation (webhook).
+
+        The release payment row is locked so duplicate deliveries apply once,
+        and the payout is posted to the ledger, whose conditional balance update
+        keeps concurrent refunds and releases on the same escrow from overwriting each other.
         """
         try:
             logger.info(
@@ -262,14 +522,14 @@ class EscrowService:
                 }
             )
             with transaction.atomic():
-                payment = Payment.objects.select_related('escrow', 'escrow__project').get(
+                payment = Payment.objects.select_for_update().select_related('escrow', 'milestone').get(
                     provider_transactionn_id=transfer_reference,
                     transaction_type='release',
                     provider=provider_name,
                 )
 
                 escrow = payment.escrow
-                commission_payment = Payment.objects.filter(
+                commission_payment = Payment.objects.select_for_update().filter(
                     escrow=escrow,
                     transaction_type='commission',
                     provider=provider_name,
@@ -283,14 +543,18 @@ class EscrowService:
                             'message': 'Payout already processed',
                             'escrow_id': escrow.id,
                         }
+                    if payment.status not in ('pending', 'active'):
+                        logger.error(f"Transfer {transfer_reference} succeeded for a {payment.status} release payment {payment.id}")
+                        return {'status': 'ignored', 'message': f'Release payment is {payment.status}', 'escrow_id': escrow.id}
 
-                    total_release = payment.amount
+                    postings = [(escrow.id, 'release', payment.amount, payment)]
                     if commission_payment:
-                        total_release += commission_payment.amount
+                        postings.append((escrow.id, 'commission', commission_payment.amount, commission_payment))
+                    ledger.post_many(postings)
 
-                    escrow.current_balance = max(Decimal('0'), escrow.current_balance - total_release)
+                    escrow.refresh_from_db(fields=['current_balance'])
                     escrow.status = 'released' if escrow.current_balance == 0 else 'partially_released'
-                    escrow.save(update_fields=['current_balance', 'status'])
+                    escrow.save(update_fields=['status'])
 
                     payment.status = 'completed'
                     payment.save(update_fields=['status'])
@@ -313,6 +577,9 @@ class EscrowService:
                     }
 
                 # Handle failure scenario
+                if payment.status == 'completed':
+                    return {'status': 'ignored', 'message': 'Payout was already confirmed', 'escrow_id': escrow.id}
+
                 if payment.status != 'failed':
                     payment.status = 'failed'
                     payment.save(update_fields=['status'])
@@ -326,19 +593,20 @@ class EscrowService:
                     milestone_instance.is_paid = False
                     milestone_instance.save(update_fields=['is_paid'])
 
-                if escrow.status == 'release_pending':
+                escrow = EscrowTransaction.objects.select_for_update().get(pk=escrow.pk)
+                if escrow.status == 'release_pending' and not self._reserved_balance(escrow):
                     escrow.status = 'funded'
                     escrow.save(update_fields=['status'])
 
                 return {
-                    'status': 'error',
+                    'status': 'failed',
                     'message': 'Freelancer payout failed',
                     'escrow_id': escrow.id,
                     'milestone_id': milestone_instance.id if milestone_instance else None,
                 }
 
         except Payment.DoesNotExist:
-            return {'status': 'error', 'message': 'Release payment not found'}
+            return {'status': 'ignored', 'message': 'Release payment not found'}
         except Exception as e:
             logger.error(f"Verify transfer failed: {str(e)}")
             return {'status': 'error', 'message': str(e)}
@@ -350,63 +618,218 @@ class EscrowService:
         - Disallows refund if escrow is locked/disputed unless resolved by moderator.
         Delegates provider refund to PaymentService.
         """
-        if escrow.is_locked:
-            return {"status": "error", "message": "Escrow is locked due to dispute"}
-        if user.id != escrow.project.client_id:
-            return {"status": "error", "message": "Only the project client can request a refund"}
-
         try:
-            with transaction.atomic():
-                # Find original funding payment
-                funding_payment = (
-                    Payment.objects.filter(
-                        escrow=escrow, transaction_type='funding', status='completed'
-                    ).order_by('-timestamp').first()
-                )
-                if not funding_payment:
-                    return {"status": "error", "message": "No completed funding to refund from"}
-
-                provider = provider_name or funding_payment.provider
-                provider_tx_id = funding_payment.provider_transactionn_id
-
-                refund_amount = amount or escrow.current_balance
-                if refund_amount <= 0:
-                    return {"status": "error", "message": "No available balance to refund"}
+            plan, error = self._prepare_refund(user=user, escrow=escrow, amount=amount, provider_name=provider_name)
+            if error:
+                return error
 
+            try:
                 result = self.payment_service.refund(
-                    provider_name=provider,
-                    provider_transaction_id=provider_tx_id,
-                    amount=refund_amount,
+                    provider_name=plan['provider'],
+                    provider_transaction_id=plan['provider_tx_id'],
+                    amount=plan['refund_amount'],
                     reason=reason,
+                    reference=plan['reference'],
                 )
-                if result.get('status') != 'success':
-                    return {"status": "error", "message": result.get('message', 'Refund failed')}
+            except Exception as e:
+                result = {'status': 'error', 'message': str(e)}
+            return self._record_refund(escrow, plan, result)
+        except Exception as e:
+            logger.error(f"Refund orchestration failed: {str(e)}")
+            return {"status": "error", "message": str(e)}
 
-                Payment.objects.create(
-                    escrow=escrow,
-                    user=escrow.project.client,
-                    amount=refund_amount,
-                    provider_transactionn_id=result.get('refund_id') or f'refund-{provider_tx_id}',
-                    transaction_type='refund',
-                    provider=provider,
-                    status='completed',
+    async def arefund(self, *, user, escrow: EscrowTransaction, amount=None, reason="Project refund", provider_name=None):
+        """Async counterpart of refund()."""
+        try:
+            plan, error = await sync_to_async(self._prepare_refund)(
+                user=user, escrow=escrow, amount=amount, provider_name=provider_name
+            )
+            if error:
+                return error
+
+            try:
+                result = await self.payment_service.arefund(
+                    provider_name=plan['provider'],
+                    provider_transaction_id=plan['provider_tx_id'],
+                    amount=plan['refund_amount'],
+                    reason=reason,
+                    reference=plan['reference'],
                 )
-
-                escrow.current_balance -= refund_amount
-                if escrow.current_balance == 0:
-                    escrow.status = 'refunded'
-                escrow.save()
-
-                return {
-                    'status': 'success',
-                    'message': 'Refund processed',
-                    'refund_amount': str(refund_amount),
-                    'escrow_balance': str(escrow.current_balance),
-                }
+            except Exception as e:
+                result = {'status': 'error', 'message': str(e)}
+            return await sync_to_async(self._record_refund)(escrow, plan, result)
         except Exception as e:
             logger.error(f"Refund orchestration failed: {str(e)}")
             return {"status": "error", "message": str(e)}
 
+    def _prepare_refund(self, *, user, escrow, amount, provider_name):
+        """
+        Validate a refund request, resolve the funding payment to refund against
+        and reserve the amount with a pending refund payment.
+
+        The reservation counts against the available balance, so a concurrent
+        release or refund cannot spend it while the provider call is in flight.
+        Returns (plan, None) or (None, error_response).
+        """
+        with transaction.atomic():
+            escrow = EscrowTransaction.objects.select_for_update().get(pk=escrow.pk)
+            if escrow.is_locked:
+                return None, {"status": "error", "message": "Escrow is locked due to dispute"}
+            if user.id != escrow.project.client_id:
+                return None, {"status": "error", "message": "Only the project client can request a refund"}
+
+            # Find original funding payment
+            funding_payment = (
+                Payment.objects.filter(
+                    escrow=escrow, transaction_type='funding', status='completed'
+                ).order_by('-timestamp').first()
+            )
+            if not funding_payment:
+                return None, {"status": "error", "message": "No completed funding to refund from"}
+
+            available_balance = escrow.current_balance - self._reserved_balance(escrow)
+            refund_amount = Decimal(str(amount)).quantize(Decimal('0.01')) if amount else available_balance
+            if refund_amount <= 0:
+                return None, {"status": "error", "message": "No available balance to refund"}
+            if refund_amount > available_balance:
+                return None, {"status": "error", "message": "Insufficient escrow balance"}
+
+            resolved_provider = provider_name or funding_payment.provider
+            # One reference per refund, so partial refunds of the same funding stay
+            # distinguishable and expire_refund_reservations() can look each one up.
+            reference = f'escrow-refund-{uuid.uuid4().hex[:16]}'
+            refund_payment = Payment.objects.create(
+                escrow=escrow,
+                user=escrow.project.client,
+                amount=refund_amount,
+                provider_transactionn_id=reference,
+                transaction_type='refund',
+                provider=resolved_provider,
+                status='pending',
+            )
+
+        return {
+            'provider': resolved_provider,
+            'provider_tx_id': funding_payment.provider_transactionn_id,
+            'reference': reference,
+            'refund_amount': refund_amount,
+            'refund_payment': refund_payment,
+        }, None
+
+    def _record_refund(self, escrow, plan, result):
+        """
+        Complete the pending refund the provider accepted and post it to the ledger, or cancel it.
+
+        A refund whose outcome is unknown (the provider call timed out or lost its
+        connection) stays pending for expire_refund_reservations to settle by reference.
+        """
+        refund_amount = plan['refund_amount']
+        refund_payment = plan['refund_payment']
+
+        if result.get('status') == 'unconfirmed':
+            logger.warning(f"Refund {refund_payment.id} outcome unknown, left pending: {result.get('message')}")
+            return {
+                'status': 'pending',
+                'message': 'Refund outcome unknown; awaiting confirmation',
+                'refund_amount': str(refund_amount),
+                'refund_payment_id': refund_payment.id,
+            }
+        if result.get('status') != 'success':
+            Payment.objects.filter(id=refund_payment.id, status='pending').update(status='cancelled')
+            return {"status": "error", "message": result.get('message', 'Refund failed')}
+
+        if not self._complete_refund(refund_payment, result.get('refund_id')):
+            logger.error(f"Refund {refund_payment.id} was accepted by the provider after it had been resolved")
+        escrow.refresh_from_db(fields=['current_balance'])
+
+        return {
+            'status': 'success',
+            'message': 'Refund processed',
+            'refund_amount': str(refund_amount),
+            'escrow_balance': str(escrow.current_balance),
+        }
+
+    @staticmethod
+    def _complete_refund(refund_payment, refund_id=None):
+        """
+        Complete a pending refund and post it to the ledger.
+
+        Returns:
+            False if the refund was no longer pending (already completed or cancelled)
+        """
+        updates = {'status': 'completed'}
+        if refund_id:
+            updates['provider_transactionn_id'] = refund_id
+        with transaction.atomic():
+            if not Payment.objects.filter(id=refund_payment.id, status='pending').update(**updates):
+                return False
+            ledger.post(refund_payment.escrow_id, 'refund', refund_payment.amount, payment=refund_payment)
+
+            escrow = EscrowTransaction.objects.select_for_update().get(pk=refund_payment.escrow_id)
+            if escrow.current_balance == 0:
+                escrow.status = 'refunded'
+                escrow.save(update_fields=['status', 'updated_at'])
+        return True
+
+    def expire_refund_reservations(self, older_than):
+        """
+        Resolve refunds stuck in 'pending' (the provider call's outcome was unknown,
+        or the process died before recording it), which otherwise hold escrow
+        balance forever.
+
+        Each is looked up with the provider under its refund reference: a refund
+        the provider made is completed and posted to the ledger, one it confirms it
+        never saw is cancelled. Anything else stays reserved, since cancelling a
+        refund that was paid would let the balance be spent twice.
+
+        Args:
+            older_than: timedelta after which a 'pending' refund is looked up
+
+        Returns:
+            Dict with completed, cancelled and unresolved counts
+        """
+        cutoff = timezone.now() - older_than
+        stale = Payment.objects.filter(transaction_type='refund', status='pending', timestamp__lte=cutoff)
+        counts = {'completed': 0, 'cancelled': 0, 'unresolved': 0}
+        for payment in stale.iterator():
+            # The funding _prepare_refund() refunded against: the latest completed one at the time.
+            funding = (
+                Payment.objects.filter(
+                    escrow_id=payment.escrow_id, transaction_type='funding', status='completed',
+                    timestamp__lte=payment.timestamp,
+                ).order_by('-timestamp').first()
+            )
+            if not payment.provider_transactionn_id.startswith('escrow-refund-'):
+                # Requested before refunds had their own reference; the provider cannot find it by one.
+                result = {'status': 'error', 'message': 'no refund reference to look up'}
+            else:
+                try:
+                    result = self.payment_service.get_refund_status(
+                        provider_name=payment.provider,
+                        provider_transaction_id=funding.provider_transactionn_id if funding else '',
+                        refund_reference=payment.provider_transactionn_id,
+                    )
+                except Exception as e:
+                    result = {'status': 'error', 'message': str(e)}
+
+            outcome = result.get('status')
+            if outcome == 'success':
+                if self._complete_refund(payment, result.get('refund_id')):
+                    counts['completed'] += 1
+            elif outcome in ('failed', 'not_found'):
+                if Payment.objects.filter(id=payment.id, status='pending').update(status='cancelled'):
+                    counts['cancelled'] += 1
+            else:
+                logger.warning(
+                    f"Stale refund {payment.id} ({payment.provider_transactionn_id}) left reserved: "
+                    f"{result.get('message', outcome)}"
+                )
+                counts['unresolved'] += 1
+
+        if any(counts.values()):
+            logger.info(f"Expired refund reservations: {counts}")
+        return counts
+
     def open_dispute(self, *, project, raised_by, dispute_type="other", reason=""):
         """
         Open a dispute and lock the related escrow.
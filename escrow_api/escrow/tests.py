@@ -1,3 +1,204 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from payments.models import Payment
+from payments.providers import get_payment_provider, register_payment_provider
+from payments.providers.fake import FakeProvider
+from user_projects.models import UserProject
+
+from . import ledger
+from .models import EscrowTransaction, LedgerEntry
+from .services import EscrowService
+
+User = get_user_model()
+
+
+class EscrowTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = User.objects.create(email='client@example.com', user_type='client')
+        cls.freelancer = User.objects.create(email='freelancer@example.com', user_type='freelancer')
+
+    def create_escrow(self):
+        project = UserProject.objects.create(
+            client=self.client_user, freelancer=self.freelancer, title='Project', description='Work',
+            amount=Decimal('500'), status='active',
+        )
+        return EscrowTransaction.objects.create(project=project)
+
+    def create_funding(self, escrow, amount=Decimal('500'), status='pending'):
+        return Payment.objects.create(
+            escrow=escrow, user=self.client_user, amount=amount, provider_transactionn_id=f'fund-{escrow.id}',
+            transaction_type='funding', provider='fake', status=status,
+        )
+
+
+class LedgerPostingTests(EscrowTestCase):
+
+    def test_postings_update_the_snapshot_and_balance(self):
+        escrow = self.create_escrow()
+        ledger.post(escrow.id, 'funding', Decimal('500'))
+        ledger.post_many([(escrow.id, 'release', Decimal('90'), None), (escrow.id, 'commission', Decimal('10'), None)])
+
+        escrow.refresh_from_db()
+        self.assertEqual(
+            (escrow.current_balance, escrow.funded_amount, escrow.commission_posted),
+            (Decimal('400'), Decimal('500'), Decimal('10')),
+        )
+        self.assertEqual(LedgerEntry.objects.filter(escrow=escrow).count(), 6)
+        self.assertTrue(ledger.verify_escrow(escrow.id))
+        self.assertTrue(ledger.replay().ok)
+
+    def test_overdraw_is_rejected_without_partial_postings(self):
+        escrow = self.create_escrow()
+        ledger.post(escrow.id, 'funding', Decimal('100'))
+
+        with self.assertRaises(ledger.InsufficientEscrowBalance):
+            ledger.post_many([(escrow.id, 'release', Decimal('90'), None), (escrow.id, 'commission', Decimal('20'), None)])
+
+        escrow.refresh_from_db()
+        self.assertEqual(escrow.current_balance, Decimal('100'))
+        self.assertEqual(LedgerEntry.objects.filter(escrow=escrow).count(), 2)
+
+    def test_replay_reports_a_snapshot_changed_outside_the_ledger(self):
+        escrow = self.create_escrow()
+        ledger.post(escrow.id, 'funding', Decimal('100'))
+        EscrowTransaction.objects.filter(id=escrow.id).update(current_balance=Decimal('150'))
+
+        report = ledger.replay()
+        self.assertFalse(report.ok)
+        self.assertEqual(len(report.mismatches), 1)
+
+    def test_completed_funding_is_posted_once(self):
+        escrow = self.create_escrow()
+        payment = self.create_funding(escrow)
+
+        EscrowService().complete_funding(payment.id)
+        EscrowService().complete_funding(payment.id)
+
+        escrow.refresh_from_db()
+        self.assertEqual(escrow.current_balance, Decimal('500'))
+        # commission_amount is the expected commission; nothing is posted until a release.
+        self.assertEqual(escrow.commission_amount, EscrowService._expected_commission(Decimal('500')))
+        self.assertEqual(escrow.commission_posted, Decimal('0'))
+        self.assertEqual(LedgerEntry.objects.filter(escrow=escrow, entry_type='funding').count(), 2)
+
+
+class LostAnswerRefundProvider(FakeProvider):
+    """FakeProvider that makes each refund but times out before answering."""
+
+    def refund(self, provider_transaction_id, amount=None, reason="Project refund", **kwargs):
+        super().refund(provider_transaction_id, amount, reason, **kwargs)
+        return {'status': 'unconfirmed', 'reference': kwargs.get('reference'), 'message': 'Refund outcome unknown (timed out)'}
+
+
+@override_settings(PAYMENT_FAKE_PROVIDER_ENABLED=True)
+class RefundTests(EscrowTestCase):
+
+    def setUp(self):
+        self.escrow = self.create_escrow()
+        EscrowService().complete_funding(self.create_funding(self.escrow).id)
+
+    def test_partial_refunds_get_their_own_reference(self):
+        service = EscrowService()
+        self.assertEqual(service.refund(user=self.client_user, escrow=self.escrow, amount='10')['status'], 'success')
+        self.assertEqual(service.refund(user=self.client_user, escrow=self.escrow, amount='20')['status'], 'success')
+
+        refunds = Payment.objects.filter(escrow=self.escrow, transaction_type='refund', status='completed')
+        self.assertEqual(refunds.values('provider_transactionn_id').distinct().count(), 2)
+        self.escrow.refresh_from_db()
+        self.assertEqual(self.escrow.current_balance, Decimal('470'))
+
+    def test_sweep_resolves_refunds_left_pending(self):
+        service = EscrowService()
+        # Both crashed before recording the provider's answer; only the first reached the provider.
+        made, _ = service._prepare_refund(user=self.client_user, escrow=self.escrow, amount='30', provider_name=None)
+        get_payment_provider('fake').refund(f'fund-{self.escrow.id}', Decimal('30'), reference=made['reference'])
+        lost, _ = service._prepare_refund(user=self.client_user, escrow=self.escrow, amount='40', provider_name=None)
+
+        self.assertEqual(service.expire_refund_reservations(timedelta(minutes=15)), {'completed': 0, 'cancelled': 0, 'unresolved': 0})
+        Payment.objects.filter(transaction_type='refund').update(timestamp=timezone.now() - timedelta(hours=1))
+        counts = service.expire_refund_reservations(timedelta(minutes=15))
+
+        self.assertEqual(counts, {'completed': 1, 'cancelled': 1, 'unresolved': 0})
+        made['refund_payment'].refresh_from_db()
+        lost['refund_payment'].refresh_from_db()
+        self.assertEqual((made['refund_payment'].status, lost['refund_payment'].status), ('completed', 'cancelled'))
+
+        # A late answer for the swept refund must not post it again.
+        service._record_refund(self.escrow, made, {'status': 'success'})
+        self.escrow.refresh_from_db()
+        self.assertEqual(self.escrow.current_balance, Decimal('470'))
+        self.assertTrue(ledger.replay().ok)
+
+    def test_refund_that_timed_out_stays_pending_until_swept(self):
+        register_payment_provider('fake', LostAnswerRefundProvider)
+        service = EscrowService()
+
+        result = service.refund(user=self.client_user, escrow=self.escrow, amount='50')
+        self.assertEqual(result['status'], 'pending', result)
+        refund = Payment.objects.get(id=result['refund_payment_id'])
+        self.assertEqual(refund.status, 'pending')
+        self.escrow.refresh_from_db()
+        self.assertEqual(self.escrow.current_balance, Decimal('500'))
+
+        Payment.objects.filter(id=refund.id).update(timestamp=timezone.now() - timedelta(hours=1))
+        self.assertEqual(service.expire_refund_reservations(timedelta(minutes=15)), {'completed': 1, 'cancelled': 0, 'unresolved': 0})
+        refund.refresh_from_db()
+        self.escrow.refresh_from_db()
+        self.assertEqual((refund.status, self.escrow.current_balance), ('completed', Decimal('450')))
+
+
+@override_settings(ESCROW_RECENT_PAYMENTS_LIMIT=3)
+class EscrowListTests(EscrowTestCase):
+
+    def setUp(self):
+        self.escrows = [self.create_escrow() for _ in range(3)]
+        started = timezone.now() - timedelta(hours=1)
+        for minute in range(7):
+            payment = Payment.objects.create(
+                escrow=self.escrows[0], user=self.client_user, amount=Decimal('10'),
+                provider_transactionn_id=f'payment-{minute}', transaction_type='release', provider='fake',
+            )
+            Payment.objects.filter(id=payment.id).update(timestamp=started + timedelta(minutes=minute))
+        self.api = APIClient()
+
+    def get(self, user, url='/escrows/', **params):
+        self.api.force_authenticate(user)
+        response = self.api.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_list_is_cursor_paginated_newest_first(self):
+        first = self.get(self.client_user, page_size=2)
+        second = self.get(self.client_user, url=first['next'])
+
+        self.assertIsNone(second['next'])
+        self.assertEqual(
+            [escrow['id'] for escrow in first['results'] + second['results']],
+            [escrow.id for escrow in reversed(self.escrows)],
+        )
+
+    def test_escrows_embed_their_count_and_recent_payments_only(self):
+        with self.assertNumQueries(2):
+            escrows = {escrow['id']: escrow for escrow in self.get(self.client_user)['results']}
+
+        busy = escrows[self.escrows[0].id]
+        self.assertEqual(busy['payment_count'], 7)
+        self.assertEqual(
+            [payment['provider_transactionn_id'] for payment in busy['payments']],
+            ['payment-6', 'payment-5', 'payment-4'],
+        )
+        self.assertEqual((escrows[self.escrows[1].id]['payment_count'], escrows[self.escrows[1].id]['payments']), (0, []))
+
+    def test_users_see_only_their_own_escrows(self):
+        outsider = User.objects.create(email='other@example.com', user_type='client')
+
+        self.assertEqual(len(self.get(self.freelancer)['results']), 3)
+        self.assertEqual(self.get(outsider)['results'], [])
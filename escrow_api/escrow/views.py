@@ -5,19 +5,26 @@ from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 from .models import EscrowTransaction
+from .pagination import EscrowListPagination
 from .serializers import (
 	EscrowLockSerializer,
 	EscrowReleaseSerializer,
 	EscrowTransactionSerializer,
+	with_payment_summary,
 )
 from .services import EscrowService
 
 
 class EscrowTransactionListView(generics.ListAPIView):
-	"""List all escrows relevant to the authenticated user."""
+	"""
+	List escrows relevant to the authenticated user, newest first, cursor paginated.
+	Each escrow carries its payment_count and only its most recent payments;
+	the full history is paged from the escrow payments endpoint.
+	"""
 
 	serializer_class = EscrowTransactionSerializer
 	permission_classes = [permissions.IsAuthenticated]
+	pagination_class = EscrowListPagination
 
 	@swagger_auto_schema(
 		operation_summary="List escrow transactions for the current user",
@@ -28,11 +35,7 @@ class EscrowTransactionListView(generics.ListAPIView):
 
 	def get_queryset(self):
 		user = self.request.user
-		queryset = EscrowTransaction.objects.select_related(
-			"project",
-			"project__client",
-			"project__freelancer",
-		).prefetch_related("payments")
+		queryset = with_payment_summary(EscrowTransaction.objects.all())
 
 		if user.is_staff:
 			return queryset
@@ -48,11 +51,9 @@ class EscrowTransactionListView(generics.ListAPIView):
 class EscrowTransactionDetailView(generics.RetrieveAPIView):
 	serializer_class = EscrowTransactionSerializer
 	permission_classes = [permissions.IsAuthenticated]
-	queryset = EscrowTransaction.objects.select_related(
-		"project",
-		"project__client",
-		"project__freelancer",
-	).prefetch_related("payments")
+
+	def get_queryset(self):
+		return with_payment_summary(EscrowTransaction.objects.all())
 
 	@swagger_auto_schema(
 		operation_summary="Retrieve a specific escrow transaction",
@@ -112,7 +113,8 @@ class EscrowReleaseFundsView(views.APIView):
 		service = EscrowService()
 		result = service.release_funds(escrow=escrow, amount=serializer.validated_data["amount"])
 
-		http_status = status.HTTP_200_OK if result.get("status") == "success" else status.HTTP_400_BAD_REQUEST
+		# 'pending' means the payout is queued; the provider confirms it later by webhook.
+		http_status = status.HTTP_200_OK if result.get("status") in ("success", "pending") else status.HTTP_400_BAD_REQUEST
 		return Response(result, status=http_status)
 
 
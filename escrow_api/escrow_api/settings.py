@@ -144,7 +144,7 @@ AUTH_USER_MODEL = 'accounts.CustomUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_THROTTLE_RATES': {
         'anon': '20/hour', 
@@ -157,7 +157,26 @@ FRONTEND_DOMAIN='frontend_domain_here'
 
 SITE_NAME='site_name_here'
 
+# Authenticated users are loaded from short-lived snapshots in this cache (accounts/authentication.py), lifetime in seconds.
+USER_SNAPSHOT_CACHE = env('USER_SNAPSHOT_CACHE', default='default')
+USER_SNAPSHOT_CACHE_TTL = env.int('USER_SNAPSHOT_CACHE_TTL', default=60)
+
+# Opt-in stateless roles (accounts/roles.py): access tokens carry user_type, is_staff and moderator claims
+# plus a roles_version checked against USER_ROLES_CACHE, so permission classes skip the database.
+JWT_ROLE_CLAIMS = env.bool('JWT_ROLE_CLAIMS', default=False)
+USER_ROLES_CACHE = env('USER_ROLES_CACHE', default='default')
+USER_ROLES_CACHE_TTL = env.int('USER_ROLES_CACHE_TTL', default=300)
+
+# Refresh token revocation (accounts/tokens.py): blacklisted JTIs are mirrored into this cache, and the set is
+# reloaded from the database when it is older than the warm TTL (seconds). Expired token rows are pruned daily,
+# in chunks, once they are past the grace period (seconds).
+TOKEN_REVOCATION_CACHE = env('TOKEN_REVOCATION_CACHE', default='default')
+TOKEN_REVOCATION_WARM_TTL = env.int('TOKEN_REVOCATION_WARM_TTL', default=60 * 60)
+TOKEN_PRUNE_CHUNK_SIZE = env.int('TOKEN_PRUNE_CHUNK_SIZE', default=1000)
+TOKEN_PRUNE_GRACE = env.int('TOKEN_PRUNE_GRACE', default=0)
+
 SIMPLE_JWT = {
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.serializers.CustomTokenRefreshSerializer',
     'BLACKLIST_AFTER_ROTATION': True,
     'ROTATE_REFRESH_TOKENS': True,
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
@@ -173,4 +192,135 @@ EMAIL_USE_TLS = True  # Use TLS encryption (set to True or False)
 EMAIL_USE_SSL = False  # Use SSL encryption (set to True or False). Only one of TLS/SSL should be True.
 EMAIL_HOST_USER = env('EMAIL_HOST_USER')  # Your email address for sending
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD') # Your email password or app-specific password
-DEFAULT_FROM_EMAIL = EMAIL_HOST_USER # The default sender email address
\ No newline at end of file
+DEFAULT_FROM_EMAIL = EMAIL_HOST_USER # The default sender email address
+
+SITE_NAME = env('SITE_NAME', default='Freelancer Escrow')
+
+# Share of each release kept by the platform.
+PLATFORM_COMMISSION_RATE = env.float('PLATFORM_COMMISSION_RATE', default=0.10)
+
+# Outbound HTTP transport for the Chapa provider (payments/providers/transport.py).
+# Per-endpoint (connect, read) timeouts can be overridden under 'timeouts'.
+CHAPA_HTTP_TRANSPORT = {
+    'pool_maxsize': env.int('CHAPA_HTTP_POOL_MAXSIZE', default=20),
+    'max_retries': env.int('CHAPA_HTTP_MAX_RETRIES', default=2),
+    'timeouts': {},
+}
+
+STRIPE_SECRET_KEY = env('STRIPE_SECRET_KEY', default='')
+STRIPE_PUBLISHABLE_KEY = env('STRIPE_PUBLISHABLE_KEY', default='')
+STRIPE_WEBHOOK_SECRET = env('STRIPE_WEBHOOK_SECRET', default='')
+
+# Simulated provider for load tests (payments/providers/fake.py). Never enable in production.
+PAYMENT_FAKE_PROVIDER_ENABLED = env.bool('PAYMENT_FAKE_PROVIDER_ENABLED', default=False)
+PAYMENT_FAKE_PROVIDER = {}
+
+# Outbound provider quotas (payments/providers/ratelimit.py), per provider and endpoint,
+# shared through PAYMENT_PROVIDER_RATE_LIMIT_CACHE; a call waits up to
+# PAYMENT_PROVIDER_RATE_LIMIT_WAIT seconds for a token before failing.
+PAYMENT_PROVIDER_RATE_LIMITS = {
+    'chapa': {
+        'default': env('CHAPA_RATE_LIMIT', default='10/s'),
+        'transfer': env('CHAPA_TRANSFER_RATE_LIMIT', default='5/s'),
+    },
+    'stripe': {
+        'default': env('STRIPE_RATE_LIMIT', default='25/s'),
+    },
+}
+PAYMENT_PROVIDER_RATE_LIMIT_CACHE = env('PAYMENT_PROVIDER_RATE_LIMIT_CACHE', default='default')
+PAYMENT_PROVIDER_RATE_LIMIT_WAIT = env.float('PAYMENT_PROVIDER_RATE_LIMIT_WAIT', default=10.0)
+
+# Bank directory (payments/banks.py): provider re-sync interval and in-process read cache, in seconds.
+BANK_DIRECTORY_TTL = env.int('BANK_DIRECTORY_TTL', default=6 * 60 * 60)
+BANK_DIRECTORY_CACHE_SECONDS = env.int('BANK_DIRECTORY_CACHE_SECONDS', default=60)
+
+# Webhook ids already in the inbox are remembered in-process and in this cache alias ('' for in-process only),
+# so redeliveries are acknowledged without a database insert.
+WEBHOOK_RECENT_IDS_CACHE = env('WEBHOOK_RECENT_IDS_CACHE', default='default')
+WEBHOOK_RECENT_IDS_SIZE = env.int('WEBHOOK_RECENT_IDS_SIZE', default=10000)
+WEBHOOK_RECENT_IDS_TTL = env.int('WEBHOOK_RECENT_IDS_TTL', default=60 * 60)
+
+# Webhook inbox retention (payments/retention.py): settled events older than this are archived to gzipped NDJSON and deleted.
+WEBHOOK_RETENTION_DAYS = env.int('WEBHOOK_RETENTION_DAYS', default=30)
+WEBHOOK_ARCHIVE_DIR = env('WEBHOOK_ARCHIVE_DIR', default=str(BASE_DIR / 'archive' / 'webhooks'))
+WEBHOOK_ARCHIVE_CHUNK_SIZE = env.int('WEBHOOK_ARCHIVE_CHUNK_SIZE', default=1000)
+
+# Resolved freelancer payout profiles (payments/payout_profiles.py): cache alias and lifetime in seconds.
+PAYOUT_PROFILE_CACHE = env('PAYOUT_PROFILE_CACHE', default='default')
+PAYOUT_PROFILE_CACHE_TTL = env.int('PAYOUT_PROFILE_CACHE_TTL', default=300)
+
+# Funding reservations still 'initiating' after this many seconds are checked with the provider and completed or cancelled.
+FUNDING_RESERVATION_TIMEOUT = env.int('FUNDING_RESERVATION_TIMEOUT', default=15 * 60)
+
+# Refunds still 'pending' after this many seconds are looked up with the provider and completed or cancelled.
+REFUND_RESERVATION_TIMEOUT = env.int('REFUND_RESERVATION_TIMEOUT', default=15 * 60)
+
+# Escrow list and detail responses embed only this many of the most recent payments; the rest are paged from payments/escrows/<id>/payments/.
+ESCROW_RECENT_PAYMENTS_LIMIT = env.int('ESCROW_RECENT_PAYMENTS_LIMIT', default=5)
+
+# Payout outbox (payments/outbox.py): transfers in flight per provider; 'default' covers unlisted providers.
+PAYOUT_DISPATCHER_CONCURRENCY = {
+    'default': env.int('PAYOUT_DISPATCHER_CONCURRENCY', default=8),
+    'chapa': env.int('PAYOUT_DISPATCHER_CHAPA_CONCURRENCY', default=4),
+}
+
+# Transfer status poller (payments/reconciliation.py): sent payouts unconfirmed after this many minutes are
+# checked with the provider, then rechecked after TRANSFER_POLL_BACKOFF * 2 ** n seconds, capped at TRANSFER_POLL_BACKOFF_MAX.
+TRANSFER_POLL_AFTER_MINUTES = env.int('TRANSFER_POLL_AFTER_MINUTES', default=30)
+TRANSFER_POLL_BACKOFF = env.int('TRANSFER_POLL_BACKOFF', default=300)
+TRANSFER_POLL_BACKOFF_MAX = env.int('TRANSFER_POLL_BACKOFF_MAX', default=6 * 60 * 60)
+
+CELERY_BROKER_URL = env('CELERY_BROKER_URL', default='redis://localhost:6379/0')
+CELERY_TASK_ACKS_LATE = True
+# Eager mode runs tasks in-process, for tests and local runs without a broker.
+CELERY_TASK_ALWAYS_EAGER = env.bool('CELERY_TASK_ALWAYS_EAGER', default=False)
+CELERY_TASK_EAGER_PROPAGATES = True
+
+# Release/refund pipeline (payments/tasks.py): one queue per provider (payments.<provider>), each with a Celery rate limit.
+PAYMENT_TASK_RATE_LIMITS = {
+    'default': env('PAYMENT_TASK_RATE_LIMIT', default=None),
+    'chapa': env('PAYMENT_TASK_CHAPA_RATE_LIMIT', default='5/s'),
+    'stripe': env('PAYMENT_TASK_STRIPE_RATE_LIMIT', default='20/s'),
+}
+PAYMENT_TASK_MAX_RETRIES = env.int('PAYMENT_TASK_MAX_RETRIES', default=5)
+PAYMENT_TASK_RETRY_BACKOFF_MAX = env.int('PAYMENT_TASK_RETRY_BACKOFF_MAX', default=600)
+PAYMENT_TASK_IDEMPOTENCY_CACHE = env('PAYMENT_TASK_IDEMPOTENCY_CACHE', default='default')
+PAYMENT_TASK_IDEMPOTENCY_TTL = env.int('PAYMENT_TASK_IDEMPOTENCY_TTL', default=24 * 60 * 60)
+CELERY_BEAT_SCHEDULE = {
+    'reconcile-pending-funding': {
+        'task': 'payments.tasks.reconcile_pending_funding',
+        'schedule': env.int('FUNDING_RECONCILE_INTERVAL', default=600),
+    },
+    'process-webhook-inbox': {
+        'task': 'payments.tasks.process_webhook_inbox',
+        'schedule': env.float('WEBHOOK_INBOX_INTERVAL', default=2.0),
+    },
+    'expire-funding-reservations': {
+        'task': 'payments.tasks.expire_funding_reservations',
+        'schedule': env.int('FUNDING_RESERVATION_SWEEP_INTERVAL', default=300),
+    },
+    'expire-refund-reservations': {
+        'task': 'payments.tasks.expire_refund_reservations',
+        'schedule': env.int('REFUND_RESERVATION_SWEEP_INTERVAL', default=300),
+    },
+    'archive-webhook-events': {
+        'task': 'payments.tasks.archive_webhook_events',
+        'schedule': env.int('WEBHOOK_ARCHIVE_INTERVAL', default=24 * 60 * 60),
+    },
+    'poll-pending-transfers': {
+        'task': 'payments.tasks.poll_pending_transfers',
+        'schedule': env.int('TRANSFER_POLL_INTERVAL', default=300),
+    },
+    'dispatch-payouts': {
+        'task': 'payments.tasks.dispatch_payouts',
+        'schedule': env.float('PAYOUT_DISPATCH_INTERVAL', default=2.0),
+    },
+    'prune-token-blacklist': {
+        'task': 'accounts.tasks.prune_token_blacklist',
+        'schedule': env.int('TOKEN_PRUNE_INTERVAL', default=24 * 60 * 60),
+    },
+    'sync-bank-directory': {
+        'task': 'payments.tasks.sync_bank_directory',
+        'schedule': BANK_DIRECTORY_TTL,
+    },
+}
@@ -17,6 +17,9 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('account/', include('accounts.urls')),
+    path('projects/', include('user_projects.urls')),
+    path('escrows/', include('escrow.urls')),
+    path('payments/', include('payments.urls')),
 
 
     # swagger/openapi routes
@@ -7,6 +7,7 @@ from .models import (
     StripePayoutMethod,
     Bank,
     WebhookEvent,
+    PayoutOutbox,
 )
 
 
@@ -45,13 +46,22 @@ class StripePayoutMethodAdmin(admin.ModelAdmin):
 
 @admin.register(Bank)
 class BankAdmin(admin.ModelAdmin):
-    list_display = ('code', 'name', 'country', 'is_active')
+    list_display = ('code', 'name', 'country', 'is_active', 'updated_at')
     list_filter = ('country', 'is_active')
     search_fields = ('code', 'name')
 
 
 @admin.register(WebhookEvent)
 class WebhookEventAdmin(admin.ModelAdmin):
-    list_display = ('provider', 'event_id', 'received_at')
-    list_filter = ('provider',)
-    search_fields = ('event_id',)
\ No newline at end of file
+    list_display = ('provider', 'event_id', 'event_type', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('provider', 'status')
+    search_fields = ('event_id', 'reference')
+    readonly_fields = ('payload', 'last_error')
+
+
+@admin.register(PayoutOutbox)
+class PayoutOutboxAdmin(admin.ModelAdmin):
+    list_display = ('idempotency_key', 'provider', 'payment', 'status', 'attempts', 'created_at', 'sent_at', 'status_checks')
+    list_filter = ('provider', 'status')
+    search_fields = ('idempotency_key', 'provider_reference')
+    readonly_fields = ('last_error',)
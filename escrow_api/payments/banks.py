@@ -0,0 +1,164 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Bank
+from .providers import get_payment_provider
+
+logger = logging.getLogger(__name__)
+
+BankSnapshot = namedtuple('BankSnapshot', ['banks', 'etag', 'synced_at', 'loaded_at'])
+
+
+class BankDirectory:
+    """
+    Bank list for payout onboarding, served from the Bank table.
+
+    Reads come from an in-process snapshot of the table that is reloaded every
+    BANK_DIRECTORY_CACHE_SECONDS. The table itself is re-synced from the provider
+    once it is older than BANK_DIRECTORY_TTL, in a background thread so no
+    request waits on the provider API (except the very first, when the table is empty).
+
+    Args:
+        provider_name: Provider whose get_banks() feeds the table
+    """
+
+    def __init__(self, provider_name='chapa'):
+        self.provider_name = provider_name
+        self._snapshot = None
+        self._load_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'BANK_DIRECTORY_TTL', 6 * 60 * 60)
+
+    @property
+    def cache_seconds(self):
+        return getattr(settings, 'BANK_DIRECTORY_CACHE_SECONDS', 60)
+
+    def get(self) -> BankSnapshot:
+        """
+        Return the current bank snapshot, scheduling a provider sync if it is stale.
+        """
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot.loaded_at > self.cache_seconds:
+            snapshot = self._reload()
+
+        if snapshot.synced_at is None:
+            # Nothing synced yet: the first caller pays for one provider round trip.
+            with self._refresh_lock:
+                if self._snapshot is None or self._snapshot.synced_at is None:
+                    self.sync()
+            snapshot = self._reload()
+        elif (timezone.now() - snapshot.synced_at).total_seconds() > self.ttl:
+            self.refresh_in_background()
+        return snapshot
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _reload(self) -> BankSnapshot:
+        with self._load_lock:
+            snapshot = self._snapshot
+            if snapshot is not None and time.monotonic() - snapshot.loaded_at <= self.cache_seconds:
+                return snapshot
+
+            # The endpoint has always returned Chapa's own bank entries, so those are what is served.
+            banks = [
+                row['details'] or {'code': row['code'], 'name': row['name'], 'country': row['country']}
+                for row in Bank.objects.filter(is_active=True).order_by('name').values('code', 'name', 'country', 'details')
+            ]
+            synced_at = Bank.objects.aggregate(synced_at=Max('updated_at'))['synced_at']
+            digest = hashlib.sha1(json.dumps(banks, sort_keys=True).encode()).hexdigest()
+            snapshot = BankSnapshot(banks, f'"{digest}"', synced_at, time.monotonic())
+            self._snapshot = snapshot
+            return snapshot
+
+    def refresh_in_background(self) -> bool:
+        """
+        Start a sync thread unless one is already running in this process.
+
+        Returns:
+            bool: True if a new sync was started
+        """
+        with self._refresh_lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+        threading.Thread(target=self._background_sync, name='bank-directory-sync', daemon=True).start()
+        return True
+
+    def _background_sync(self):
+        try:
+            self.sync()
+        finally:
+            self._refreshing = False
+            connection.close()
+
+    def sync(self) -> dict:
+        """
+        Upsert the provider's bank list into the Bank table.
+        Banks the provider no longer lists are deactivated, not deleted, since payout methods refer to them by code.
+
+        Returns:
+            Dict with sync counts or error
+        """
+        result = get_payment_provider(self.provider_name).get_banks()
+        if result.get('status') != 'success':
+            logger.error(f"Bank directory sync failed: {result.get('message')}")
+            return result
+
+        now = timezone.now()
+        max_code_length = Bank._meta.get_field('code').max_length
+        banks = {}
+        skipped = 0
+        for item in result.get('banks', []):
+            code = str(item.get('id') or item.get('code') or '').strip()
+            name = (item.get('name') or '').strip()
+            if not code or not name:
+                continue
+            if len(code) > max_code_length:
+                # A truncated code could collide with another bank's or name a bank Chapa does not know.
+                logger.warning(f"Bank directory sync skipped {name!r}: code {code!r} is longer than {max_code_length} characters")
+                skipped += 1
+                continue
+            banks[code] = Bank(
+                code=code,
+                name=name[:100],
+                country=item.get('country') or 'ET',
+                details=item,
+                is_active=True,
+                updated_at=now,
+            )
+
+        if not banks:
+            logger.error("Bank directory sync returned no banks; keeping the existing list")
+            return {'status': 'error', 'message': 'Provider returned no banks'}
+
+        with transaction.atomic():
+            Bank.objects.bulk_create(
+                banks.values(),
+                update_conflicts=True,
+                unique_fields=['code'],
+                update_fields=['name', 'country', 'details', 'is_active', 'updated_at'],
+            )
+            deactivated = Bank.objects.filter(is_active=True).exclude(code__in=list(banks)).update(
+                is_active=False, updated_at=now,
+            )
+
+        self.invalidate()
+        logger.info(f"Bank directory synced {len(banks)} banks, deactivated {deactivated}, skipped {skipped}")
+        return {'status': 'success', 'synced': len(banks), 'deactivated': deactivated, 'skipped': skipped}
+
+
+bank_directory = BankDirectory()
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from payments.retention import WebhookArchiver
+
+
+class Command(BaseCommand):
+    help = "Archives settled webhook events older than the retention window to compressed NDJSON files and deletes them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, help='Retention window in days (default WEBHOOK_RETENTION_DAYS)')
+        parser.add_argument('--archive-dir', type=str, help='Archive root directory (default WEBHOOK_ARCHIVE_DIR)')
+        parser.add_argument('--chunk-size', type=int, help='Events written and deleted per batch')
+        parser.add_argument('--limit', type=int, help='Stop after archiving this many events')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the events that would be archived')
+
+    def handle(self, *args, **options):
+        archiver = WebhookArchiver(
+            retention=timedelta(days=options['older_than_days']) if options['older_than_days'] is not None else None,
+            archive_dir=options['archive_dir'],
+            chunk_size=options['chunk_size'],
+        )
+        if options['dry_run']:
+            self.stdout.write(f"{archiver.expired_queryset().count()} events would be archived to {archiver.archive_dir}")
+            return
+
+        report = archiver.run(limit=options['limit'])
+        self.stdout.write(
+            f"Archived {report.rows} events in {report.elapsed:.2f}s ({report.throughput:.1f}/s): "
+            f"{report.raw_bytes} bytes of NDJSON, {report.bytes_written} bytes written to {report.files} files under {archiver.archive_dir}"
+        )
+        self.stdout.write(self.style.SUCCESS("Archive run finished."))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from payments.outbox import PayoutDispatcher, outbox_metrics
+from payments.payout_profiles import payout_profiles
+
+
+class Command(BaseCommand):
+    help = "Sends queued payouts from the payout outbox. Runs until stopped unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once the outbox has nothing available')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=8, help='Transfers sent concurrently')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--stats', action='store_true', help='Only show outbox depth')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            metrics = outbox_metrics()
+            self.stdout.write(f"Pending: {metrics['pending']}")
+            self.stdout.write(f"Dispatching: {metrics['dispatching']}")
+            self.stdout.write(f"Failed: {metrics['failed']}")
+            self.stdout.write(f"Oldest unsent: {metrics['oldest_unsent_age']:.1f}s")
+            return
+
+        dispatcher = PayoutDispatcher(batch_size=options['batch_size'], workers=options['workers'])
+        totals = dispatcher.run(once=options['once'], poll_interval=options['poll_interval'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {totals['sent']} payouts ({totals['retried']} to retry, {totals['throttled']} throttled, {totals['failed']} failed)."
+        ))
+        profiles = payout_profiles.stats()
+        self.stdout.write(f"Payout profile cache: {profiles['hits']} hits, {profiles['misses']} misses ({profiles['hit_rate']:.0%} hit rate)")
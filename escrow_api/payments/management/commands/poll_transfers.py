@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments.reconciliation import TransferStatusPoller
+
+
+class Command(BaseCommand):
+    help = "Checks sent payouts that are still unconfirmed with their provider and settles the ones that were paid or failed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int, default=getattr(settings, 'TRANSFER_POLL_AFTER_MINUTES', 30),
+            help='Only poll payouts sent more than this many minutes ago',
+        )
+        parser.add_argument('--chunk-size', type=int, default=200, help='Payouts fetched and checked per batch')
+        parser.add_argument('--workers', type=int, default=8, help='Maximum concurrent provider calls')
+        parser.add_argument('--mode', choices=TransferStatusPoller.MODES, default='threads')
+        parser.add_argument('--provider', type=str, help='Only poll payouts of this provider')
+        parser.add_argument('--limit', type=int, help='Stop after checking this many payouts')
+
+    def handle(self, *args, **options):
+        poller = TransferStatusPoller(
+            older_than=timedelta(minutes=options['older_than']),
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            mode=options['mode'],
+            provider_name=options['provider'],
+            backoff=getattr(settings, 'TRANSFER_POLL_BACKOFF', 300),
+            backoff_max=getattr(settings, 'TRANSFER_POLL_BACKOFF_MAX', 6 * 60 * 60),
+        )
+        report = poller.run(limit=options['limit'])
+
+        self.stdout.write(
+            f"Checked {report.scanned} payouts in {report.elapsed:.2f}s ({report.throughput:.1f}/s): "
+            f"{report.resolved} resolved ({report.paid} paid, {report.failed} failed), {report.requeued} sent again, "
+            f"{report.still_pending} still pending"
+        )
+        if report.errors:
+            self.stdout.write(self.style.ERROR(f"{report.errors} payouts could not be checked or settled; they will be retried."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Transfer polling finished without errors."))
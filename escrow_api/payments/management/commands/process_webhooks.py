@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from payments.webhooks import WebhookInboxProcessor
+
+
+class Command(BaseCommand):
+    help = "Processes stored webhook events. Runs until stopped unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once the inbox has nothing available')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=8, help='Escrow groups processed concurrently')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the inbox is empty')
+
+    def handle(self, *args, **options):
+        processor = WebhookInboxProcessor(batch_size=options['batch_size'], workers=options['workers'])
+        totals = processor.run(once=options['once'], poll_interval=options['poll_interval'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {totals['processed']} webhook events "
+            f"({totals['retried']} to retry, {totals['failed']} failed, {totals['deferred']} deferred)."
+        ))
@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from payments.reconciliation import FundingReconciler
+
+
+class Command(BaseCommand):
+    help = "Verifies stale pending funding payments against their provider and completes the ones that were paid."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=15, help='Only reconcile payments older than this many minutes')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Payments fetched and applied per batch')
+        parser.add_argument('--workers', type=int, default=16, help='Maximum concurrent provider calls')
+        parser.add_argument('--mode', choices=FundingReconciler.MODES, default='threads')
+        parser.add_argument('--provider', type=str, help='Only reconcile payments of this provider')
+        parser.add_argument('--limit', type=int, help='Stop after scanning this many payments')
+
+    def handle(self, *args, **options):
+        reconciler = FundingReconciler(
+            older_than=timedelta(minutes=options['older_than']),
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            mode=options['mode'],
+            provider_name=options['provider'],
+        )
+        report = reconciler.run(limit=options['limit'])
+
+        self.stdout.write(
+            f"Scanned {report.scanned} payments in {report.elapsed:.2f}s "
+            f"({report.throughput:.1f}/s): {report.completed} completed, {report.still_pending} still pending"
+        )
+        if report.errors:
+            self.stdout.write(self.style.ERROR(f"{report.errors} payments failed to reconcile."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Reconciliation finished without errors."))
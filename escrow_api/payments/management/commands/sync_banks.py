@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from payments.banks import bank_directory
+
+
+class Command(BaseCommand):
+    help = "Syncs the Chapa bank list into the Bank table."
+
+    def handle(self, *args, **options):
+        result = bank_directory.sync()
+        if result.get('status') == 'success':
+            self.stdout.write(self.style.SUCCESS(
+                f"Synced {result['synced']} banks, deactivated {result['deactivated']}, skipped {result['skipped']}."
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(f"Bank sync failed: {result.get('message')}"))
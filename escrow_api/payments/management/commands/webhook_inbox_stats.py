@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from payments.webhooks import inbox_metrics
+
+
+class Command(BaseCommand):
+    help = "Shows webhook inbox depth and processing lag."
+
+    def handle(self, *args, **options):
+        metrics = inbox_metrics()
+        self.stdout.write(f"Pending: {metrics['pending']}")
+        self.stdout.write(f"Processing: {metrics['processing']}")
+        self.stdout.write(f"Failed: {metrics['failed']}")
+        self.stdout.write(f"Oldest unprocessed: {metrics['oldest_unprocessed_age']:.1f}s")
+        self.stdout.write(f"Lag (last 15 min): avg {metrics['lag_avg']:.3f}s, max {metrics['lag_max']:.3f}s")
@@ -15,6 +15,7 @@ class Payment(models.Model):
     )
 
     STATUS_CHOICES = (
+        ('initiating', 'Initiating'),  # funding reserved locally, provider call not yet committed
         ('pending', 'Pending'),
         ('active', 'Active'),
         ('completed', 'Completed'),
@@ -38,6 +39,37 @@ class Payment(models.Model):
     )
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Escrow payment history, newest first (payments.pagination.EscrowPaymentPagination).
+            models.Index(fields=['escrow', '-timestamp', '-id'], name='payment_escrow_history_idx'),
+            # Webhook, verify and payout confirmation lookups by provider reference.
+            models.Index(fields=['provider_transactionn_id', 'transaction_type', 'provider'], name='payment_provider_ref_idx'),
+            # Release/refund checks: pending payouts, reserved balance, latest completed funding.
+            models.Index(fields=['escrow', 'transaction_type', 'status', 'timestamp'], name='payment_escrow_type_status_idx'),
+            # Finance exports by date range (payments.exports).
+            models.Index(fields=['timestamp', 'id'], name='payment_timestamp_idx'),
+            # Reconciliation and reservation sweeps: funding by status and age. Partial on the
+            # type only, since planners cannot match a status IN (...) condition to status = x.
+            models.Index(
+                fields=['status', 'timestamp'],
+                name='payment_funding_status_idx',
+                condition=models.Q(transaction_type='funding'),
+            ),
+            # Transfer status polling: unconfirmed releases by age.
+            models.Index(
+                fields=['status', 'timestamp'],
+                name='payment_release_status_idx',
+                condition=models.Q(transaction_type='release'),
+            ),
+            # Refund reservation sweep: pending refunds by age.
+            models.Index(
+                fields=['status', 'timestamp'],
+                name='payment_refund_status_idx',
+                condition=models.Q(transaction_type='refund'),
+            ),
+        ]
+
     def __str__(self):
         return f"{self.transaction_type} of {self.amount} for {self.escrow.project}"
 
@@ -125,6 +157,8 @@ class Bank(models.Model):
     country = models.CharField(max_length=10, default='ET', help_text="Country code")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, help_text="Last time the bank was synced from Chapa")
+    details = models.JSONField(default=dict, blank=True, help_text="Bank entry as returned by Chapa, served unchanged by the banks endpoint")
     
     class Meta:
         verbose_name = "Bank"
@@ -136,11 +170,69 @@ class Bank(models.Model):
 
 class WebhookEvent(models.Model):
     """
-    Stores processed webhook event IDs to ensure idempotency.
+    Webhook inbox. Every delivery is stored here before it is acknowledged;
+    the unique event_id makes duplicate deliveries fail on insert.
+    Rows are processed asynchronously by payments.webhooks.WebhookInboxProcessor.
     """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+    )
+
     provider = models.CharField(max_length=50)
     event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100, blank=True)
+    reference = models.CharField(max_length=255, blank=True, help_text="Provider transaction/transfer reference the event is about")
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
     received_at = models.DateTimeField(auto_now_add=True)
+    locked_until = models.DateTimeField(null=True, blank=True, help_text="Claim expiry while processing, retry time while pending")
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='webhook_inbox_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.provider}:{self.event_id}"
+
+
+class PayoutOutbox(models.Model):
+    """
+    Payout outbox. A row is written in the same transaction as the pending
+    release payments, so a recorded release always has its transfer queued.
+    Rows are sent to the provider by payments.outbox.PayoutDispatcher, which
+    reuses idempotency_key on every attempt so a retried transfer is paid once.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('dispatching', 'Dispatching'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+
+    payment = models.OneToOneField(Payment, on_delete=models.CASCADE, related_name='outbox')
+    provider = models.CharField(max_length=50)
+    idempotency_key = models.CharField(max_length=255, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    provider_reference = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    locked_until = models.DateTimeField(null=True, blank=True, help_text="Claim expiry while dispatching, retry time while pending")
+    sent_at = models.DateTimeField(null=True, blank=True)
+    status_checks = models.PositiveIntegerField(default=0, help_text="Provider status checks made while the sent payout awaited confirmation")
+    next_status_check_at = models.DateTimeField(null=True, blank=True, help_text="Earliest time payments.reconciliation.TransferStatusPoller checks the payout again")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='payout_outbox_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider}:{self.idempotency_key}"
@@ -0,0 +1,284 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .models import PayoutOutbox
+from .providers.ratelimit import RateLimitExceeded
+from .reconciliation import TRANSFER_NOT_FOUND_STATUSES, TransferStatusPoller
+from .services import PaymentService
+
+logger = logging.getLogger(__name__)
+
+# Shortest wait before a throttled payout is tried again, whatever the limiter suggested.
+THROTTLE_MIN_DELAY = 1
+
+
+class PayoutDispatcher:
+    """
+    Drains the payout outbox.
+
+    Claimed rows are sent on a thread pool, with at most
+    PAYOUT_DISPATCHER_CONCURRENCY[provider] transfers in flight per provider
+    ('default' for providers not listed). Every attempt for a row passes the
+    same idempotency key, so a retry after a timeout or crash cannot pay twice.
+
+    A transfer whose outcome is unknown (timeout, duplicate reference) is
+    treated as sent and left to the webhook or TransferStatusPoller. Before
+    every retry the provider is asked whether an earlier attempt's transfer
+    exists. Once max_attempts are spent, the release reservation is cancelled
+    only when the provider confirms there is no transfer; while that cannot
+    be established the row stays queued and is checked again. A call held
+    back by the provider rate limit is rescheduled without using an attempt.
+
+    Args:
+        batch_size: Rows claimed per batch
+        workers: Transfers sent concurrently across all providers
+        max_attempts: Attempts before a payout is given up on
+        claim_timeout: Seconds after which a 'dispatching' row is assumed abandoned
+        retry_backoff: Base delay in seconds before a failed transfer is retried
+        retry_backoff_max: Upper bound for that delay
+    """
+
+    def __init__(self, *, batch_size=100, workers=8, max_attempts=5, claim_timeout=300, retry_backoff=5, retry_backoff_max=60 * 60,
+                 escrow_service=None, payment_service=None):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.claim_timeout = claim_timeout
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.payment_service = payment_service or PaymentService()
+
+        if escrow_service is None:
+            from escrow.services import EscrowService
+            escrow_service = EscrowService()
+        self.escrow_service = escrow_service
+
+        self._limits = getattr(settings, 'PAYOUT_DISPATCHER_CONCURRENCY', {})
+        self._semaphores = {}
+        self._semaphores_lock = threading.Lock()
+
+    def _provider_slot(self, provider):
+        with self._semaphores_lock:
+            if provider not in self._semaphores:
+                limit = self._limits.get(provider, self._limits.get('default', self.workers))
+                self._semaphores[provider] = threading.BoundedSemaphore(max(1, limit))
+            return self._semaphores[provider]
+
+    def claim(self, ids=None):
+        """
+        Lock the next batch of available payouts for dispatch.
+
+        Pending rows whose retry delay has passed and 'dispatching' rows whose
+        claim expired (crashed dispatcher) are both available.
+
+        Args:
+            ids: Only consider these outbox rows
+
+        Returns:
+            List of PayoutOutbox in id order
+        """
+        now = timezone.now()
+        available = Q(status__in=['pending', 'dispatching']) & (Q(locked_until__isnull=True) | Q(locked_until__lte=now))
+        with transaction.atomic():
+            queryset = PayoutOutbox.objects.select_for_update(skip_locked=True).filter(available)
+            if ids is not None:
+                queryset = queryset.filter(id__in=ids)
+            claimed = list(queryset.order_by('id').values_list('id', flat=True)[:self.batch_size])
+            PayoutOutbox.objects.filter(id__in=claimed).update(
+                status='dispatching',
+                locked_until=now + timedelta(seconds=self.claim_timeout),
+            )
+        return list(
+            PayoutOutbox.objects.filter(id__in=claimed)
+            .select_related('payment__escrow__project__freelancer')
+            .order_by('id')
+        )
+
+    def process_batch(self, ids=None):
+        """
+        Claim and dispatch one batch.
+
+        Returns:
+            Dict of counts for the batch
+        """
+        rows = self.claim(ids)
+        counts = {'claimed': len(rows), 'sent': 0, 'retried': 0, 'throttled': 0, 'failed': 0}
+        if not rows:
+            return counts
+
+        if len(rows) <= 1 or self.workers <= 1:
+            results = [self._dispatch_safely(row) for row in rows]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(rows)), thread_name_prefix='payout-outbox') as executor:
+                results = list(executor.map(self._dispatch_in_thread, rows))
+
+        for result in results:
+            counts[result] += 1
+        return counts
+
+    def run(self, *, once=False, poll_interval=1.0):
+        """
+        Dispatch batches until nothing is available (once=True) or forever.
+
+        Returns:
+            Dict of counts summed over all batches (once=True only)
+        """
+        totals = {'claimed': 0, 'sent': 0, 'retried': 0, 'throttled': 0, 'failed': 0}
+        while True:
+            counts = self.process_batch()
+            for key, value in counts.items():
+                totals[key] += value
+            if not counts['claimed']:
+                if once:
+                    return totals
+                time.sleep(poll_interval)
+
+    def _dispatch_in_thread(self, row):
+        try:
+            return self._dispatch_safely(row)
+        finally:
+            connection.close()
+
+    def _dispatch_safely(self, row):
+        # One row's bookkeeping failing must not abort the rest of the batch;
+        # its claim expires and it is picked up again.
+        try:
+            return self._dispatch(row)
+        except Exception as e:
+            logger.error(f"Payout {row.idempotency_key} could not be dispatched: {str(e)}")
+            return 'retried'
+
+    def _dispatch(self, row):
+        payment = row.payment
+        row.attempts += 1
+        try:
+            if payment.status == 'completed':
+                # Sent before a crash and already confirmed by webhook.
+                row.status = 'sent'
+                row.locked_until = None
+                row.save(update_fields=['status', 'attempts', 'locked_until'])
+                return 'sent'
+            if payment.status != 'pending':
+                # Cancelled or failed some other way; never send it.
+                row.status = 'failed'
+                row.last_error = f'Release payment is {payment.status}'
+                row.locked_until = None
+                row.save(update_fields=['status', 'attempts', 'last_error', 'locked_until'])
+                return 'failed'
+
+            if row.attempts > 1:
+                # An earlier attempt may have reached the provider even though it looked failed.
+                exists = self._transfer_exists(row)
+                if exists:
+                    return self._sent(row, payment, {'reference': row.idempotency_key})
+                if row.attempts > self.max_attempts:
+                    if exists is False:
+                        return self._give_up(row, payment)
+                    raise RuntimeError(f'Transfer state unknown after {self.max_attempts} attempts; checking again later')
+
+            project = payment.escrow.project
+            with self._provider_slot(row.provider):
+                result = self.payment_service.transfer_to_freelancer(
+                    freelancer=project.freelancer,
+                    amount=payment.amount,
+                    provider_name=row.provider,
+                    project_title=project.title,
+                    reference=row.idempotency_key,
+                    idempotency_key=row.idempotency_key,
+                )
+            if result.get('status') == 'throttled':
+                raise RateLimitExceeded(row.provider, 'transfer', result.get('retry_after') or 0)
+            if result.get('status') == 'unconfirmed':
+                # Timed out or rejected as a duplicate reference: the provider may hold the
+                # transfer, so it is left to the webhook or TransferStatusPoller to settle.
+                row.last_error = result.get('message') or 'Transfer unconfirmed'
+                return self._sent(row, payment, {'reference': row.idempotency_key, **result})
+            if result.get('status') != 'success':
+                raise RuntimeError(result.get('message') or 'Transfer initiation failed')
+            row.last_error = ''
+            return self._sent(row, payment, result)
+        except RateLimitExceeded as e:
+            # Held back by the provider quota before reaching the provider: not an attempt.
+            row.attempts -= 1
+            row.status = 'pending'
+            row.last_error = str(e)
+            row.locked_until = timezone.now() + timedelta(seconds=max(e.retry_after, THROTTLE_MIN_DELAY))
+            row.save(update_fields=['status', 'attempts', 'last_error', 'locked_until'])
+            return 'throttled'
+        except Exception as e:
+            logger.error(f"Payout {row.idempotency_key} failed (attempt {row.attempts}): {str(e)}")
+            row.last_error = str(e)
+            # Out of attempts, the next dispatch only asks the provider whether the transfer exists.
+            row.status = 'pending'
+            delay = min(self.retry_backoff_max, self.retry_backoff * 2 ** (min(row.attempts, self.max_attempts) - 1))
+            row.locked_until = timezone.now() + timedelta(seconds=delay)
+            row.save(update_fields=['status', 'attempts', 'last_error', 'locked_until'])
+            return 'retried'
+
+    def _transfer_exists(self, row):
+        """
+        Returns:
+            True if the provider holds a live or paid transfer under the row's
+            idempotency key, False if it has none or it failed, None if unknown
+        """
+        try:
+            result = self.payment_service.get_transfer_status(
+                provider_name=row.provider,
+                transfer_reference=row.idempotency_key,
+            )
+        except Exception as e:
+            logger.error(f"Transfer status check for payout {row.idempotency_key} failed: {str(e)}")
+            return None
+        status_value = str(result.get('status') or '').lower()
+        if status_value == 'throttled':
+            raise RateLimitExceeded(row.provider, 'transfer_status', result.get('retry_after') or 0)
+        if status_value in TRANSFER_NOT_FOUND_STATUSES:
+            return False
+        outcome = TransferStatusPoller.outcome(result)
+        if outcome is None:
+            # In flight counts as existing; an error tells us nothing.
+            return None if status_value in ('error', '') else True
+        return outcome
+
+    def _sent(self, row, payment, result):
+        row.provider_reference = self.escrow_service.record_payout_sent(payment.id, result)
+        row.status = 'sent'
+        row.sent_at = timezone.now()
+        row.locked_until = None
+        row.save(update_fields=['status', 'attempts', 'last_error', 'provider_reference', 'sent_at', 'locked_until'])
+        return 'sent'
+
+    def _give_up(self, row, payment):
+        # The provider confirmed it holds no transfer, so the reservation can be released.
+        self.escrow_service.cancel_release(payment.id)
+        row.status = 'failed'
+        row.locked_until = None
+        row.save(update_fields=['status', 'attempts', 'last_error', 'locked_until'])
+        logger.warning(f"Payout {row.idempotency_key} given up after {row.attempts - 1} attempts: {row.last_error}")
+        return 'failed'
+
+
+def outbox_metrics() -> dict:
+    """
+    Outbox depth per status and the age in seconds of the oldest unsent payout.
+    """
+    depth = {
+        row['status']: row['count']
+        for row in PayoutOutbox.objects.filter(status__in=['pending', 'dispatching', 'failed'])
+        .values('status').annotate(count=Count('id'))
+    }
+    oldest = PayoutOutbox.objects.filter(status__in=['pending', 'dispatching']).aggregate(oldest=Min('created_at'))['oldest']
+    return {
+        'pending': depth.get('pending', 0),
+        'dispatching': depth.get('dispatching', 0),
+        'failed': depth.get('failed', 0),
+        'oldest_unsent_age': (timezone.now() - oldest).total_seconds() if oldest else 0.0,
+    }
@@ -0,0 +1,92 @@
+import base64
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class EscrowPaymentPagination(BasePagination):
+    """
+    Keyset pagination over (timestamp, id), newest first.
+
+    The cursor is the (timestamp, id) of the last row served, so every page is
+    one range scan on payment_escrow_history_idx however deep the history is.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        """
+        Returns:
+            (timestamp, id) of the last row of the previous page, or None
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            timestamp, pk = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii').rsplit('|', 1)
+            timestamp = parse_datetime(timestamp)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if timestamp is None:
+            raise NotFound(self.invalid_cursor_message)
+        return timestamp, pk
+
+    @staticmethod
+    def encode_cursor(payment):
+        return base64.urlsafe_b64encode(f"{payment.timestamp.isoformat()}|{payment.id}".encode('ascii')).decode('ascii')
+
+    @staticmethod
+    def after(queryset, position):
+        """Rows strictly after position in (-timestamp, -id) order."""
+        if position is None:
+            return queryset.order_by('-timestamp', '-id')
+        timestamp, pk = position
+        return queryset.filter(
+            Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk)
+        ).order_by('-timestamp', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        rows = list(self.after(queryset, self.decode_cursor(request))[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page = rows[:page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
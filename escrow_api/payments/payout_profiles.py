@@ -0,0 +1,134 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import PayoutMethod
+
+logger = logging.getLogger(__name__)
+
+
+def build_payout_profile(user_id, provider_name):
+    """
+    Resolve a freelancer's preferred payout details for a provider with one query.
+
+    Returns:
+        Dict of provider-specific transfer details, or None if the freelancer cannot be paid
+    """
+    payout_method = (
+        PayoutMethod.objects.select_related('chapa_details', 'stripe_details')
+        .filter(user_id=user_id, provider=provider_name, is_active=True)
+        .order_by('-is_default', '-created_at')
+        .first()
+    )
+    if not payout_method:
+        return None
+
+    if provider_name == 'chapa':
+        details = getattr(payout_method, 'chapa_details', None)
+        if not details:
+            return None
+        return {
+            'account_name': details.account_name,
+            'account_number': details.account_number,
+            'bank_code': details.bank_code,
+            'bank_name': details.bank_name,
+        }
+    if provider_name == 'stripe':
+        details = getattr(payout_method, 'stripe_details', None)
+        if not details or not details.payouts_enabled:
+            return None
+        return {
+            'stripe_account_id': details.stripe_account_id,
+            'user_id': str(user_id),
+        }
+    return None
+
+
+class PayoutProfileCache:
+    """
+    Resolved payout profiles keyed by (user, provider).
+
+    Profiles live in the PAYOUT_PROFILE_CACHE Django cache for
+    PAYOUT_PROFILE_CACHE_TTL seconds, so repeated milestone releases to the
+    same freelancer skip the lookup. "No usable payout method" is cached too.
+    Saves and deletes of PayoutMethod and its provider details invalidate
+    the entry, and the entry under a method's previous provider when that
+    changes (payments/signals.py), immediately and again on commit, so a
+    reader cannot re-cache the pre-commit state. Writes that bypass signals
+    (QuerySet.update) are bounded by the TTL.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'PAYOUT_PROFILE_CACHE', 'default')]
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'PAYOUT_PROFILE_CACHE_TTL', 300)
+
+    @staticmethod
+    def _key(user_id, provider_name):
+        return f'payout-profile:{provider_name}:{user_id}'
+
+    def get(self, user_id, provider_name):
+        key = self._key(user_id, provider_name)
+        try:
+            entry = self.cache.get(key)
+        except Exception as e:
+            logger.error(f"Payout profile cache lookup failed: {str(e)}")
+            entry = None
+
+        if entry is not None:
+            self._count(hit=True)
+            return entry['profile']
+
+        self._count(hit=False)
+        profile = build_payout_profile(user_id, provider_name)
+        try:
+            self.cache.set(key, {'profile': profile}, self.ttl)
+        except Exception as e:
+            logger.error(f"Payout profile cache write failed: {str(e)}")
+        return profile
+
+    def invalidate(self, user_id, provider_name):
+        key = self._key(user_id, provider_name)
+
+        def delete():
+            try:
+                self.cache.delete(key)
+            except Exception as e:
+                logger.error(f"Payout profile cache invalidation failed: {str(e)}")
+
+        delete()
+        transaction.on_commit(delete)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def _count(self, *, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+payout_profiles = PayoutProfileCache()
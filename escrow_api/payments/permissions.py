@@ -1,5 +1,7 @@
 from rest_framework.permissions import BasePermission
 
+from accounts.roles import request_role
+
 
 class IsOwnerClient(BasePermission):
     """Allow only the project client to act on escrow/payment objects."""
@@ -12,5 +14,14 @@ class IsOwnerClient(BasePermission):
 class IsModerator(BasePermission):
     """Placeholder for moderator role; integrate with your groups/permissions."""
     def has_permission(self, request, view):
-        return request.user and request.user.is_staff
+        return bool(request_role(request, 'is_staff'))
+
 
+class IsEscrowParticipant(BasePermission):
+    """Allow the project client, the assigned freelancer and staff to view an escrow."""
+    def has_object_permission(self, request, view, obj):
+        if request.user.is_staff:
+            return True
+        escrow = getattr(obj, 'escrow', obj)
+        project = escrow.project
+        return request.user.id in (project.client_id, project.freelancer_id)
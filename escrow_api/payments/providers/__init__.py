@@ -1,23 +1,93 @@
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
 from .base import BasePaymentProvider
 from .chapa import ChapaProvider
+from .fake import FakeProvider
+from .ratelimit import provider_rate_limiter
+from .stripe import StripeProvider
+
+PROVIDER_CLASSES = {
+    'chapa': ChapaProvider,
+    'stripe': StripeProvider,
+}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def register_payment_provider(provider_name: str, provider_class):
+    """
+    Register a provider class under a name usable by get_payment_provider.
+    """
+    with _instances_lock:
+        PROVIDER_CLASSES[provider_name] = provider_class
+        for key in [key for key in _instances if key[0] == provider_name]:
+            del _instances[key]
+
+
+def _config_key(kwargs) -> tuple:
+    return tuple(sorted((key, repr(value)) for key, value in kwargs.items()))
+
 
 def get_payment_provider(provider_name: str, **kwargs) -> BasePaymentProvider:
     """
-    Factory function to get payment provider instances.
-    
+    Return the shared payment provider instance for a name and configuration.
+
+    Instances are built lazily, once per (provider_name, kwargs) and reused by
+    every caller in the process. Providers must therefore be thread-safe and
+    keep no per-request state.
+
     Args:
         provider_name: Name of the payment provider
         **kwargs: Additional configuration
-        
+
     Returns:
         BasePaymentProvider: Payment provider instance
     """
-    providers = {
-        'chapa': ChapaProvider,
-        # other providers ...
-    }
-    
-    if provider_name not in providers:
+    provider_class = PROVIDER_CLASSES.get(provider_name)
+    if provider_class is None:
         raise ValueError(f"Unknown payment provider: {provider_name}")
-    
-    return providers[provider_name](**kwargs)
\ No newline at end of file
+
+    key = (provider_name, _config_key(kwargs))
+    instance = _instances.get(key)
+    if instance is None:
+        with _instances_lock:
+            instance = _instances.get(key)
+            if instance is None:
+                instance = provider_class(**kwargs)
+                _instances[key] = instance
+    return instance
+
+
+def _sync_fake_provider():
+    """The fake provider is only resolvable while PAYMENT_FAKE_PROVIDER_ENABLED is set."""
+    if getattr(settings, 'PAYMENT_FAKE_PROVIDER_ENABLED', False):
+        register_payment_provider('fake', FakeProvider)
+    else:
+        with _instances_lock:
+            PROVIDER_CLASSES.pop('fake', None)
+
+
+_sync_fake_provider()
+
+
+def reset_payment_providers():
+    """
+    Drop every cached provider instance, shared transport and local rate limit bucket.
+    Intended for tests and settings overrides.
+    """
+    with _instances_lock:
+        _instances.clear()
+    ChapaProvider.reset_shared_transport()
+    provider_rate_limiter.reset()
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(sender, setting, **kwargs):
+    if setting.startswith(('CHAPA_', 'STRIPE_', 'PAYMENT')):
+        reset_payment_providers()
+        _sync_fake_provider()
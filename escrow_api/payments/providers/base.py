@@ -1,6 +1,8 @@
 import uuid
 from abc import ABC, abstractmethod
 
+from asgiref.sync import sync_to_async
+
 class BasePaymentProvider(ABC):
     """
     Abstract base class for all payment providers.
@@ -89,4 +91,49 @@ class BasePaymentProvider(ABC):
         Returns:
             Dict containing processing result
         """
-        return {"status": "processed"}
\ No newline at end of file
+        return {"status": "processed"}
+
+    def get_refund_status(self, provider_transaction_id, refund_reference):
+        """
+        Look up a refund by the reference it was requested with (optional implementation).
+
+        Args:
+            provider_transaction_id: Original transaction ID the refund was made against
+            refund_reference: Reference passed to refund()
+
+        Returns:
+            Dict with status 'success', 'failed', 'not_found', or 'error' when the
+            provider cannot say
+        """
+        return {'status': 'error', 'message': 'Refund lookup is not supported by this provider'}
+
+    # Async interface. Providers with a native asyncio client override these;
+    # the defaults run the sync implementation in a worker thread.
+
+    async def acharge(self, user, amount, **kwargs):
+        """Async counterpart of charge()."""
+        return await sync_to_async(self.charge, thread_sensitive=False)(user, amount, **kwargs)
+
+    async def averify(self, provider_transaction_id: str) -> bool:
+        """Async counterpart of verify()."""
+        return await sync_to_async(self.verify, thread_sensitive=False)(provider_transaction_id)
+
+    async def arefund(self, provider_transaction_id, amount, reason="Project refund", **kwargs):
+        """Async counterpart of refund()."""
+        return await sync_to_async(self.refund, thread_sensitive=False)(provider_transaction_id, amount, reason, **kwargs)
+
+    async def atransfer_to_account(self, recipient, amount, **kwargs):
+        """Async counterpart of transfer_to_account()."""
+        return await sync_to_async(self.transfer_to_account, thread_sensitive=False)(recipient, amount, **kwargs)
+
+    async def aget_transfer_status(self, transfer_reference: str) -> dict:
+        """Async counterpart of get_transfer_status()."""
+        return await sync_to_async(self.get_transfer_status, thread_sensitive=False)(transfer_reference)
+
+    async def aclose(self):
+        """
+        Close the async clients bound to the running event loop (optional implementation).
+
+        Callers that run their own short-lived loop call this before closing it.
+        """
+        pass
@@ -1,27 +1,164 @@
+import httpx
 import requests
 import json
 import environ
-import os
 import logging
+import threading
 from .base import BasePaymentProvider
+from .ratelimit import RateLimitExceeded, throttled_result
+from .transport import AsyncHttpTransport, HttpTransport
 from django.conf import settings
 import uuid
-import http.client
 
 logger = logging.getLogger(__name__)
 
+# settings.py has already loaded .env into the process environment.
 env = environ.Env()
-BASE_DIR = settings.BASE_DIR
-environ.Env.read_env(os.path.join(BASE_DIR, '.env'))
+
+# (connect, read) timeouts in seconds per Chapa endpoint.
+# Override per endpoint through settings.CHAPA_HTTP_TRANSPORT['timeouts'].
+CHAPA_ENDPOINT_TIMEOUTS = {
+    'charge': (3.05, 20),
+    'verify': (3.05, 10),
+    'refund': (3.05, 20),
+    'transfer': (3.05, 30),
+    'transfer_status': (3.05, 10),
+    'verify_transfer': (3.05, 10),
+    'banks': (3.05, 10),
+}
+
 
 class ChapaProvider(BasePaymentProvider):
 
+    _shared_transport = None
+    _shared_async_transport = None
+    _transport_lock = threading.Lock()
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.secret_key = env('CHAPA_SECRET_KEY')
         self.base_url = "https://api.chapa.co/v1"
         self.callback_url = env('CHAPA_CALLBACK_URL')
         self.return_url = env('CHAPA_RETURN_URL', default='http://localhost:3000/payment/success')
+        self.transport = kwargs.get('transport') or self.get_shared_transport()
+        self.async_transport = kwargs.get('async_transport') or self.get_shared_async_transport()
+
+    @staticmethod
+    def _transport_options():
+        options = dict(getattr(settings, 'CHAPA_HTTP_TRANSPORT', {}))
+        options['timeouts'] = {**CHAPA_ENDPOINT_TIMEOUTS, **options.get('timeouts', {})}
+        options.setdefault('rate_limit_scope', 'chapa')
+        return options
+
+    @classmethod
+    def get_shared_transport(cls) -> HttpTransport:
+        """
+        Return the process-wide pooled transport, creating it on first use.
+        """
+        if cls._shared_transport is None:
+            with cls._transport_lock:
+                if cls._shared_transport is None:
+                    cls._shared_transport = HttpTransport(**cls._transport_options())
+        return cls._shared_transport
+
+    @classmethod
+    def get_shared_async_transport(cls) -> AsyncHttpTransport:
+        """
+        Return the process-wide asyncio transport, creating it on first use.
+        """
+        if cls._shared_async_transport is None:
+            with cls._transport_lock:
+                if cls._shared_async_transport is None:
+                    cls._shared_async_transport = AsyncHttpTransport(**cls._transport_options())
+        return cls._shared_async_transport
+
+    @classmethod
+    def reset_shared_transport(cls):
+        with cls._transport_lock:
+            if cls._shared_transport is not None:
+                cls._shared_transport.close()
+            cls._shared_transport = None
+            cls._shared_async_transport = None
+
+    def _headers(self, content_type=None):
+        headers = {'Authorization': f'Bearer {self.secret_key}'}
+        if content_type:
+            headers['Content-Type'] = content_type
+        return headers
+
+    def _charge_payload(self, user, amount, tx_ref, **kwargs):
+        return {
+            "amount": str(amount),
+            "currency": "ETB",
+            "email": user.email,
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "phone_number": user.phone_number or "",
+            "tx_ref": tx_ref,
+            "callback_url": self.callback_url,
+            "return_url": self.return_url,
+            "customization": {
+                "title": "Escrow Fund",
+                "description": f"Funding escrow for project - {kwargs.get('project_title', 'Unknown Project')}"
+            }
+        }
+
+    def _refund_form(self, provider_transaction_id, original_transaction, amount, reason, reference=None):
+        """Return (amount, form_data) for the refund endpoint, which expects form encoding."""
+        if amount is None:
+            amount = original_transaction.get('data', {}).get('amount', 0)
+        customer_id = original_transaction.get('data', {}).get('customer', {}).get('email', '')
+        reference = reference or f'REF-{provider_transaction_id}'
+        form_data = f"reason={reason}&amount={amount}&meta[customer_id]={customer_id}&meta[reference]={reference}&meta[escrow_refund]=true"
+        return amount, form_data
+
+    def _transfer_payload(self, recipient, amount, transfer_ref):
+        return {
+            "account_name": recipient['account_name'],
+            "account_number": recipient['account_number'],
+            "amount": str(amount),
+            "currency": "ETB",
+            "reference": transfer_ref,
+            "bank_code": int(recipient['bank_code'])
+        }
+
+    @staticmethod
+    def _is_duplicate_reference(response):
+        """Chapa answers a transfer whose reference it has already seen with a 4xx naming the reference."""
+        if response.status_code not in (400, 409, 422):
+            return False
+        try:
+            message = json.dumps(response.json()).lower()
+        except ValueError:
+            return False
+        return 'reference' in message and any(word in message for word in ('exist', 'duplicate', 'already', 'used'))
+
+    @staticmethod
+    def _transfer_unconfirmed(transfer_ref, amount, reason):
+        # The transfer may exist on Chapa's side; callers must not treat it as failed.
+        logger.warning(f"Chapa transfer {transfer_ref} unconfirmed: {reason}")
+        return {
+            'status': 'unconfirmed',
+            'reference': transfer_ref,
+            'amount': str(amount),
+            'message': f'Transfer outcome unknown ({reason}); awaiting confirmation',
+        }
+
+    @staticmethod
+    def _refund_unconfirmed(tx_ref, reference, amount, reason):
+        # The refund request went out but its answer is missing; it may have been made.
+        logger.warning(f"Chapa refund {reference or tx_ref} unconfirmed: {reason}")
+        return {
+            'status': 'unconfirmed',
+            'reference': reference,
+            'amount': amount,
+            'original_tx_ref': tx_ref,
+            'message': f'Refund outcome unknown ({reason}); awaiting confirmation',
+        }
+
+    def transport_stats(self) -> dict:
+        """Per-endpoint call counts and latency for the transport in use."""
+        return self.transport.stats()
 
     def charge(self, user, amount, **kwargs):
         """
@@ -37,32 +174,14 @@ class ChapaProvider(BasePaymentProvider):
         """
         try:
             url = f"{self.base_url}/transaction/initialize"
-            tx_ref = f'escrow-fund-{uuid.uuid4().hex[:10]}'
-            
-            payload = {
-                "amount": str(amount),
-                "currency": "ETB",
-                "email": user.email,
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "phone_number": user.phone_number or "",
-                "tx_ref": tx_ref,
-                "callback_url": self.callback_url,
-                "return_url": self.return_url,
-                "customization": {
-                    "title": "Escrow Fund",
-                    "description": f"Funding escrow for project - {kwargs.get('project_title', 'Unknown Project')}"
-                }
-            }
-            
-            headers = {
-                'Authorization': f'Bearer {self.secret_key}',
-                'Content-Type': 'application/json'
-            }
+            # A caller-supplied tx_ref lets the caller record the charge before it exists.
+            tx_ref = kwargs.pop('tx_ref', None) or f'escrow-fund-{uuid.uuid4().hex[:10]}'
+            payload = self._charge_payload(user, amount, tx_ref, **kwargs)
+            headers = self._headers('application/json')
             
             logger.info(f"Initiating Chapa payment for user {user.email}, amount: {amount}")
             
-            response = requests.post(url, json=payload, headers=headers)
+            response = self.transport.request('charge', 'POST', url, json=payload, headers=headers)
             response.raise_for_status()
             
             data = response.json()
@@ -79,6 +198,8 @@ class ChapaProvider(BasePaymentProvider):
                 'message': 'Payment initiation failed',
                 'error': str(e)
             }
+        except RateLimitExceeded as e:
+            return throttled_result(e)
         except Exception as e:
             logger.error(f"Unexpected error in Chapa charge: {str(e)}")
             return {
@@ -106,7 +227,7 @@ class ChapaProvider(BasePaymentProvider):
 
             logger.info(f"Verifying Chapa Payment: {provider_transaction_id}")
 
-            response = requests.get(url, headers=headers, data=payload)
+            response = self.transport.request('verify', 'GET', url, headers=headers, data=payload)
             data = response.json()
             is_successful = data.get('status') == 'success'
 
@@ -119,16 +240,18 @@ class ChapaProvider(BasePaymentProvider):
             logger.error(f"Unexpected error in Chapa verify: {str(e)}")
             return False
     
-    def refund(self, provider_transaction_id, amount=None, reason="Project refund"):
+    def refund(self, provider_transaction_id, amount=None, reason="Project refund", **kwargs):
         """
         Process a refund.
 
         Args:
             provider_transaction_id: Transaction reference
             amount: Amount to refund (not morethan funded amount.)
+            **kwargs: 'reference' is sent as the refund's meta reference if given
         
         Returns:
-            Dict containing refund initiation response
+            Dict containing refund initiation response. Status 'unconfirmed' means
+            the refund request got no answer and may have been made.
         """
         # Refund may not be instant. Chapa may return status: "pending". You should:
         # Mark refund Payment as "pending" in DB.
@@ -141,7 +264,7 @@ class ChapaProvider(BasePaymentProvider):
             }
 
             # OG transaction detail
-            verify_response = requests.get(verification_url, headers=headers)
+            verify_response = self.transport.request('verify', 'GET', verification_url, headers=headers)
             verify_response.raise_for_status()
             original_transaction = verify_response.json()
             
@@ -153,31 +276,18 @@ class ChapaProvider(BasePaymentProvider):
                 }
             
             refund_url = f"{self.base_url}/refund/{provider_transaction_id}"
-            
-            if amount is None:
-                amount = original_transaction.get('data', {}).get('amount', 0)
-            
-            payload = {
-                'reason': reason,
-                'amount': str(amount) if amount else None,
-                'meta': {
-                    'customer_id': original_transaction.get('data', {}).get('customer', {}).get('email', ''),
-                    'reference': f'REF-{provider_transaction_id}',
-                }
-            }
-            
-            # Convert payload to form data as required by Chapa API
-            form_data = f"reason={reason}&amount={amount}&meta[customer_id]={payload['meta']['customer_id']}&meta[reference]={payload['meta']['reference']}&meta[escrow_refund]=true"
-            
-            refund_headers = {
-                'Content-Type': 'application/x-www-form-urlencoded',
-                'Authorization': f'Bearer {self.secret_key}'
-            }
+            amount, form_data = self._refund_form(
+                provider_transaction_id, original_transaction, amount, reason, kwargs.get('reference'),
+            )
+            refund_headers = self._headers('application/x-www-form-urlencoded')
             
             logger.info(f"Initiating Chapa refund for tx_ref: {provider_transaction_id}, amount: {amount}")
             
             # Make refund request
-            refund_response = requests.post(refund_url, data=form_data, headers=refund_headers)
+            try:
+                refund_response = self.transport.request('refund', 'POST', refund_url, data=form_data, headers=refund_headers)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                return self._refund_unconfirmed(provider_transaction_id, kwargs.get('reference'), amount, str(e))
             refund_response.raise_for_status()
             
             refund_data = refund_response.json()
@@ -207,6 +317,8 @@ class ChapaProvider(BasePaymentProvider):
                 'message': 'Invalid transaction data',
                 'error': f'Missing field: {str(e)}'
             }
+        except RateLimitExceeded as e:
+            return throttled_result(e)
         except Exception as e:
             logger.error(f"Unexpected error in Chapa refund: {str(e)}")
             return {
@@ -231,7 +343,7 @@ class ChapaProvider(BasePaymentProvider):
                 'Authorization': f'Bearer {self.secret_key}'
             }
             
-            response = requests.get(url, headers=headers)
+            response = self.transport.request('verify', 'GET', url, headers=headers)
             response.raise_for_status()
             
             data = response.json()
@@ -248,39 +360,25 @@ class ChapaProvider(BasePaymentProvider):
         Args:
             recipient: Dict containing recipient payment method info
             amount: Amount to transfer
-            **kwargs: Additional parameters
+            **kwargs: Additional parameters; 'reference' is used as the transfer reference if given
             
         Returns:
-            Dict containing transfer response
+            Dict containing transfer response. Status 'unconfirmed' means the
+            request timed out or the reference was already used, so the
+            transfer may exist: check get_transfer_status before retrying.
         """
         try:
             url = f"{self.base_url}/transfers"
-            transfer_ref = f"freelancer-payment-{uuid.uuid4().hex[:10]}"
-            
-            payload = {
-                "account_name": recipient['account_name'],
-                "account_number": recipient['account_number'],
-                "amount": str(amount),
-                "currency": "ETB",
-                "reference": transfer_ref,
-                "bank_code": int(recipient['bank_code'])
-            }
-            
-            headers = {
-                'Authorization': f'Bearer {self.secret_key}',
-                'Content-Type': 'application/json'
-            }
-            
-            logger.info(f"Initiating Chapa transfer: {amount} to {recipient.get('email', 'saved_method')}")
-            
-            response = requests.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            
-            data = response.json()
+            # Chapa rejects a reused reference, so a caller-supplied one makes retries idempotent.
+            transfer_ref = kwargs.get('reference') or f"freelancer-payment-{uuid.uuid4().hex[:10]}"
+            payload = self._transfer_payload(recipient, amount, transfer_ref)
+            headers = self._headers('application/json')
             
             logger.info(f"Initiating Chapa transfer: {amount} ETB to {recipient['account_name']} ({recipient['account_number']})")
 
-            response = requests.post(url, json=payload, headers=headers)
+            response = self.transport.request('transfer', 'POST', url, json=payload, headers=headers)
+            if self._is_duplicate_reference(response):
+                return self._transfer_unconfirmed(transfer_ref, amount, 'duplicate reference')
             response.raise_for_status()
             
             data = response.json()
@@ -296,6 +394,9 @@ class ChapaProvider(BasePaymentProvider):
                 'message': 'Transfer initiated successfully'
             }
             
+        except requests.exceptions.ReadTimeout:
+            # The request went out; only the answer is missing.
+            return self._transfer_unconfirmed(transfer_ref, amount, 'timed out')
         except requests.exceptions.RequestException as e:
             logger.error(f"Chapa transfer API request failed: {str(e)}")
             return {
@@ -303,6 +404,8 @@ class ChapaProvider(BasePaymentProvider):
                 'message': 'Transfer request failed',
                 'error': str(e)
             }
+        except RateLimitExceeded as e:
+            return throttled_result(e)
         except Exception as e:
             logger.error(f"Unexpected error in Chapa transfer: {str(e)}")
             return {
@@ -319,7 +422,7 @@ class ChapaProvider(BasePaymentProvider):
             transfer_reference: The reference used when initiating the transfer
             
         Returns:
-            Dict containing transfer status
+            Dict containing transfer status; 'not_found' if Chapa has no transfer with that reference
         """
         try:
             url = f"{self.base_url}/transfers/{transfer_reference}"
@@ -327,17 +430,20 @@ class ChapaProvider(BasePaymentProvider):
                 'Authorization': f'Bearer {self.secret_key}'
             }
             
-            response = requests.get(url, headers=headers)
+            response = self.transport.request('transfer_status', 'GET', url, headers=headers)
+            if response.status_code == 404:
+                return {'status': 'not_found', 'transfer_data': {}}
             response.raise_for_status()
             
             data = response.json()
             
             return {
-                'status': 'success',
                 'transfer_data': data.get('data', {}),
                 'status': data.get('data', {}).get('status', 'unknown')
             }
             
+        except RateLimitExceeded as e:
+            return throttled_result(e)
         except Exception as e:
             logger.error(f"Error getting transfer status: {str(e)}")
             return {
@@ -358,7 +464,7 @@ class ChapaProvider(BasePaymentProvider):
                 'Authorization': f'Bearer {self.secret_key}'
             }
             
-            response = requests.get(url, headers=headers, data='')
+            response = self.transport.request('banks', 'GET', url, headers=headers, data='')
             response.raise_for_status()
             
             data = response.json()
@@ -368,6 +474,8 @@ class ChapaProvider(BasePaymentProvider):
                 'banks': data.get('data', [])
             }
             
+        except RateLimitExceeded as e:
+            return throttled_result(e)
         except Exception as e:
             logger.error(f"Error getting banks: {str(e)}")
             return {
@@ -391,7 +499,7 @@ class ChapaProvider(BasePaymentProvider):
                 'Authorization': f'Bearer {self.secret_key}'
             }
 
-            response = requests.get(url, headers=headers)
+            response = self.transport.request('verify_transfer', 'GET', url, headers=headers)
             response.raise_for_status()
 
             data = response.json()
@@ -404,4 +512,192 @@ class ChapaProvider(BasePaymentProvider):
             return {
                 'status': 'error',
                 'message': str(e)
-            }
\ No newline at end of file
+            }
+
+    # Async interface, served by the shared AsyncHttpTransport.
+
+    async def acharge(self, user, amount, **kwargs):
+        """Async counterpart of charge()."""
+        try:
+            url = f"{self.base_url}/transaction/initialize"
+            tx_ref = kwargs.pop('tx_ref', None) or f'escrow-fund-{uuid.uuid4().hex[:10]}'
+            payload = self._charge_payload(user, amount, tx_ref, **kwargs)
+
+            logger.info(f"Initiating Chapa payment for user {user.email}, amount: {amount}")
+
+            response = await self.async_transport.request('charge', 'POST', url, json=payload, headers=self._headers('application/json'))
+            response.raise_for_status()
+
+            data = response.json()
+            data['tx_ref'] = tx_ref
+            data['provider'] = 'chapa'
+
+            logger.info(f"Chapa payment initiated successfully. TX Ref: {tx_ref}")
+            return data
+
+        except httpx.HTTPError as e:
+            logger.error(f"Chapa API request failed: {str(e)}")
+            return {
+                'status': 'error',
+                'message': 'Payment initiation failed',
+                'error': str(e)
+            }
+        except RateLimitExceeded as e:
+            return throttled_result(e)
+        except Exception as e:
+            logger.error(f"Unexpected error in Chapa charge: {str(e)}")
+            return {
+                'status': 'error',
+                'message': 'Payment initiation failed',
+                'error': str(e)
+            }
+
+    async def averify(self, provider_transaction_id):
+        """Async counterpart of verify()."""
+        try:
+            url = f"{self.base_url}/transaction/verify/{provider_transaction_id}"
+            logger.info(f"Verifying Chapa Payment: {provider_transaction_id}")
+
+            response = await self.async_transport.request('verify', 'GET', url, headers=self._headers())
+            is_successful = response.json().get('status') == 'success'
+
+            logger.info(f"Chapa payment verification result: {is_successful}")
+            return is_successful
+        except httpx.HTTPError as e:
+            logger.error(f"Chapa verfication request failed: {str(e)}")
+            return False
+        except Exception as e:
+            logger.error(f"Unexpected error in Chapa verify: {str(e)}")
+            return False
+
+    async def arefund(self, provider_transaction_id, amount=None, reason="Project refund", **kwargs):
+        """Async counterpart of refund()."""
+        try:
+            verification_url = f"{self.base_url}/transaction/verify/{provider_transaction_id}"
+            verify_response = await self.async_transport.request('verify', 'GET', verification_url, headers=self._headers())
+            verify_response.raise_for_status()
+            original_transaction = verify_response.json()
+
+            if original_transaction.get('status') != 'success':
+                return {
+                    'status': 'error',
+                    'message': 'Cannot refund unsuccessful transaction',
+                    'error': 'Transaction was not successful'
+                }
+
+            refund_url = f"{self.base_url}/refund/{provider_transaction_id}"
+            amount, form_data = self._refund_form(
+                provider_transaction_id, original_transaction, amount, reason, kwargs.get('reference'),
+            )
+
+            logger.info(f"Initiating Chapa refund for tx_ref: {provider_transaction_id}, amount: {amount}")
+
+            try:
+                refund_response = await self.async_transport.request(
+                    'refund', 'POST', refund_url,
+                    content=form_data,
+                    headers=self._headers('application/x-www-form-urlencoded'),
+                )
+            except httpx.TransportError as e:
+                return self._refund_unconfirmed(provider_transaction_id, kwargs.get('reference'), amount, str(e))
+            refund_response.raise_for_status()
+            refund_data = refund_response.json()
+
+            return {
+                'status': 'success',
+                'message': 'Refund initiated successfully',
+                'refund_id': refund_data.get('data', {}).get('refund_id'),
+                'amount': amount,
+                'original_tx_ref': provider_transaction_id,
+                'provider': 'chapa'
+            }
+
+        except httpx.HTTPError as e:
+            logger.error(f"Chapa refund API request failed: {str(e)}")
+            return {
+                'status': 'error',
+                'message': 'Refund request failed',
+                'error': str(e)
+            }
+        except RateLimitExceeded as e:
+            return throttled_result(e)
+        except Exception as e:
+            logger.error(f"Unexpected error in Chapa refund: {str(e)}")
+            return {
+                'status': 'error',
+                'message': 'Refund processing failed',
+                'error': str(e)
+            }
+
+    async def atransfer_to_account(self, recipient, amount, **kwargs):
+        """Async counterpart of transfer_to_account()."""
+        try:
+            url = f"{self.base_url}/transfers"
+            transfer_ref = kwargs.get('reference') or f"freelancer-payment-{uuid.uuid4().hex[:10]}"
+            payload = self._transfer_payload(recipient, amount, transfer_ref)
+
+            logger.info(f"Initiating Chapa transfer: {amount} ETB to {recipient['account_name']} ({recipient['account_number']})")
+
+            response = await self.async_transport.request('transfer', 'POST', url, json=payload, headers=self._headers('application/json'))
+            if self._is_duplicate_reference(response):
+                return self._transfer_unconfirmed(transfer_ref, amount, 'duplicate reference')
+            response.raise_for_status()
+            data = response.json()
+
+            logger.info(f"Chapa transfer initiated successfully. Reference: {transfer_ref}")
+
+            return {
+                'status': 'success',
+                'transfer_id': data.get('data', {}).get('transfer_id'),
+                'reference': transfer_ref,
+                'amount': str(amount),
+                'recipient': recipient['account_name'],
+                'message': 'Transfer initiated successfully'
+            }
+
+        except httpx.ReadTimeout:
+            return self._transfer_unconfirmed(transfer_ref, amount, 'timed out')
+        except httpx.HTTPError as e:
+            logger.error(f"Chapa transfer API request failed: {str(e)}")
+            return {
+                'status': 'error',
+                'message': 'Transfer request failed',
+                'error': str(e)
+            }
+        except RateLimitExceeded as e:
+            return throttled_result(e)
+        except Exception as e:
+            logger.error(f"Unexpected error in Chapa transfer: {str(e)}")
+            return {
+                'status': 'error',
+                'message': 'Transfer processing failed',
+                'error': str(e)
+            }
+
+    async def aget_transfer_status(self, transfer_reference: str) -> dict:
+        """Async counterpart of get_transfer_status()."""
+        try:
+            url = f"{self.base_url}/transfers/{transfer_reference}"
+            response = await self.async_transport.request('transfer_status', 'GET', url, headers=self._headers())
+            if response.status_code == 404:
+                return {'status': 'not_found', 'transfer_data': {}}
+            response.raise_for_status()
+            data = response.json()
+
+            return {
+                'transfer_data': data.get('data', {}),
+                'status': data.get('data', {}).get('status', 'unknown')
+            }
+
+        except RateLimitExceeded as e:
+            return throttled_result(e)
+        except Exception as e:
+            logger.error(f"Error getting transfer status: {str(e)}")
+            return {
+                'status': 'error',
+                'message': str(e)
+            }
+
+    async def aclose(self):
+        """Close the async transport's client for the running loop."""
+        await self.async_transport.aclose()
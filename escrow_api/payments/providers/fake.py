@@ -0,0 +1,342 @@
+"""
+Simulated payment provider for load tests and offline benchmarks.
+
+Enabled with PAYMENT_FAKE_PROVIDER_ENABLED and configured through
+PAYMENT_FAKE_PROVIDER (or constructor kwargs):
+
+    PAYMENT_FAKE_PROVIDER = {
+        'latency': {'distribution': 'lognormal', 'median_ms': 120, 'sigma': 0.4},
+        'operation_latency': {'transfer': {'distribution': 'uniform', 'low_ms': 200, 'high_ms': 600}},
+        'failure_rate': 0.01,
+        'operation_failure_rate': {'charge': 0.05},
+        'payment_failure_rate': 0.02,
+        'webhook_url': 'http://localhost:8000/payments/webhooks/fake/',
+        'webhook_delay_ms': 500,
+        'max_outcomes': 100000,
+    }
+
+Latency and failures are sampled per call. Charges and transfers settle
+asynchronously: when webhook_url is set, a Chapa-shaped webhook is posted to it
+after webhook_delay_ms, exactly as the real provider would. Settled outcomes
+are kept for the max_outcomes most recently used references only, so a long
+load test runs in bounded memory; an evicted reference reads as unknown.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import requests
+from django.conf import settings
+
+from .base import BasePaymentProvider
+from .ratelimit import RateLimitExceeded, provider_rate_limiter, throttled_result
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = ('charge', 'verify', 'refund', 'refund_status', 'payment_status', 'transfer', 'transfer_status', 'banks')
+
+
+class LatencyModel:
+    """
+    Samples a delay in seconds from a configured distribution.
+
+    Accepted specs: a number (fixed milliseconds) or a dict with 'distribution' of
+    'fixed' (ms), 'uniform' (low_ms, high_ms), 'exponential' (mean_ms) or
+    'lognormal' (median_ms, sigma).
+    """
+
+    def __init__(self, spec=0):
+        if not isinstance(spec, dict):
+            spec = {'distribution': 'fixed', 'ms': spec or 0}
+        self.spec = spec
+        self.distribution = spec.get('distribution', 'fixed')
+        if self.distribution not in ('fixed', 'uniform', 'exponential', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {self.distribution}")
+
+    def sample(self, rng=random):
+        spec = self.spec
+        if self.distribution == 'uniform':
+            ms = rng.uniform(spec.get('low_ms', 0), spec.get('high_ms', 0))
+        elif self.distribution == 'exponential':
+            mean = spec.get('mean_ms', 0)
+            ms = rng.expovariate(1 / mean) if mean else 0
+        elif self.distribution == 'lognormal':
+            median = spec.get('median_ms', 0)
+            ms = median * rng.lognormvariate(0, spec.get('sigma', 0.5)) if median else 0
+        else:
+            ms = spec.get('ms', 0)
+        return max(0.0, ms) / 1000
+
+
+class WebhookEmitter:
+    """
+    Posts delayed webhooks from a single background thread.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.session = requests.Session()
+        self._queue = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='fake-provider-webhooks', daemon=True)
+        self._thread.start()
+
+    def schedule(self, payload, delay):
+        with self._condition:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._counter), payload))
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                due, _, payload = self._queue[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                heapq.heappop(self._queue)
+            try:
+                self.session.post(self.url, json=payload, timeout=10)
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Fake provider webhook delivery failed: {str(e)}")
+
+
+class FakeProvider(BasePaymentProvider):
+    """
+    In-process implementation of the full provider contract with
+    configurable latency, failure rates and webhook emission.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        config = {**getattr(settings, 'PAYMENT_FAKE_PROVIDER', {}), **kwargs}
+
+        default_latency = config.get('latency', 0)
+        operation_latency = config.get('operation_latency', {})
+        self.latency = {op: LatencyModel(operation_latency.get(op, default_latency)) for op in OPERATIONS}
+
+        default_failure = config.get('failure_rate', 0.0)
+        operation_failure = config.get('operation_failure_rate', {})
+        self.failure_rate = {op: operation_failure.get(op, default_failure) for op in OPERATIONS}
+
+        self.payment_failure_rate = config.get('payment_failure_rate', 0.0)
+        self.webhook_delay = config.get('webhook_delay_ms', 0) / 1000
+        self.rng = random.Random(config.get('seed'))
+        self._rng_lock = threading.Lock()
+
+        webhook_url = config.get('webhook_url')
+        self.emitter = WebhookEmitter(webhook_url) if webhook_url else None
+
+        # Settled outcome per charge/transfer/refund reference, so verify(),
+        # get_transfer_status() and get_refund_status() agree with what was sent.
+        # Least recently used references are evicted beyond max_outcomes.
+        self.max_outcomes = config.get('max_outcomes', 100000)
+        self._outcomes = OrderedDict()
+        self._outcomes_lock = threading.Lock()
+
+    def _sample(self, operation):
+        with self._rng_lock:
+            delay = self.latency[operation].sample(self.rng)
+            failed = self.rng.random() < self.failure_rate[operation]
+        return delay, failed
+
+    def _draw(self, operation):
+        # Throttled like a real provider call; a call that finds no token fails
+        # with the RateLimitExceeded as its (truthy) failure.
+        try:
+            provider_rate_limiter.acquire('fake', operation)
+        except RateLimitExceeded as e:
+            logger.warning(str(e))
+            return 0.0, e
+        return self._sample(operation)
+
+    async def _adraw(self, operation):
+        try:
+            await provider_rate_limiter.aacquire('fake', operation)
+        except RateLimitExceeded as e:
+            logger.warning(str(e))
+            return 0.0, e
+        return self._sample(operation)
+
+    def _settle(self, reference):
+        with self._rng_lock:
+            outcome = 'failed' if self.rng.random() < self.payment_failure_rate else 'success'
+        self._record_outcome(reference, outcome)
+        return outcome
+
+    def _record_outcome(self, reference, outcome):
+        with self._outcomes_lock:
+            self._outcomes[reference] = outcome
+            self._outcomes.move_to_end(reference)
+            while len(self._outcomes) > self.max_outcomes:
+                self._outcomes.popitem(last=False)
+
+    def _outcome(self, reference, default=None):
+        with self._outcomes_lock:
+            outcome = self._outcomes.get(reference)
+            if outcome is None:
+                return default
+            self._outcomes.move_to_end(reference)
+            return outcome
+
+    def _emit(self, payload):
+        if self.emitter is not None:
+            self.emitter.schedule(payload, self.webhook_delay)
+
+    @staticmethod
+    def _error(operation, failed=True):
+        if isinstance(failed, RateLimitExceeded):
+            return throttled_result(failed)
+        return {'status': 'error', 'message': f'Simulated {operation} failure'}
+
+    # Results, shared by the sync and async entry points.
+
+    def _charge_result(self, failed, tx_ref=None):
+        if failed:
+            return self._error('charge', failed)
+        tx_ref = tx_ref or f'fake-fund-{uuid.uuid4().hex[:12]}'
+        if self._outcome(tx_ref) is None:
+            outcome = self._settle(tx_ref)
+            self._emit({'id': f'evt-{tx_ref}', 'type': 'charge.completed', 'tx_ref': tx_ref, 'status': outcome})
+        return {
+            'status': 'success',
+            'message': 'Hosted Link',
+            'data': {'checkout_url': f'https://checkout.fake.local/{tx_ref}'},
+            'tx_ref': tx_ref,
+            'provider': 'fake',
+        }
+
+    def _verify_result(self, provider_transaction_id, failed):
+        return not failed and self._outcome(provider_transaction_id, 'success') == 'success'
+
+    def _refund_result(self, provider_transaction_id, amount, failed, reference=None):
+        if failed:
+            return self._error('refund', failed)
+        if reference:
+            self._record_outcome(reference, 'success')
+        return {
+            'status': 'success',
+            'message': 'Refund initiated successfully',
+            'refund_id': f'fake-refund-{uuid.uuid4().hex[:12]}',
+            'amount': amount,
+            'original_tx_ref': provider_transaction_id,
+            'provider': 'fake',
+        }
+
+    def _transfer_result(self, recipient, amount, failed, reference=None):
+        if failed:
+            return self._error('transfer', failed)
+        reference = reference or f'fake-transfer-{uuid.uuid4().hex[:12]}'
+        if self._outcome(reference) is not None:
+            # Same reference as an earlier transfer: acknowledge it without paying twice.
+            return self._transfer_response(recipient, amount, reference)
+        outcome = self._settle(reference)
+        self._emit({
+            'id': f'evt-{reference}',
+            'type': f'transfer.{outcome}',
+            'reference': reference,
+            'status': outcome,
+        })
+        return self._transfer_response(recipient, amount, reference)
+
+    @staticmethod
+    def _transfer_response(recipient, amount, reference):
+        return {
+            'status': 'success',
+            'transfer_id': reference,
+            'reference': reference,
+            'amount': str(amount),
+            'recipient': recipient.get('account_name'),
+            'message': 'Transfer initiated successfully',
+        }
+
+    def _refund_status_result(self, refund_reference, failed):
+        if failed:
+            return self._error('refund status', failed)
+        return {'status': self._outcome(refund_reference, 'not_found')}
+
+    def _transfer_status_result(self, transfer_reference, failed):
+        if failed:
+            return self._error('transfer status', failed)
+        outcome = self._outcome(transfer_reference, 'not_found')
+        return {'transfer_data': {'reference': transfer_reference, 'status': outcome}, 'status': outcome}
+
+    # Sync contract
+
+    def charge(self, user, amount, **kwargs):
+        delay, failed = self._draw('charge')
+        time.sleep(delay)
+        return self._charge_result(failed, kwargs.get('tx_ref'))
+
+    def verify(self, provider_transaction_id):
+        delay, failed = self._draw('verify')
+        time.sleep(delay)
+        return self._verify_result(provider_transaction_id, failed)
+
+    def refund(self, provider_transaction_id, amount=None, reason="Project refund", **kwargs):
+        delay, failed = self._draw('refund')
+        time.sleep(delay)
+        return self._refund_result(provider_transaction_id, amount, failed, kwargs.get('reference'))
+
+    def get_refund_status(self, provider_transaction_id, refund_reference):
+        delay, failed = self._draw('refund_status')
+        time.sleep(delay)
+        return self._refund_status_result(refund_reference, failed)
+
+    def get_payment_status(self, provider_transaction_id):
+        delay, failed = self._draw('payment_status')
+        time.sleep(delay)
+        return 'error' if failed else self._outcome(provider_transaction_id, 'success')
+
+    def transfer_to_account(self, recipient, amount, **kwargs):
+        delay, failed = self._draw('transfer')
+        time.sleep(delay)
+        return self._transfer_result(recipient, amount, failed, kwargs.get('reference'))
+
+    def get_transfer_status(self, transfer_reference: str) -> dict:
+        delay, failed = self._draw('transfer_status')
+        time.sleep(delay)
+        return self._transfer_status_result(transfer_reference, failed)
+
+    def get_banks(self) -> dict:
+        delay, failed = self._draw('banks')
+        time.sleep(delay)
+        if failed:
+            return self._error('banks', failed)
+        return {'status': 'success', 'banks': [{'id': 'FAKE1', 'name': 'Fake Bank'}]}
+
+    # Async contract: same results, but latency is spent on the event loop.
+
+    async def acharge(self, user, amount, **kwargs):
+        delay, failed = await self._adraw('charge')
+        await asyncio.sleep(delay)
+        return self._charge_result(failed, kwargs.get('tx_ref'))
+
+    async def averify(self, provider_transaction_id):
+        delay, failed = await self._adraw('verify')
+        await asyncio.sleep(delay)
+        return self._verify_result(provider_transaction_id, failed)
+
+    async def arefund(self, provider_transaction_id, amount, reason="Project refund", **kwargs):
+        delay, failed = await self._adraw('refund')
+        await asyncio.sleep(delay)
+        return self._refund_result(provider_transaction_id, amount, failed, kwargs.get('reference'))
+
+    async def atransfer_to_account(self, recipient, amount, **kwargs):
+        delay, failed = await self._adraw('transfer')
+        await asyncio.sleep(delay)
+        return self._transfer_result(recipient, amount, failed, kwargs.get('reference'))
+
+    async def aget_transfer_status(self, transfer_reference: str) -> dict:
+        delay, failed = await self._adraw('transfer_status')
+        await asyncio.sleep(delay)
+        return self._transfer_status_result(transfer_reference, failed)
@@ -0,0 +1,224 @@
+"""
+Offline stand-ins for the provider HTTP APIs.
+
+They answer the endpoints ChapaProvider and StripeProvider call with canned,
+successful payloads so the sync and async provider paths can be exercised
+without network access or credentials:
+
+    api = LocalChapaAPI(latency=0.05)
+    chapa = ChapaProvider(transport=api.transport(), async_transport=api.async_transport())
+    stripe = StripeProvider(http_client=LocalStripeHTTPClient())
+"""
+import asyncio
+import json
+import time
+import uuid
+from urllib.parse import parse_qsl, urlsplit
+
+import httpx
+import requests
+import stripe
+from requests.adapters import BaseAdapter
+
+from .transport import AsyncHttpTransport, HttpTransport
+
+
+class LocalChapaAPI:
+    """
+    In-process emulation of the Chapa v1 endpoints used by ChapaProvider.
+
+    Args:
+        latency: Seconds to wait before answering each request
+        status_code: HTTP status returned for every request (200 = success)
+        lost_answers: Path prefixes (e.g. '/refund/') whose requests are handled
+            but answered with a read timeout
+    """
+
+    def __init__(self, latency=0.0, status_code=200, lost_answers=()):
+        self.latency = latency
+        self.status_code = status_code
+        self.lost_answers = tuple(lost_answers)
+        self.requests = []
+        # Transfer reference -> transfer id, so reused references are rejected like Chapa does.
+        self.transfers = {}
+
+    def transport(self, **kwargs) -> HttpTransport:
+        transport = HttpTransport(**kwargs)
+        adapter = _LocalRequestsAdapter(self)
+        transport.session.mount('https://', adapter)
+        transport.session.mount('http://', adapter)
+        return transport
+
+    def async_transport(self, **kwargs) -> AsyncHttpTransport:
+        return AsyncHttpTransport(transport=httpx.MockTransport(self.handle), **kwargs)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        response = self.respond(request)
+        if self.answer_lost(request):
+            raise httpx.ReadTimeout('Local answer lost', request=request)
+        return response
+
+    def answer_lost(self, request: httpx.Request) -> bool:
+        return request.url.path.split('/v1', 1)[-1].startswith(self.lost_answers)
+
+    def respond(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append((request.method, request.url.path))
+        if self.status_code != 200:
+            return httpx.Response(self.status_code, json={'status': 'failed', 'message': 'Local error'})
+        result = self.route(request)
+        if isinstance(result, httpx.Response):
+            return result
+        return httpx.Response(200, json=result)
+
+    def route(self, request: httpx.Request):
+        """Returns the JSON body of a 200 answer, or an httpx.Response for anything else."""
+        path = request.url.path.split('/v1', 1)[-1]
+        reference = path.rstrip('/').rsplit('/', 1)[-1]
+
+        if path.startswith('/transaction/initialize'):
+            tx_ref = json.loads(request.content or b'{}').get('tx_ref')
+            return {
+                'status': 'success',
+                'message': 'Hosted Link',
+                'data': {'checkout_url': f'https://checkout.chapa.local/{tx_ref}'},
+            }
+        if path.startswith('/transaction/verify/'):
+            return {
+                'status': 'success',
+                'data': {'tx_ref': reference, 'status': 'success', 'amount': '0', 'customer': {'email': ''}},
+            }
+        if path.startswith('/refund/'):
+            return {'status': 'success', 'data': {'refund_id': f'local-refund-{uuid.uuid4().hex[:10]}'}}
+        if path.startswith('/transfers/verify/') or path.startswith('/transfers/'):
+            if reference not in self.transfers:
+                return httpx.Response(404, json={'status': 'failed', 'message': 'Transfer not found'})
+            return {'status': 'success', 'data': {'reference': reference, 'status': 'success'}}
+        if path.startswith('/transfers'):
+            transfer_ref = json.loads(request.content or b'{}').get('reference')
+            if transfer_ref in self.transfers:
+                return httpx.Response(400, json={'status': 'failed', 'message': 'Transfer with this reference already exists'})
+            self.transfers[transfer_ref] = f'local-transfer-{uuid.uuid4().hex[:10]}'
+            return {'status': 'success', 'data': {'transfer_id': self.transfers[transfer_ref]}}
+        if path.startswith('/banks'):
+            return {'status': 'success', 'data': [{'id': 1, 'name': 'Local Bank', 'currency': 'ETB'}]}
+        return {'status': 'success', 'data': {}}
+
+
+class _LocalRequestsAdapter(BaseAdapter):
+    """requests adapter that hands every request to a LocalChapaAPI, for HttpTransport."""
+
+    def __init__(self, api):
+        super().__init__()
+        self.api = api
+
+    def send(self, request, **kwargs):
+        if self.api.latency:
+            time.sleep(self.api.latency)
+        body = request.body.encode() if isinstance(request.body, str) else (request.body or b'')
+        local_request = httpx.Request(request.method, request.url, headers=dict(request.headers), content=body)
+        reply = self.api.respond(local_request)
+        if self.api.answer_lost(local_request):
+            raise requests.exceptions.ReadTimeout('Local answer lost', request=request)
+        response = requests.Response()
+        response.status_code = reply.status_code
+        response.headers.update(reply.headers)
+        response._content = reply.content
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class LocalStripeHTTPClient(stripe.HTTPClient):
+    """
+    stripe.HTTPClient that answers PaymentIntent, Refund and Transfer calls
+    locally. Intents are reported as succeeded on retrieval; created
+    transfers are kept so they can be retrieved and listed by transfer_group.
+    """
+
+    name = 'local'
+
+    def __init__(self, latency=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.requests = []
+        self.transfers = {}
+        self.refunds = {}
+
+    def request(self, method, url, headers, post_data=None, *, _usage=None):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(method, url, post_data)
+
+    async def request_async(self, method, url, headers, post_data=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(method, url, post_data)
+
+    def sleep_async(self, secs):
+        return asyncio.sleep(secs)
+
+    def close(self):
+        pass
+
+    async def close_async(self):
+        pass
+
+    def _respond(self, method, url, post_data):
+        path = urlsplit(url).path
+        self.requests.append((method.upper(), path))
+        params = dict(parse_qsl(post_data.decode() if isinstance(post_data, bytes) else (post_data or '')))
+        metadata = {key[len('metadata['):-1]: value for key, value in params.items() if key.startswith('metadata[')}
+        object_id = path.rstrip('/').rsplit('/', 1)[-1]
+
+        if path.startswith('/v1/payment_intents'):
+            intent_id = object_id if method.lower() == 'get' else f'pi_local_{uuid.uuid4().hex[:14]}'
+            body = {
+                'id': intent_id,
+                'object': 'payment_intent',
+                'status': 'succeeded' if method.lower() == 'get' else 'requires_payment_method',
+                'client_secret': f'{intent_id}_secret_local',
+                'latest_charge': f'ch_local_{intent_id[-8:]}',
+                'metadata': metadata,
+            }
+        elif path.rstrip('/') == '/v1/refunds' and method.lower() == 'get':
+            intent_id = dict(parse_qsl(urlsplit(url).query)).get('payment_intent')
+            data = [refund for refund in self.refunds.values() if refund['payment_intent'] == intent_id]
+            body = {'object': 'list', 'url': '/v1/refunds', 'has_more': False, 'data': data}
+        elif path.startswith('/v1/refunds'):
+            refund_id = f're_local_{uuid.uuid4().hex[:14]}'
+            body = {
+                'id': refund_id,
+                'object': 'refund',
+                'status': 'succeeded',
+                'charge': params.get('charge'),
+                'payment_intent': metadata.get('original_intent'),
+                'metadata': metadata,
+            }
+            self.refunds[refund_id] = body
+        elif path.rstrip('/') == '/v1/transfers' and method.lower() == 'get':
+            group = dict(parse_qsl(urlsplit(url).query)).get('transfer_group')
+            data = [transfer for transfer in self.transfers.values() if transfer.get('transfer_group') == group]
+            body = {'object': 'list', 'url': '/v1/transfers', 'has_more': False, 'data': data}
+        elif path.startswith('/v1/transfers'):
+            if method.lower() == 'get':
+                body = self.transfers.get(object_id) or {'id': object_id, 'object': 'transfer', 'reversed': False, 'metadata': {}}
+            else:
+                transfer_id = f'tr_local_{uuid.uuid4().hex[:14]}'
+                body = {
+                    'id': transfer_id,
+                    'object': 'transfer',
+                    'reversed': False,
+                    'transfer_group': params.get('transfer_group'),
+                    'metadata': metadata,
+                }
+                self.transfers[transfer_id] = body
+        else:
+            return json.dumps({'error': {'message': f'Unhandled local path {path}'}}).encode(), 404, {}
+
+        return json.dumps(body).encode(), 200, {'Request-Id': f'req_local_{uuid.uuid4().hex[:10]}'}
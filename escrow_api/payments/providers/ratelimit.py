@@ -0,0 +1,286 @@
+"""
+Token-bucket throttling for outbound provider API calls.
+
+Quotas are configured per provider and endpoint in
+settings.PAYMENT_PROVIDER_RATE_LIMITS:
+
+    PAYMENT_PROVIDER_RATE_LIMITS = {
+        'chapa': {'default': '10/s', 'transfer': {'rate': '2/s', 'burst': 5}},
+        'stripe': {'default': '25/s'},
+    }
+
+An endpoint without its own entry draws from the provider's 'default' bucket;
+a provider without any entry is not throttled. Buckets live in the
+PAYMENT_PROVIDER_RATE_LIMIT_CACHE Django cache, so every worker process
+sharing that cache shares the quota. If the cache is unreachable the limiter
+falls back to an in-process bucket rather than failing the call.
+
+Callers block until a token is available, for at most
+PAYMENT_PROVIDER_RATE_LIMIT_WAIT seconds, then RateLimitExceeded is raised.
+Request handlers that would rather fail fast can narrow the wait:
+
+    with rate_limit_wait(0):
+        provider.charge(user, amount)
+
+Providers turn RateLimitExceeded into a {'status': 'throttled'} result
+(throttled_result), which callers must retry later without counting it as a
+failed attempt: the call never reached the provider.
+"""
+import asyncio
+import contextlib
+import contextvars
+import logging
+import math
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600}
+
+# How long a bucket update may hold the cross-process lock, and how often and
+# how soon a caller that lost the race for it tries again.
+LOCK_TIMEOUT = 1
+LOCK_ATTEMPTS = 5
+LOCK_RETRY_DELAY = 0.002
+
+_wait_limit = contextvars.ContextVar('provider_rate_limit_wait', default=None)
+
+
+class RateLimitExceeded(Exception):
+    """No token became available within the caller's wait limit."""
+
+    def __init__(self, scope, endpoint, retry_after):
+        self.scope = scope
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+        super().__init__(f"{scope} {endpoint} rate limit exceeded, retry in {retry_after:.2f}s")
+
+
+def throttled_result(error):
+    """Provider result for a call that was held back by its rate limit."""
+    return {
+        'status': 'throttled',
+        'message': str(error),
+        'retry_after': error.retry_after,
+    }
+
+
+@dataclass(frozen=True)
+class Quota:
+    rate: float
+    burst: int
+
+
+def parse_quota(spec):
+    """
+    Parse a quota spec: 'N/s', 'N/m', 'N/h' or {'rate': 'N/s', 'burst': M}.
+
+    The burst defaults to one second's worth of tokens (at least one).
+
+    Returns:
+        Quota, or None for an empty spec
+    """
+    if not spec:
+        return None
+    burst = None
+    if isinstance(spec, dict):
+        burst = spec.get('burst')
+        spec = spec['rate']
+    count, _, period = str(spec).partition('/')
+    try:
+        rate = float(count) / PERIODS[period or 's']
+    except (KeyError, ValueError):
+        raise ValueError(f"Invalid rate limit: {spec!r}")
+    if rate <= 0:
+        raise ValueError(f"Invalid rate limit: {spec!r}")
+    return Quota(rate=rate, burst=int(burst or max(1, math.ceil(rate))))
+
+
+@contextlib.contextmanager
+def rate_limit_wait(seconds):
+    """
+    Override how long provider calls in this context may wait for a token.
+    0 means fail fast.
+    """
+    token = _wait_limit.set(seconds)
+    try:
+        yield
+    finally:
+        _wait_limit.reset(token)
+
+
+class ProviderRateLimiter:
+    """
+    Shared token buckets keyed by (provider, endpoint).
+
+    Each bucket is a (tokens, updated_at) pair refilled lazily on every take.
+    Updates are serialised across processes by a short cache.add() lock, so
+    the shared cache needs no atomic scripting support.
+    """
+
+    def __init__(self):
+        self._local = {}
+        self._local_lock = threading.Lock()
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'PAYMENT_PROVIDER_RATE_LIMIT_CACHE', 'default')]
+
+    @staticmethod
+    def default_wait():
+        wait = _wait_limit.get()
+        if wait is None:
+            wait = getattr(settings, 'PAYMENT_PROVIDER_RATE_LIMIT_WAIT', 10)
+        return wait
+
+    @staticmethod
+    def quota_for(scope, endpoint):
+        """
+        Returns:
+            (bucket name, Quota) for the endpoint, or None if it is not throttled
+        """
+        quotas = getattr(settings, 'PAYMENT_PROVIDER_RATE_LIMITS', {}).get(scope) or {}
+        if endpoint in quotas:
+            bucket = endpoint
+        elif 'default' in quotas:
+            bucket = 'default'
+        else:
+            return None
+        quota = parse_quota(quotas[bucket])
+        return (bucket, quota) if quota else None
+
+    def acquire(self, scope, endpoint, *, wait=None):
+        """
+        Take one token for a call, sleeping until one is available.
+
+        Args:
+            scope: Provider name
+            endpoint: Logical endpoint name, as used by the transports
+            wait: Maximum seconds to wait; defaults to the context or settings value
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            RateLimitExceeded if no token frees up within the wait limit.
+        """
+        bucket = self.quota_for(scope, endpoint)
+        if bucket is None:
+            return 0.0
+        name, quota = bucket
+        wait = self.default_wait() if wait is None else wait
+
+        started = time.monotonic()
+        waited = 0.0
+        while True:
+            delay = self._take(scope, name, quota)
+            if not delay:
+                self._count(scope, name, waited)
+                return waited
+            if waited + delay > wait:
+                self._count(scope, name, waited, rejected=True)
+                raise RateLimitExceeded(scope, endpoint, delay)
+            time.sleep(delay)
+            waited = time.monotonic() - started
+
+    async def aacquire(self, scope, endpoint, *, wait=None):
+        """Async counterpart of acquire(); waits on the event loop."""
+        bucket = self.quota_for(scope, endpoint)
+        if bucket is None:
+            return 0.0
+        name, quota = bucket
+        wait = self.default_wait() if wait is None else wait
+        take = sync_to_async(self._take, thread_sensitive=False)
+
+        started = time.monotonic()
+        waited = 0.0
+        while True:
+            delay = await take(scope, name, quota)
+            if not delay:
+                self._count(scope, name, waited)
+                return waited
+            if waited + delay > wait:
+                self._count(scope, name, waited, rejected=True)
+                raise RateLimitExceeded(scope, endpoint, delay)
+            await asyncio.sleep(delay)
+            waited = time.monotonic() - started
+
+    @staticmethod
+    def _refill(quota, tokens, updated, now):
+        """Returns (tokens left, seconds until the next token); 0 seconds means one was taken."""
+        tokens = min(quota.burst, tokens + max(0.0, now - updated) * quota.rate)
+        if tokens >= 1:
+            return tokens - 1, 0.0
+        return tokens, (1 - tokens) / quota.rate
+
+    def _take(self, scope, bucket, quota):
+        key = f'provider-ratelimit:{scope}:{bucket}'
+        try:
+            return self._take_shared(key, quota)
+        except Exception as e:
+            logger.error(f"Provider rate limit cache unavailable, using local bucket: {str(e)}")
+            return self._take_local(key, quota)
+
+    def _take_shared(self, key, quota):
+        cache = self.cache
+        lock_key = f'{key}:lock'
+        owner = uuid.uuid4().hex
+        for _ in range(LOCK_ATTEMPTS):
+            if cache.add(lock_key, owner, LOCK_TIMEOUT):
+                break
+            time.sleep(LOCK_RETRY_DELAY)
+        else:
+            return LOCK_RETRY_DELAY
+        try:
+            # Wall-clock time, as the timestamp is compared across processes.
+            now = time.time()
+            tokens, updated = cache.get(key) or (quota.burst, now)
+            tokens, delay = self._refill(quota, tokens, updated, now)
+            # Once idle for a full refill the bucket is back to burst, so the entry can expire.
+            cache.set(key, (tokens, now), math.ceil(quota.burst / quota.rate) + 1)
+        finally:
+            if cache.get(lock_key) == owner:
+                cache.delete(lock_key)
+        return delay
+
+    def _take_local(self, key, quota):
+        with self._local_lock:
+            now = time.monotonic()
+            tokens, updated = self._local.get(key, (quota.burst, now))
+            tokens, delay = self._refill(quota, tokens, updated, now)
+            self._local[key] = (tokens, now)
+        return delay
+
+    def _count(self, scope, bucket, waited, rejected=False):
+        with self._stats_lock:
+            stats = self._stats.setdefault(f'{scope}:{bucket}', {'acquired': 0, 'delayed': 0, 'rejected': 0, 'waited_s': 0.0})
+            if rejected:
+                stats['rejected'] += 1
+            else:
+                stats['acquired'] += 1
+                if waited:
+                    stats['delayed'] += 1
+            stats['waited_s'] += waited
+
+    def stats(self):
+        """Per-bucket counts of calls let through, delayed and rejected in this process."""
+        with self._stats_lock:
+            return {name: {**stats, 'waited_s': round(stats['waited_s'], 3)} for name, stats in self._stats.items()}
+
+    def reset(self):
+        with self._local_lock:
+            self._local.clear()
+        with self._stats_lock:
+            self._stats.clear()
+
+
+provider_rate_limiter = ProviderRateLimiter()
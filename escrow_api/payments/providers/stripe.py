@@ -1,10 +1,14 @@
+import asyncio
 import stripe
 import requests
 import json
 import environ
 import os
 import logging
+import threading
+import weakref
 from .base import BasePaymentProvider
+from .ratelimit import RateLimitExceeded, provider_rate_limiter, throttled_result
 from django.conf import settings
 import uuid
 import http.client
@@ -25,6 +29,142 @@ class StripeProvider(BasePaymentProvider):
         self.currency = getattr(settings, 'STRIPE_CURRENCY', 'usd')
         self.country = getattr(settings, 'STRIPE_COUNTRY', 'US')
         self.webhook_secret = getattr(settings, 'STRIPE_WEBHOOK_SECRET', '')
+        self.http_client = kwargs.get('http_client')
+        # Running event loop -> (StripeClient, http client created for it)
+        self._clients = weakref.WeakKeyDictionary()
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self) -> stripe.StripeClient:
+        """
+        StripeClient used by the async methods. Defaults to stripe's
+        httpx-backed client; pass http_client= to swap it (e.g. offline).
+
+        Pooled connections belong to the event loop that opened them, so one
+        client is kept per running loop.
+        """
+        loop = asyncio.get_running_loop()
+        with self._client_lock:
+            entry = self._clients.get(loop)
+            if entry is None:
+                owned = None if self.http_client else stripe.HTTPXClient()
+                client = stripe.StripeClient(
+                    api_key=settings.STRIPE_SECRET_KEY,
+                    http_client=self.http_client or owned,
+                )
+                entry = self._clients[loop] = (client, owned)
+        return entry[0]
+
+    async def aclose(self):
+        """Close the client for the running loop. An http_client passed in is left to its owner."""
+        with self._client_lock:
+            entry = self._clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None and entry[1] is not None:
+            await entry[1].close_async()
+
+    def _charge_params(self, user, amount, **kwargs):
+        return {
+            # Stripe uses the smallest currency unit
+            'amount': int(amount * 100),
+            'currency': self.currency,
+            'receipt_email': user.email,
+            'metadata': {
+                'user_id': str(user.id),
+                'user_email': user.email,
+                'project_title': kwargs.get('project_title', 'Unknown Project'),
+                'escrow_funding': 'true',
+                'tx_ref': kwargs.get('tx_ref') or f'escrow-fund-{uuid.uuid4().hex[:10]}'
+            },
+            'description': f"Escrow funding for {kwargs.get('project_title', 'project')}",
+            'automatic_payment_methods': {
+                'enabled': True,
+            },
+        }
+
+    def _charge_result(self, intent):
+        return {
+            'status': 'success',
+            'payment_intent_id': intent.id,
+            'client_secret': intent.client_secret,
+            'tx_ref': intent.metadata.get('tx_ref'),
+            'provider': 'stripe',
+            'data': {
+                'checkout_url': f"/payment/stripe/{intent.id}",  # Frontend URL
+                'client_secret': intent.client_secret
+            }
+        }
+
+    def _transfer_params(self, recipient, amount, **kwargs):
+        reference = kwargs.get('reference') or f'freelancer-payment-{uuid.uuid4().hex[:10]}'
+        return {
+            'amount': int(amount * 100),
+            'currency': self.currency,
+            'destination': recipient['stripe_account_id'],
+            # Transfers can be listed by group, so get_transfer_status can find one by our reference.
+            'transfer_group': reference,
+            'metadata': {
+                'freelancer_id': str(recipient.get('user_id', '')),
+                'project_title': kwargs.get('project_title', ''),
+                'escrow_payout': 'true',
+                'transfer_reference': reference
+            },
+            'description': f"Payment for project: {kwargs.get('project_title', 'Unknown Project')}"
+        }
+
+    @staticmethod
+    def _transfer_unconfirmed(amount, kwargs, error):
+        # A lost connection or a reused idempotency key means the transfer may exist.
+        logger.warning(f"Stripe transfer unconfirmed: {str(error)}")
+        return {
+            'status': 'unconfirmed',
+            'reference': kwargs.get('reference') or kwargs.get('idempotency_key'),
+            'amount': str(amount),
+            'message': 'Transfer outcome unknown; awaiting confirmation',
+            'error': str(error)
+        }
+
+    @staticmethod
+    def _refund_unconfirmed(provider_transaction_id, amount, reference, error):
+        # A lost connection or a reused idempotency key means the refund may exist.
+        logger.warning(f"Stripe refund {reference} unconfirmed: {str(error)}")
+        return {
+            'status': 'unconfirmed',
+            'reference': reference,
+            'amount': str(amount) if amount else 'full',
+            'original_intent': provider_transaction_id,
+            'message': 'Refund outcome unknown; awaiting confirmation',
+            'error': str(error)
+        }
+
+    @staticmethod
+    def _refund_params(charge_id, provider_transaction_id, amount, reason, reference=None):
+        refund_params = {
+            'charge': charge_id,
+            'metadata': {
+                'reason': reason,
+                'escrow_refund': 'true',
+                'original_intent': provider_transaction_id
+            }
+        }
+        if reference:
+            # Refunds are listed per intent, so get_refund_status matches on this.
+            refund_params['metadata']['refund_reference'] = reference
+        if amount:
+            refund_params['amount'] = int(amount * 100)  # Convert to cents
+        return refund_params
+
+    @staticmethod
+    def _refund_status_result(refund):
+        return {
+            'refund_id': refund.id,
+            'status': 'failed' if refund.status in ('failed', 'canceled') else 'success',
+        }
+
+    def _transfer_status_result(self, transfer):
+        return {
+            'transfer_data': transfer.to_dict(),
+            'status': 'reversed' if transfer.reversed else 'paid',
+        }
 
     def charge(self, user, amount, **kwargs):
         """
@@ -39,40 +179,16 @@ class StripeProvider(BasePaymentProvider):
             Dict containing payment initiation response
         """
         try:
-            # Convert amount to cents (Stripe uses smallest currency unit)
-            amount_cents = int(amount * 100)
-            
+            provider_rate_limiter.acquire('stripe', 'charge')
             # Create Payment Intent
             intent = stripe.PaymentIntent.create(
-                amount=amount_cents,
-                currency=self.currency,
-                customer_email=user.email,
-                metadata={
-                    'user_id': str(user.id),
-                    'user_email': user.email,
-                    'project_title': kwargs.get('project_title', 'Unknown Project'),
-                    'escrow_funding': 'true',
-                    'tx_ref': f'escrow-fund-{uuid.uuid4().hex[:10]}'
-                },
-                description=f"Escrow funding for {kwargs.get('project_title', 'project')}",
-                automatic_payment_methods={
-                    'enabled': True,
-                },
+                **self._charge_params(user, amount, **kwargs),
+                idempotency_key=kwargs.get('idempotency_key'),
             )
             
             logger.info(f"Stripe Payment Intent created: {intent.id} for user {user.email}, amount: {amount}")
             
-            return {
-                'status': 'success',
-                'payment_intent_id': intent.id,
-                'client_secret': intent.client_secret,
-                'tx_ref': intent.metadata.get('tx_ref'),
-                'provider': 'stripe',
-                'data': {
-                    'checkout_url': f"/payment/stripe/{intent.id}",  # Frontend URL
-                    'client_secret': intent.client_secret
-                }
-            }
+            return self._charge_result(intent)
             
         except stripe.error.StripeError as e:
             logger.error(f"Stripe API error in charge: {str(e)}")
@@ -81,6 +197,8 @@ class StripeProvider(BasePaymentProvider):
                 'message': 'Payment initiation failed',
                 'error': str(e)
             }
+        except RateLimitExceeded as e:
+            return throttled_result(e)
         except Exception as e:
             logger.error(f"Unexpected error in Stripe charge: {str(e)}")
             return {
@@ -109,6 +227,7 @@ class StripeProvider(BasePaymentProvider):
             bool: True if payment is successful
         """
         try:
+            provider_rate_limiter.acquire('stripe', 'verify')
             intent = stripe.PaymentIntent.retrieve(provider_transaction_id)
             
             is_successful = intent.status == 'succeeded'
@@ -123,7 +242,7 @@ class StripeProvider(BasePaymentProvider):
             logger.error(f"Unexpected error in Stripe verify: {str(e)}")
             return False
 
-    def refund(self, provider_transaction_id, amount, reason = "Project refund"):
+    def refund(self, provider_transaction_id, amount, reason = "Project refund", **kwargs):
         """
         Process a Stripe refund.
         
@@ -131,11 +250,15 @@ class StripeProvider(BasePaymentProvider):
             provider_transaction_id: Payment Intent ID
             amount: Amount to refund (if None, full refund)
             reason: Reason for refund
+            **kwargs: 'reference' identifies this refund for get_refund_status and
+                is its idempotency key
             
         Returns:
-            Dict containing refund response
+            Dict containing refund response. Status 'unconfirmed' means the
+            refund may have been made and must be looked up by its reference.
         """
         try:
+            provider_rate_limiter.acquire('stripe', 'verify')
             # Get the Payment Intent to find the charge
             intent = stripe.PaymentIntent.retrieve(provider_transaction_id)
             
@@ -154,22 +277,15 @@ class StripeProvider(BasePaymentProvider):
                     'message': 'No charge found for this payment intent'
                 }
             
-            # Prepare refund parameters
-            refund_params = {
-                'charge': charge_id,
-                'metadata': {
-                    'reason': reason,
-                    'escrow_refund': 'true',
-                    'original_intent': provider_transaction_id
-                }
-            }
-            
-            # Add amount if specified
-            if amount:
-                refund_params['amount'] = int(amount * 100)  # Convert to cents
+            reference = kwargs.get('reference')
+            refund_params = self._refund_params(charge_id, provider_transaction_id, amount, reason, reference)
             
+            provider_rate_limiter.acquire('stripe', 'refund')
             # Create refund
-            refund = stripe.Refund.create(**refund_params)
+            try:
+                refund = stripe.Refund.create(**refund_params, idempotency_key=reference)
+            except (stripe.error.APIConnectionError, stripe.error.IdempotencyError) as e:
+                return self._refund_unconfirmed(provider_transaction_id, amount, reference, e)
             
             logger.info(f"Stripe refund created: {refund.id} for intent {provider_transaction_id}")
             
@@ -188,6 +304,8 @@ class StripeProvider(BasePaymentProvider):
                 'message': 'Refund failed',
                 'error': str(e)
             }
+        except RateLimitExceeded as e:
+            return throttled_result(e)
         except Exception as e:
             logger.error(f"Unexpected error in Stripe refund: {str(e)}")
             return {
@@ -196,6 +314,33 @@ class StripeProvider(BasePaymentProvider):
                 'error': str(e)
             }
 
+    def get_refund_status(self, provider_transaction_id, refund_reference):
+        """
+        Find a refund on a Payment Intent by the reference it was created with.
+
+        Args:
+            provider_transaction_id: Payment Intent ID the refund was made against
+            refund_reference: Reference passed to refund()
+
+        Returns:
+            Dict with status 'success', 'failed' or 'not_found', or 'error'
+        """
+        try:
+            provider_rate_limiter.acquire('stripe', 'refund_status')
+            refunds = stripe.Refund.list(payment_intent=provider_transaction_id, limit=100)
+            for refund in refunds.auto_paging_iter():
+                if (refund.metadata or {}).get('refund_reference') == refund_reference:
+                    return self._refund_status_result(refund)
+            return {'status': 'not_found'}
+        except RateLimitExceeded as e:
+            return throttled_result(e)
+        except Exception as e:
+            logger.error(f"Error getting Stripe refund status: {str(e)}")
+            return {
+                'status': 'error',
+                'message': str(e)
+            }
+
     def get_payment_status(self, provider_transaction_id):
         """
         Get payment status from Stripe.
@@ -207,6 +352,7 @@ class StripeProvider(BasePaymentProvider):
             str: Payment status
         """
         try:
+            provider_rate_limiter.acquire('stripe', 'verify')
             intent = stripe.PaymentIntent.retrieve(provider_transaction_id)
             return intent.status
             
@@ -224,27 +370,17 @@ class StripeProvider(BasePaymentProvider):
         Args:
             recipient: Dict containing recipient account details
             amount: Amount to transfer
-            **kwargs: Additional parameters
+            **kwargs: Additional parameters; 'idempotency_key' is passed to Stripe so retries create one transfer
             
         Returns:
             Dict containing transfer response
         """
         try:
-            # Convert amount to cents
-            amount_cents = int(amount * 100)
-            
+            provider_rate_limiter.acquire('stripe', 'transfer')
             # Create transfer to connected account
             transfer = stripe.Transfer.create(
-                amount=amount_cents,
-                currency=self.currency,
-                destination=recipient['stripe_account_id'],
-                metadata={
-                    'freelancer_id': str(recipient.get('user_id', '')),
-                    'project_title': kwargs.get('project_title', ''),
-                    'escrow_payout': 'true',
-                    'transfer_reference': f'freelancer-payment-{uuid.uuid4().hex[:10]}'
-                },
-                description=f"Payment for project: {kwargs.get('project_title', 'Unknown Project')}"
+                **self._transfer_params(recipient, amount, **kwargs),
+                idempotency_key=kwargs.get('idempotency_key'),
             )
             
             logger.info(f"Stripe transfer created: {transfer.id} to account {recipient['stripe_account_id']}")
@@ -257,6 +393,8 @@ class StripeProvider(BasePaymentProvider):
                 'message': 'Transfer completed successfully'
             }
             
+        except (stripe.error.APIConnectionError, stripe.error.IdempotencyError) as e:
+            return self._transfer_unconfirmed(amount, kwargs, e)
         except stripe.error.StripeError as e:
             logger.error(f"Stripe transfer error: {str(e)}")
             return {
@@ -264,6 +402,8 @@ class StripeProvider(BasePaymentProvider):
                 'message': 'Transfer failed',
                 'error': str(e)
             }
+        except RateLimitExceeded as e:
+            return throttled_result(e)
         except Exception as e:
             logger.error(f"Unexpected error in Stripe transfer: {str(e)}")
             return {
@@ -272,6 +412,191 @@ class StripeProvider(BasePaymentProvider):
                 'error': str(e)
             }
     
+    def get_transfer_status(self, transfer_reference: str) -> dict:
+        """
+        Get the status of a Connect transfer.
+
+        Args:
+            transfer_reference: Transfer ID (tr_...) or the reference it was created with
+
+        Returns:
+            Dict containing transfer status; 'not_found' if no transfer has that reference
+        """
+        try:
+            provider_rate_limiter.acquire('stripe', 'transfer_status')
+            if transfer_reference.startswith('tr_'):
+                return self._transfer_status_result(stripe.Transfer.retrieve(transfer_reference))
+            transfers = stripe.Transfer.list(transfer_group=transfer_reference, limit=1).data
+            if not transfers:
+                return {'status': 'not_found', 'transfer_data': {}}
+            return self._transfer_status_result(transfers[0])
+        except RateLimitExceeded as e:
+            return throttled_result(e)
+        except Exception as e:
+            logger.error(f"Error getting Stripe transfer status: {str(e)}")
+            return {
+                'status': 'error',
+                'message': str(e)
+            }
+
+    # Async interface, served natively by StripeClient's async methods.
+
+    async def acharge(self, user, amount, **kwargs):
+        """Async counterpart of charge()."""
+        try:
+            options = {'idempotency_key': kwargs['idempotency_key']} if kwargs.get('idempotency_key') else {}
+            await provider_rate_limiter.aacquire('stripe', 'charge')
+            intent = await self.client.payment_intents.create_async(
+                params=self._charge_params(user, amount, **kwargs), options=options,
+            )
+            logger.info(f"Stripe Payment Intent created: {intent.id} for user {user.email}, amount: {amount}")
+            return self._charge_result(intent)
+        except stripe.error.StripeError as e:
+            logger.error(f"Stripe API error in charge: {str(e)}")
+            return {
+                'status': 'error',
+                'message': 'Payment initiation failed',
+                'error': str(e)
+            }
+        except RateLimitExceeded as e:
+            return throttled_result(e)
+        except Exception as e:
+            logger.error(f"Unexpected error in Stripe charge: {str(e)}")
+            return {
+                'status': 'error',
+                'message': 'Payment initiation failed',
+                'error': str(e)
+            }
+
+    async def averify(self, provider_transaction_id):
+        """Async counterpart of verify()."""
+        try:
+            await provider_rate_limiter.aacquire('stripe', 'verify')
+            intent = await self.client.payment_intents.retrieve_async(provider_transaction_id)
+            is_successful = intent.status == 'succeeded'
+            logger.info(f"Stripe payment verification result: {is_successful} for intent {provider_transaction_id}")
+            return is_successful
+        except stripe.error.StripeError as e:
+            logger.error(f"Stripe verification error: {str(e)}")
+            return False
+        except Exception as e:
+            logger.error(f"Unexpected error in Stripe verify: {str(e)}")
+            return False
+
+    async def arefund(self, provider_transaction_id, amount, reason="Project refund", **kwargs):
+        """Async counterpart of refund()."""
+        try:
+            await provider_rate_limiter.aacquire('stripe', 'verify')
+            intent = await self.client.payment_intents.retrieve_async(provider_transaction_id)
+
+            if intent.status != 'succeeded':
+                return {
+                    'status': 'error',
+                    'message': 'Cannot refund unsuccessful payment',
+                    'error': 'Payment was not successful'
+                }
+
+            charge_id = intent.latest_charge
+            if not charge_id:
+                return {
+                    'status': 'error',
+                    'message': 'No charge found for this payment intent'
+                }
+
+            reference = kwargs.get('reference')
+            refund_params = self._refund_params(charge_id, provider_transaction_id, amount, reason, reference)
+            options = {'idempotency_key': reference} if reference else {}
+
+            await provider_rate_limiter.aacquire('stripe', 'refund')
+            try:
+                refund = await self.client.refunds.create_async(params=refund_params, options=options)
+            except (stripe.error.APIConnectionError, stripe.error.IdempotencyError) as e:
+                return self._refund_unconfirmed(provider_transaction_id, amount, reference, e)
+
+            logger.info(f"Stripe refund created: {refund.id} for intent {provider_transaction_id}")
+
+            return {
+                'status': 'success',
+                'refund_id': refund.id,
+                'amount': str(amount) if amount else 'full',
+                'original_intent': provider_transaction_id,
+                'provider': 'stripe'
+            }
+
+        except stripe.error.StripeError as e:
+            logger.error(f"Stripe refund error: {str(e)}")
+            return {
+                'status': 'error',
+                'message': 'Refund failed',
+                'error': str(e)
+            }
+        except RateLimitExceeded as e:
+            return throttled_result(e)
+        except Exception as e:
+            logger.error(f"Unexpected error in Stripe refund: {str(e)}")
+            return {
+                'status': 'error',
+                'message': 'Refund processing failed',
+                'error': str(e)
+            }
+
+    async def atransfer_to_account(self, recipient, amount, **kwargs):
+        """Async counterpart of transfer_to_account()."""
+        try:
+            options = {'idempotency_key': kwargs['idempotency_key']} if kwargs.get('idempotency_key') else {}
+            await provider_rate_limiter.aacquire('stripe', 'transfer')
+            transfer = await self.client.transfers.create_async(
+                params=self._transfer_params(recipient, amount, **kwargs), options=options,
+            )
+
+            logger.info(f"Stripe transfer created: {transfer.id} to account {recipient['stripe_account_id']}")
+
+            return {
+                'status': 'success',
+                'transfer_id': transfer.id,
+                'amount': str(amount),
+                'recipient': recipient.get('account_name', 'Connected Account'),
+                'message': 'Transfer completed successfully'
+            }
+
+        except (stripe.error.APIConnectionError, stripe.error.IdempotencyError) as e:
+            return self._transfer_unconfirmed(amount, kwargs, e)
+        except stripe.error.StripeError as e:
+            logger.error(f"Stripe transfer error: {str(e)}")
+            return {
+                'status': 'error',
+                'message': 'Transfer failed',
+                'error': str(e)
+            }
+        except RateLimitExceeded as e:
+            return throttled_result(e)
+        except Exception as e:
+            logger.error(f"Unexpected error in Stripe transfer: {str(e)}")
+            return {
+                'status': 'error',
+                'message': 'Transfer processing failed',
+                'error': str(e)
+            }
+
+    async def aget_transfer_status(self, transfer_reference: str) -> dict:
+        """Async counterpart of get_transfer_status()."""
+        try:
+            await provider_rate_limiter.aacquire('stripe', 'transfer_status')
+            if transfer_reference.startswith('tr_'):
+                return self._transfer_status_result(await self.client.transfers.retrieve_async(transfer_reference))
+            transfers = (await self.client.transfers.list_async(params={'transfer_group': transfer_reference, 'limit': 1})).data
+            if not transfers:
+                return {'status': 'not_found', 'transfer_data': {}}
+            return self._transfer_status_result(transfers[0])
+        except RateLimitExceeded as e:
+            return throttled_result(e)
+        except Exception as e:
+            logger.error(f"Error getting Stripe transfer status: {str(e)}")
+            return {
+                'status': 'error',
+                'message': str(e)
+            }
+    
     def validate_webhook(self, payload, signature):
         """
         Validate Stripe webhook signature.
@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from .ratelimit import provider_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+RETRYABLE_STATUS_CODES = frozenset({429, 502, 503, 504})
+
+
+class EndpointStats:
+    """Latency and error counters for a single logical endpoint."""
+
+    __slots__ = ('calls', 'errors', 'retries', 'total_ms', 'max_ms')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'retries': self.retries,
+            'total_ms': round(self.total_ms, 3),
+            'avg_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'max_ms': round(self.max_ms, 3),
+        }
+
+
+class BaseTransport:
+    """
+    Timeout, retry-budget and latency bookkeeping shared by the sync and async
+    transports.
+
+    Args:
+        timeouts: Mapping of endpoint name -> (connect, read) timeout in seconds
+        default_timeout: (connect, read) timeout for endpoints not listed above
+        max_retries: Retry budget per call (idempotent calls only)
+        backoff_base: Base delay in seconds for exponential backoff
+        backoff_max: Upper bound for a single backoff delay
+        rate_limit_scope: Provider name whose PAYMENT_PROVIDER_RATE_LIMITS quotas
+            every attempt, retries included, draws from. None disables throttling.
+    """
+
+    def __init__(
+        self,
+        *,
+        timeouts=None,
+        default_timeout=(3.05, 15),
+        max_retries=2,
+        backoff_base=0.2,
+        backoff_max=2.0,
+        rate_limit_scope=None,
+    ):
+        self.timeouts = dict(timeouts or {})
+        self.default_timeout = tuple(default_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limit_scope = rate_limit_scope
+
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def get_timeout(self, endpoint):
+        return tuple(self.timeouts.get(endpoint, self.default_timeout))
+
+    def _retry_budget(self, method, retry):
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        return self.max_retries if retry else 0
+
+    def _backoff(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, honouring a numeric Retry-After header."""
+        if retry_after:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                pass
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+    def _record(self, endpoint, started, error=False):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                stats = self._stats[endpoint] = EndpointStats()
+            stats.calls += 1
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            if error:
+                stats.errors += 1
+
+    def _record_retry(self, endpoint):
+        with self._stats_lock:
+            self._stats[endpoint].retries += 1
+
+    def stats(self):
+        """Snapshot of per-endpoint counters."""
+        with self._stats_lock:
+            return {name: stats.as_dict() for name, stats in self._stats.items()}
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats.clear()
+
+
+class HttpTransport(BaseTransport):
+    """
+    Pooled, keep-alive HTTP transport for payment provider APIs.
+
+    One instance owns a requests.Session whose connection pool is reused across
+    calls, so only the first request to a host pays for the TCP/TLS handshake.
+
+    Args:
+        pool_connections: Number of host pools to keep
+        pool_maxsize: Maximum keep-alive connections per host
+        **kwargs: Timeout and retry options, see BaseTransport
+    """
+
+    def __init__(self, *, pool_connections=4, pool_maxsize=20, **kwargs):
+        super().__init__(**kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=0,
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, endpoint, method, url, *, retry=None, **kwargs):
+        """
+        Send a request through the shared session.
+
+        Args:
+            endpoint: Logical endpoint name, used for timeouts and counters
+            method: HTTP method
+            url: Absolute URL
+            retry: Force retries on/off. Defaults to on for idempotent methods only.
+            **kwargs: Passed through to requests.Session.request
+
+        Returns:
+            requests.Response
+
+        Raises:
+            requests.exceptions.RequestException once the retry budget is spent.
+            RateLimitExceeded if the provider quota has no token within the wait limit.
+        """
+        method = method.upper()
+        kwargs.setdefault('timeout', self.get_timeout(endpoint))
+        budget = self._retry_budget(method, retry)
+
+        attempt = 0
+        while True:
+            if self.rate_limit_scope:
+                provider_rate_limiter.acquire(self.rate_limit_scope, endpoint)
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._record(endpoint, started, error=True)
+                if attempt >= budget:
+                    raise
+                logger.warning(f"{method} {endpoint} failed ({e.__class__.__name__}), retrying")
+                delay = self._backoff(attempt + 1)
+            else:
+                self._record(endpoint, started, error=response.status_code >= 400)
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= budget:
+                    return response
+                logger.warning(f"{method} {endpoint} returned {response.status_code}, retrying")
+                delay = self._backoff(attempt + 1, response.headers.get('Retry-After'))
+                response.close()
+
+            attempt += 1
+            self._record_retry(endpoint)
+            time.sleep(delay)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncHttpTransport(BaseTransport):
+    """
+    asyncio counterpart of HttpTransport built on httpx.AsyncClient.
+
+    Pooled connections belong to the event loop that opened them, so one client
+    is kept per running loop.
+
+    Args:
+        pool_maxsize: Maximum keep-alive connections
+        max_connections: Maximum concurrent connections
+        transport: Optional httpx transport (e.g. httpx.MockTransport for offline use)
+        **kwargs: Timeout and retry options, see BaseTransport
+    """
+
+    def __init__(self, *, pool_maxsize=20, max_connections=100, transport=None, pool_connections=None, **kwargs):
+        super().__init__(**kwargs)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=pool_maxsize,
+        )
+        self.transport = transport
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _get_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(limits=self.limits, transport=self.transport)
+            self._clients[loop] = client
+        return client
+
+    async def request(self, endpoint, method, url, *, retry=None, **kwargs):
+        """
+        Send a request through the client bound to the running loop.
+
+        Same contract as HttpTransport.request, but returns an httpx.Response
+        and raises httpx.HTTPError once the retry budget is spent.
+        """
+        method = method.upper()
+        connect, read = self.get_timeout(endpoint)
+        kwargs.setdefault('timeout', httpx.Timeout(read, connect=connect))
+        budget = self._retry_budget(method, retry)
+        client = self._get_client()
+
+        attempt = 0
+        while True:
+            if self.rate_limit_scope:
+                await provider_rate_limiter.aacquire(self.rate_limit_scope, endpoint)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                self._record(endpoint, started, error=True)
+                if attempt >= budget:
+                    raise
+                logger.warning(f"{method} {endpoint} failed ({e.__class__.__name__}), retrying")
+                delay = self._backoff(attempt + 1)
+            else:
+                self._record(endpoint, started, error=response.status_code >= 400)
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= budget:
+                    return response
+                logger.warning(f"{method} {endpoint} returned {response.status_code}, retrying")
+                delay = self._backoff(attempt + 1, response.headers.get('Retry-After'))
+                await response.aclose()
+
+            attempt += 1
+            self._record_retry(endpoint)
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        """Close the client bound to the running loop."""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
@@ -0,0 +1,445 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Payment, PayoutOutbox
+from .providers import get_payment_provider
+
+logger = logging.getLogger(__name__)
+
+
+def _close_event_loop(loop, provider_names):
+    """
+    Close a run's private event loop, first closing the async clients the
+    providers opened on it; their pooled connections cannot outlive the loop.
+    """
+    async def aclose_providers():
+        for provider_name in provider_names:
+            try:
+                await get_payment_provider(provider_name).aclose()
+            except Exception as e:
+                logger.error(f"Closing {provider_name} async clients failed: {str(e)}")
+
+    try:
+        loop.run_until_complete(aclose_providers())
+    finally:
+        loop.close()
+
+
+@dataclass
+class ReconciliationReport:
+    scanned: int = 0
+    completed: int = 0
+    still_pending: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def throughput(self):
+        return self.scanned / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        data = asdict(self)
+        data['elapsed'] = round(self.elapsed, 3)
+        data['throughput'] = round(self.throughput, 2)
+        return data
+
+
+class FundingReconciler:
+    """
+    Verifies stale pending funding payments against their provider in bulk.
+
+    Pending rows are read in keyset-ordered chunks, each chunk is verified
+    concurrently (thread pool or asyncio), and every verified payment in a chunk
+    is applied in a single transaction through EscrowService.complete_funding_batch.
+
+    Args:
+        older_than: Only reconcile payments created at least this long ago
+        chunk_size: Rows fetched and applied per batch
+        workers: Maximum concurrent provider calls
+        mode: 'threads' or 'async'
+        provider_name: Restrict to a single provider
+    """
+
+    MODES = ('threads', 'async')
+
+    def __init__(self, *, older_than=timedelta(minutes=15), chunk_size=500, workers=16, mode='threads', provider_name=None, escrow_service=None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown reconciliation mode: {mode}")
+        self.older_than = older_than
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.mode = mode
+        self.provider_name = provider_name
+
+        if escrow_service is None:
+            from escrow.services import EscrowService
+            escrow_service = EscrowService()
+        self.escrow_service = escrow_service
+
+    def pending_queryset(self):
+        cutoff = timezone.now() - self.older_than
+        queryset = Payment.objects.filter(
+            transaction_type='funding',
+            status='pending',
+            timestamp__lte=cutoff,
+        ).exclude(provider_transactionn_id__isnull=True)
+        if self.provider_name:
+            queryset = queryset.filter(provider=self.provider_name)
+        return queryset
+
+    def iter_chunks(self, limit=None):
+        """
+        Yield lists of (payment_id, provider, provider_tx_id) in id order.
+        Keyset pagination keeps every query cheap however far the scan has gone.
+        """
+        queryset = self.pending_queryset().order_by('id')
+        last_id = 0
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+            chunk = list(
+                queryset.filter(id__gt=last_id).values_list('id', 'provider', 'provider_transactionn_id')[:size]
+            )
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1][0]
+            if remaining is not None:
+                remaining -= len(chunk)
+
+    def run(self, limit=None):
+        """
+        Reconcile every matching pending payment.
+
+        Args:
+            limit: Stop after scanning this many payments
+
+        Returns:
+            ReconciliationReport
+        """
+        report = ReconciliationReport()
+        started = time.perf_counter()
+
+        # One loop for the whole run so pooled async connections survive between chunks;
+        # results are applied outside it because the ORM calls are synchronous.
+        loop = executor = None
+        if self.mode == 'async':
+            loop = asyncio.new_event_loop()
+            verify_chunk = lambda chunk: loop.run_until_complete(self._averify_chunk(chunk))
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='reconcile')
+            verify_chunk = lambda chunk: list(executor.map(self._verify_one, chunk))
+
+        provider_names = set()
+        try:
+            for chunk in self.iter_chunks(limit):
+                provider_names.update(row[1] for row in chunk)
+                self._apply(chunk, verify_chunk(chunk), report)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if loop is not None:
+                _close_event_loop(loop, provider_names)
+
+        report.elapsed = time.perf_counter() - started
+        logger.info(f"Funding reconciliation finished: {report.as_dict()}")
+        return report
+
+    def _verify_one(self, row):
+        payment_id, provider_name, tx_ref = row
+        try:
+            return get_payment_provider(provider_name).verify(tx_ref)
+        except Exception as e:
+            logger.error(f"Reconciliation verify failed for payment {payment_id}: {str(e)}")
+            return e
+
+    async def _averify_one(self, row, semaphore):
+        payment_id, provider_name, tx_ref = row
+        async with semaphore:
+            try:
+                return await get_payment_provider(provider_name).averify(tx_ref)
+            except Exception as e:
+                logger.error(f"Reconciliation verify failed for payment {payment_id}: {str(e)}")
+                return e
+
+    async def _averify_chunk(self, chunk):
+        semaphore = asyncio.Semaphore(self.workers)
+        return await asyncio.gather(*(self._averify_one(row, semaphore) for row in chunk))
+
+    def _apply(self, chunk, results, report):
+        verified_ids = []
+        for (payment_id, _, _), result in zip(chunk, results):
+            if isinstance(result, Exception):
+                report.errors += 1
+            elif result:
+                verified_ids.append(payment_id)
+            else:
+                report.still_pending += 1
+        report.scanned += len(chunk)
+
+        if verified_ids:
+            try:
+                report.completed += self.escrow_service.complete_funding_batch(verified_ids)
+            except Exception as e:
+                logger.error(f"Reconciliation batch apply failed: {str(e)}")
+                report.errors += len(verified_ids)
+
+
+# Transfer states as reported by get_transfer_status(); anything else is still in flight.
+TRANSFER_PAID_STATUSES = frozenset({'success', 'successful', 'completed', 'paid', 'succeeded'})
+TRANSFER_FAILED_STATUSES = frozenset({'failed', 'declined', 'expired', 'cancelled', 'canceled', 'reversed'})
+# The provider holds no transfer under the reference, so it was never created.
+TRANSFER_NOT_FOUND_STATUSES = frozenset({'not_found'})
+
+
+@dataclass
+class TransferPollReport:
+    scanned: int = 0
+    paid: int = 0
+    failed: int = 0
+    requeued: int = 0
+    still_pending: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def resolved(self):
+        return self.paid + self.failed
+
+    @property
+    def throughput(self):
+        return self.scanned / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        data = asdict(self)
+        data['resolved'] = self.resolved
+        data['elapsed'] = round(self.elapsed, 3)
+        data['throughput'] = round(self.throughput, 2)
+        return data
+
+
+class TransferStatusPoller:
+    """
+    Resolves sent payouts whose confirmation webhook never arrived.
+
+    Release payments still pending a while after their outbox row was sent
+    are checked with the provider's get_transfer_status, a chunk at a time and
+    concurrently (thread pool or asyncio). Paid and failed transfers are fed
+    into EscrowService.verify_transfer_to_freelancer exactly as the webhook
+    would be. A payout still in flight, or whose check failed, is not looked
+    at again for backoff * 2 ** (checks - 1) seconds, capped at backoff_max.
+    A payout the provider has no transfer for (its send timed out before the
+    provider recorded it) is handed back to the outbox to be sent again under
+    the same idempotency key.
+
+    Args:
+        older_than: Only poll payouts sent at least this long ago
+        chunk_size: Payouts fetched and checked per batch
+        workers: Maximum concurrent provider calls
+        mode: 'threads' or 'async'
+        provider_name: Restrict to a single provider
+        backoff: Base delay in seconds between checks of the same payout
+        backoff_max: Upper bound for that delay
+    """
+
+    MODES = ('threads', 'async')
+
+    def __init__(self, *, older_than=timedelta(minutes=30), chunk_size=200, workers=8, mode='threads', provider_name=None,
+                 backoff=300, backoff_max=6 * 60 * 60, escrow_service=None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown transfer poll mode: {mode}")
+        self.older_than = older_than
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.mode = mode
+        self.provider_name = provider_name
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+        if escrow_service is None:
+            from escrow.services import EscrowService
+            escrow_service = EscrowService()
+        self.escrow_service = escrow_service
+
+    def due_queryset(self):
+        now = timezone.now()
+        cutoff = now - self.older_than
+        queryset = Payment.objects.filter(
+            transaction_type='release',
+            status__in=['pending', 'active'],
+            # A payout is sent after its payment row is written, so this only narrows the index range.
+            timestamp__lte=cutoff,
+            outbox__status='sent',
+            outbox__sent_at__lte=cutoff,
+        ).filter(
+            Q(outbox__next_status_check_at__isnull=True) | Q(outbox__next_status_check_at__lte=now)
+        )
+        if self.provider_name:
+            queryset = queryset.filter(provider=self.provider_name)
+        return queryset
+
+    def iter_chunks(self, limit=None):
+        """
+        Yield lists of (payment_id, provider, transfer_reference, outbox_id, status_checks) in id order.
+        """
+        queryset = self.due_queryset().order_by('id')
+        last_id = 0
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+            chunk = list(
+                queryset.filter(id__gt=last_id).values_list(
+                    'id', 'provider', 'provider_transactionn_id', 'outbox__id', 'outbox__status_checks',
+                )[:size]
+            )
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1][0]
+            if remaining is not None:
+                remaining -= len(chunk)
+
+    def run(self, limit=None):
+        """
+        Check every due payout once.
+
+        Args:
+            limit: Stop after checking this many payouts
+
+        Returns:
+            TransferPollReport
+        """
+        report = TransferPollReport()
+        started = time.perf_counter()
+
+        loop = executor = None
+        if self.mode == 'async':
+            loop = asyncio.new_event_loop()
+            check_chunk = lambda chunk: loop.run_until_complete(self._acheck_chunk(chunk))
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='transfer-poll')
+            check_chunk = lambda chunk: list(executor.map(self._check_one, chunk))
+
+        provider_names = set()
+        try:
+            for chunk in self.iter_chunks(limit):
+                provider_names.update(row[1] for row in chunk)
+                self._apply(chunk, check_chunk(chunk), report)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if loop is not None:
+                _close_event_loop(loop, provider_names)
+
+        report.elapsed = time.perf_counter() - started
+        if report.scanned:
+            logger.info(f"Transfer status poll finished: {report.as_dict()}")
+        return report
+
+    def _check_one(self, row):
+        payment_id, provider_name, reference = row[:3]
+        try:
+            return get_payment_provider(provider_name).get_transfer_status(reference)
+        except Exception as e:
+            logger.error(f"Transfer status check failed for payment {payment_id}: {str(e)}")
+            return e
+
+    async def _acheck_one(self, row, semaphore):
+        payment_id, provider_name, reference = row[:3]
+        async with semaphore:
+            try:
+                return await get_payment_provider(provider_name).aget_transfer_status(reference)
+            except Exception as e:
+                logger.error(f"Transfer status check failed for payment {payment_id}: {str(e)}")
+                return e
+
+    async def _acheck_chunk(self, chunk):
+        semaphore = asyncio.Semaphore(self.workers)
+        return await asyncio.gather(*(self._acheck_one(row, semaphore) for row in chunk))
+
+    @staticmethod
+    def outcome(result):
+        """
+        Returns:
+            True if the transfer was paid, False if it failed, None if it is
+            still in flight or the check itself failed
+        """
+        if not isinstance(result, dict):
+            return None
+        status_value = str(result.get('status') or '').lower()
+        if status_value in TRANSFER_PAID_STATUSES:
+            return True
+        if status_value in TRANSFER_FAILED_STATUSES:
+            return False
+        return None
+
+    def _apply(self, chunk, results, report):
+        retry = []
+        requeue = []
+        applied = {}
+        for row, result in zip(chunk, results):
+            payment_id, provider_name, reference = row[:3]
+            report.scanned += 1
+            success = self.outcome(result)
+            if isinstance(result, dict) and str(result.get('status') or '').lower() in TRANSFER_NOT_FOUND_STATUSES:
+                requeue.append(row[3])
+                continue
+            if success is None:
+                if isinstance(result, Exception) or result.get('status') == 'error':
+                    report.errors += 1
+                else:
+                    report.still_pending += 1
+                retry.append(row)
+                continue
+            try:
+                self.escrow_service.verify_transfer_to_freelancer(
+                    provider_name=provider_name,
+                    transfer_reference=reference,
+                    success=success,
+                    details=result,
+                )
+            except Exception as e:
+                logger.error(f"Applying polled transfer status failed for payment {payment_id}: {str(e)}")
+            applied[payment_id] = (row, success)
+
+        # Settlement is judged by the payment row rather than the return value, so a
+        # payout settled by a webhook between the check and now still counts as settled.
+        unsettled = set(
+            Payment.objects.filter(id__in=list(applied), status__in=['pending', 'active']).values_list('id', flat=True)
+        ) if applied else set()
+        for payment_id, (row, success) in applied.items():
+            if payment_id in unsettled:
+                report.errors += 1
+                retry.append(row)
+            elif success:
+                report.paid += 1
+            else:
+                report.failed += 1
+
+        if requeue:
+            report.requeued += PayoutOutbox.objects.filter(id__in=requeue, status='sent').update(
+                status='pending', locked_until=None, status_checks=0, next_status_check_at=None,
+            )
+        self._schedule_next_checks(retry)
+
+    def _schedule_next_checks(self, rows):
+        """Push each unresolved payout's next check out exponentially, one update per distinct check count."""
+        by_checks = {}
+        for row in rows:
+            outbox_id, checks = row[3:]
+            by_checks.setdefault(checks + 1, []).append(outbox_id)
+
+        now = timezone.now()
+        for checks, outbox_ids in by_checks.items():
+            delay = min(self.backoff_max, self.backoff * 2 ** (checks - 1))
+            PayoutOutbox.objects.filter(id__in=outbox_ids).update(
+                status_checks=checks,
+                next_status_check_at=now + timedelta(seconds=delay),
+            )
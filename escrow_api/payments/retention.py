@@ -0,0 +1,158 @@
+import gzip
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .models import WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_FIELDS = (
+    'id', 'provider', 'event_id', 'event_type', 'reference', 'payload', 'status',
+    'attempts', 'last_error', 'received_at', 'processed_at',
+)
+
+
+@dataclass
+class ArchiveReport:
+    rows: int = 0
+    raw_bytes: int = 0
+    bytes_written: int = 0
+    files: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def throughput(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        data = asdict(self)
+        data['elapsed'] = round(self.elapsed, 3)
+        data['throughput'] = round(self.throughput, 2)
+        return data
+
+
+class WebhookArchiver:
+    """
+    Moves settled webhook inbox rows older than the retention window into
+    gzip-compressed NDJSON files and deletes them from the database.
+
+    Files are partitioned by the day the events were received
+    (<archive_dir>/YYYY/MM/DD/webhook-events-<run>.ndjson.gz); each run writes
+    its own files, so an interrupted run never corrupts an earlier archive.
+    Rows are read in keyset-ordered chunks, and a chunk is only deleted after
+    its lines are flushed and fsynced, so a crash can at worst archive a chunk
+    twice, never lose it. Pending and processing events are never archived.
+
+    Events inside the window keep their unique event_id row, so redeliveries
+    within it are still rejected by the inbox insert. The window should
+    comfortably exceed the providers' retry horizon (days, not weeks).
+
+    Args:
+        retention: Archive events received longer ago than this
+        archive_dir: Root directory of the archive
+        chunk_size: Rows written and deleted per batch
+    """
+
+    SETTLED_STATUSES = ('processed', 'failed')
+
+    def __init__(self, *, retention=None, archive_dir=None, chunk_size=None):
+        if retention is None:
+            retention = timedelta(days=getattr(settings, 'WEBHOOK_RETENTION_DAYS', 30))
+        self.retention = retention
+        self.archive_dir = Path(archive_dir or getattr(settings, 'WEBHOOK_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'archive' / 'webhooks'))
+        self.chunk_size = chunk_size or getattr(settings, 'WEBHOOK_ARCHIVE_CHUNK_SIZE', 1000)
+        self.run_id = f"{timezone.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self._files = {}
+
+    def expired_queryset(self):
+        cutoff = timezone.now() - self.retention
+        return WebhookEvent.objects.filter(received_at__lt=cutoff, status__in=self.SETTLED_STATUSES)
+
+    def iter_chunks(self, limit=None):
+        """
+        Yield lists of archived-field dicts in id order.
+        """
+        queryset = self.expired_queryset().order_by('id')
+        last_id = 0
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+            chunk = list(queryset.filter(id__gt=last_id).values(*ARCHIVED_FIELDS)[:size])
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1]['id']
+            if remaining is not None:
+                remaining -= len(chunk)
+
+    def run(self, limit=None):
+        """
+        Archive and delete every expired settled event.
+
+        Args:
+            limit: Stop after archiving this many events
+
+        Returns:
+            ArchiveReport
+        """
+        report = ArchiveReport()
+        started = time.perf_counter()
+        try:
+            for chunk in self.iter_chunks(limit):
+                report.raw_bytes += self._write_chunk(chunk)
+                with transaction.atomic():
+                    WebhookEvent.objects.filter(id__in=[row['id'] for row in chunk]).delete()
+                report.rows += len(chunk)
+        finally:
+            report.files = len(self._files)
+            report.bytes_written = self._close_files()
+
+        report.elapsed = time.perf_counter() - started
+        if report.rows:
+            logger.info(f"Webhook archive run {self.run_id} finished: {report.as_dict()}")
+        return report
+
+    def _write_chunk(self, chunk):
+        """Append a chunk to its day files and make it durable; returns uncompressed bytes."""
+        written = 0
+        touched = set()
+        for row in chunk:
+            line = (json.dumps(row, cls=DjangoJSONEncoder) + '\n').encode()
+            day = row['received_at'].date()
+            self._file_for(day).write(line)
+            touched.add(day)
+            written += len(line)
+        for day in touched:
+            handle, raw = self._files[day]
+            handle.flush()
+            raw.flush()
+            os.fsync(raw.fileno())
+        return written
+
+    def _file_for(self, day):
+        if day not in self._files:
+            directory = self.archive_dir / f"{day:%Y}" / f"{day:%m}" / f"{day:%d}"
+            directory.mkdir(parents=True, exist_ok=True)
+            raw = open(directory / f"webhook-events-{self.run_id}.ndjson.gz", 'ab')
+            self._files[day] = (gzip.GzipFile(fileobj=raw, mode='ab'), raw)
+        return self._files[day][0]
+
+    def _close_files(self):
+        total = 0
+        for handle, raw in self._files.values():
+            handle.close()
+            raw.close()
+            total += os.path.getsize(raw.name)
+        self._files = {}
+        return total
@@ -3,6 +3,7 @@ from django.db import transaction
 from decimal import Decimal
 import uuid
 
+from .exports import EXPORT_FORMATS
 from .models import Payment, PayoutMethod, ChapaPayoutMethod, StripePayoutMethod, Bank
 from user_projects.models import UserProject
 from escrow.models import EscrowTransaction
@@ -18,13 +19,13 @@ class PaymentSerializer(serializers.ModelSerializer):
 
 
 class FundingInitiateSerializer(serializers.Serializer):
+    project_id = serializers.IntegerField()
     amount = serializers.DecimalField(max_digits=10, decimal_places=2)
     provider_name = serializers.CharField()
 
     def validate(self, attrs):
         request = self.context.get("request")
-        project_id = self.context.get("project_id")
-        project = UserProject.objects.filter(id=project_id).first()
+        project = UserProject.objects.filter(id=attrs['project_id']).first()
         if not project:
             raise serializers.ValidationError("Project not found.")
         if project.client != request.user:
@@ -34,6 +35,7 @@ class FundingInitiateSerializer(serializers.Serializer):
             initial_milestone = milestones.first()
             if attrs['amount'] < initial_milestone.amount:
                 raise serializers.ValidationError(f'Funding must be at least the initial milestone amount ({initial_milestone.amount})')
+        attrs['project'] = project
         return attrs
 
 
@@ -53,6 +55,21 @@ class RefundSerializer(serializers.Serializer):
     reason = serializers.CharField(required=False, allow_blank=True)
 
 
+class PaymentExportSerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    provider = serializers.CharField(required=False)
+    transaction_type = serializers.ChoiceField(choices=Payment.TYPE_CHOICES, required=False)
+    status = serializers.ChoiceField(choices=Payment.STATUS_CHOICES, required=False)
+    export_format = serializers.ChoiceField(choices=EXPORT_FORMATS, default='csv')
+    gzip = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if attrs.get('date_from') and attrs.get('date_to') and attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError("date_from must not be after date_to.")
+        return attrs
+
+
 class PayoutMethodSerializer(serializers.ModelSerializer):
     class Meta:
         model = PayoutMethod
@@ -1,7 +1,9 @@
+from asgiref.sync import sync_to_async
 from django.db import transaction
 from django.core.exceptions import ObjectDoesNotExist
 from .providers import get_payment_provider
 from .models import Payment, PayoutMethod, StripePayoutMethod, ChapaPayoutMethod
+from .payout_profiles import payout_profiles
 from escrow.models import EscrowTransaction
 from user_projects.models import UserProject
 import logging
@@ -31,9 +33,13 @@ class PaymentService:
         provider, _ = self._get_provider(provider_name)
         return provider.verify(provider_transaction_id)
 
-    def refund(self, *, provider_name, provider_transaction_id, amount=None, reason="Project refund"):
+    def refund(self, *, provider_name, provider_transaction_id, amount=None, reason="Project refund", reference=None):
         provider, _ = self._get_provider(provider_name)
-        return provider.refund(provider_transaction_id, amount, reason)
+        return provider.refund(provider_transaction_id, amount, reason, reference=reference)
+
+    def get_refund_status(self, *, provider_name, provider_transaction_id, refund_reference):
+        provider, _ = self._get_provider(provider_name)
+        return provider.get_refund_status(provider_transaction_id, refund_reference)
     
     def transfer_to_freelancer(self, freelancer, amount, provider_name = None, **kwargs):
         """
@@ -66,43 +72,72 @@ class PaymentService:
                 'message': f'Transfer failed: {str(e)}'
             }
 
-    def _get_freelancer_payout_method(self, freelancer, provider_name: str):
+    def get_transfer_status(self, *, provider_name, transfer_reference):
+        provider, _ = self._get_provider(provider_name)
+        return provider.get_transfer_status(transfer_reference)
+
+    # Async entry points for ASGI callers; same contracts as the sync methods.
+
+    async def ainit_charge(self, *, user, amount, provider_name=None, **kwargs):
+        provider, resolved_name = self._get_provider(provider_name)
+        return await provider.acharge(user=user, amount=amount, **kwargs)
+
+    async def averify_payment(self, *, provider_name, provider_transaction_id):
+        provider, _ = self._get_provider(provider_name)
+        return await provider.averify(provider_transaction_id)
+
+    async def arefund(self, *, provider_name, provider_transaction_id, amount=None, reason="Project refund", reference=None):
+        provider, _ = self._get_provider(provider_name)
+        return await provider.arefund(provider_transaction_id, amount, reason, reference=reference)
+
+    async def aget_transfer_status(self, *, provider_name, transfer_reference):
+        provider, _ = self._get_provider(provider_name)
+        return await provider.aget_transfer_status(transfer_reference)
+
+    async def atransfer_to_freelancer(self, freelancer, amount, provider_name=None, **kwargs):
         """
-        Get freelancer's preferred payment method for the given provider.
+        Async counterpart of transfer_to_freelancer().
         """
+        provider, resolved_name = self._get_provider(provider_name)
+
         try:
-            # Locate base payout method for provider
-            payout_method = PayoutMethod.objects.filter(
-                user=freelancer,
-                provider=provider_name,
-                is_active=True,
-            ).order_by('-is_default', '-created_at').first()
+            payout_method = await sync_to_async(self._get_freelancer_payout_method)(freelancer, resolved_name)
 
             if not payout_method:
-                return None
-
-            # Map provider-specific details
-            if provider_name == 'chapa':
-                details = getattr(payout_method, 'chapa_details', None)
-                if not details:
-                    return None
                 return {
-                    'account_name': details.account_name,
-                    'account_number': details.account_number,
-                    'bank_code': details.bank_code,
-                    'bank_name': details.bank_name,
+                    'status': 'error',
+                    'message': f'No {resolved_name} payment method found for freelancer'
                 }
-            elif provider_name == 'stripe':
-                details = getattr(payout_method, 'stripe_details', None)
-                if not details or not details.payouts_enabled:
-                    return None
+
+            return await provider.atransfer_to_account(
+                recipient=payout_method,
+                amount=amount,
+                **kwargs
+            )
+
+        except Exception as e:
+            logger.error(f"Transfer to freelancer failed: {str(e)}")
+            return {
+                'status': 'error',
+                'message': f'Transfer failed: {str(e)}'
+            }
+
+    def _get_freelancer_payout_method(self, freelancer, provider_name: str):
+        """
+        Get freelancer's preferred payment method for the given provider.
+        Resolved profiles are cached per (freelancer, provider); see payout_profiles.
+        """
+        try:
+            if provider_name == 'fake':
+                # Load tests run without onboarding, so every freelancer can be paid.
                 return {
-                    'stripe_account_id': details.stripe_account_id,
+                    'account_name': freelancer.get_full_name() or freelancer.email,
+                    'account_number': f'fake-{freelancer.id}',
                     'user_id': str(freelancer.id),
                 }
-            else:
-                return None
-            
+
+            return payout_profiles.get(freelancer.id, provider_name)
+
         except Exception as e:
             logger.error(f"Error getting freelancer payment method: {str(e)}")
             return None
@@ -0,0 +1,34 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import ChapaPayoutMethod, PayoutMethod, StripePayoutMethod
+from .payout_profiles import payout_profiles
+
+
+@receiver(pre_save, sender=PayoutMethod)
+def invalidate_previous_payout_profile(sender, instance, update_fields=None, **kwargs):
+    # A method moved to another provider (or user) leaves a profile cached under its old key.
+    if instance.pk is None or (update_fields is not None and not {'user', 'provider'} & set(update_fields)):
+        return
+    previous = PayoutMethod.objects.filter(pk=instance.pk).values_list('user_id', 'provider').first()
+    if previous and previous != (instance.user_id, instance.provider):
+        payout_profiles.invalidate(*previous)
+
+
+@receiver(post_save, sender=PayoutMethod)
+@receiver(post_delete, sender=PayoutMethod)
+def invalidate_payout_profile(sender, instance, **kwargs):
+    payout_profiles.invalidate(instance.user_id, instance.provider)
+
+
+@receiver(post_save, sender=ChapaPayoutMethod)
+@receiver(post_delete, sender=ChapaPayoutMethod)
+@receiver(post_save, sender=StripePayoutMethod)
+@receiver(post_delete, sender=StripePayoutMethod)
+def invalidate_payout_profile_details(sender, instance, **kwargs):
+    try:
+        payout_method = instance.payout_method
+    except ObjectDoesNotExist:
+        return  # The base method is gone; its own post_delete invalidates.
+    payout_profiles.invalidate(payout_method.user_id, payout_method.provider)
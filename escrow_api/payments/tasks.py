@@ -0,0 +1,283 @@
+import logging
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from celery import Task, shared_task
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import InterfaceError, OperationalError
+
+from escrow.models import EscrowTransaction
+from escrow.services import EscrowService
+from user_projects.models import Milestone
+from .banks import bank_directory
+from .models import Payment
+from .outbox import PayoutDispatcher
+from .reconciliation import FundingReconciler, TransferStatusPoller
+from .retention import WebhookArchiver
+from .webhooks import WebhookInboxProcessor
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+@shared_task
+def reconcile_pending_funding(older_than_minutes=15, chunk_size=500, workers=16, mode='threads', provider_name=None):
+    """
+    Periodic sweep that completes funding payments whose webhook never arrived.
+    """
+    reconciler = FundingReconciler(
+        older_than=timedelta(minutes=older_than_minutes),
+        chunk_size=chunk_size,
+        workers=workers,
+        mode=mode,
+        provider_name=provider_name,
+    )
+    return reconciler.run().as_dict()
+
+
+@shared_task
+def poll_pending_transfers(chunk_size=200, workers=8, mode='threads', provider_name=None):
+    """
+    Periodic sweep that settles sent payouts whose confirmation webhook never arrived.
+    """
+    poller = TransferStatusPoller(
+        older_than=timedelta(minutes=getattr(settings, 'TRANSFER_POLL_AFTER_MINUTES', 30)),
+        chunk_size=chunk_size,
+        workers=workers,
+        mode=mode,
+        provider_name=provider_name,
+        backoff=getattr(settings, 'TRANSFER_POLL_BACKOFF', 300),
+        backoff_max=getattr(settings, 'TRANSFER_POLL_BACKOFF_MAX', 6 * 60 * 60),
+    )
+    return poller.run().as_dict()
+
+
+@shared_task
+def expire_funding_reservations():
+    """
+    Complete or cancel funding reservations abandoned between the reserve and commit phases.
+    """
+    timeout = getattr(settings, 'FUNDING_RESERVATION_TIMEOUT', 15 * 60)
+    return EscrowService().expire_funding_reservations(timedelta(seconds=timeout))
+
+
+@shared_task
+def expire_refund_reservations():
+    """
+    Complete or cancel refunds left pending by an unknown provider outcome or a crash before recording it.
+    """
+    timeout = getattr(settings, 'REFUND_RESERVATION_TIMEOUT', 15 * 60)
+    return EscrowService().expire_refund_reservations(timedelta(seconds=timeout))
+
+
+@shared_task
+def sync_bank_directory():
+    return bank_directory.sync()
+
+
+@shared_task
+def process_webhook_inbox(batch_size=200, workers=8):
+    """
+    Drain the webhook inbox once; scheduled frequently by beat.
+    """
+    return WebhookInboxProcessor(batch_size=batch_size, workers=workers).run(once=True)
+
+
+@shared_task
+def archive_webhook_events(limit=None):
+    """
+    Archive and delete settled webhook events past the retention window; scheduled daily by beat.
+    """
+    return WebhookArchiver().run(limit=limit).as_dict()
+
+
+@shared_task
+def dispatch_payouts(batch_size=100, workers=8):
+    """
+    Send every queued payout once; scheduled frequently by beat.
+    """
+    return PayoutDispatcher(batch_size=batch_size, workers=workers).run(once=True)
+
+
+# Release and refund pipeline
+#
+# Every provider gets its own queue (payments.<provider>) and its own copy of
+# the release and refund tasks, so each can carry the provider's Celery rate
+# limit (PAYMENT_TASK_RATE_LIMITS) and a slow or throttled provider cannot
+# hold up the others; run one worker pool per queue. Enqueueing is idempotent
+# per escrow and milestone, and per client Idempotency-Key: a duplicate
+# request within PAYMENT_TASK_IDEMPOTENCY_TTL is not queued again. Requests
+# without either are always queued. The services themselves lock the escrow
+# and refuse a second payout for a pending or paid milestone, so a
+# redelivered task cannot pay twice either.
+
+TASK_PROVIDERS = ('chapa', 'stripe', 'fake', 'default')
+
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+
+def _retry_options():
+    return {
+        'autoretry_for': TRANSIENT_ERRORS,
+        'max_retries': getattr(settings, 'PAYMENT_TASK_MAX_RETRIES', 5),
+        'retry_backoff': True,
+        'retry_backoff_max': getattr(settings, 'PAYMENT_TASK_RETRY_BACKOFF_MAX', 600),
+        'retry_jitter': True,
+    }
+
+
+def _idempotency_cache():
+    return caches[getattr(settings, 'PAYMENT_TASK_IDEMPOTENCY_CACHE', 'default')]
+
+
+def _idempotency_cache_key(key):
+    return f'payment-task:{key}'
+
+
+def _finish(key, result):
+    """Keep the key of a task that went through; free it after a rejection so the request can be retried."""
+    cache_key = _idempotency_cache_key(key)
+    if result.get('status') == 'error':
+        _idempotency_cache().delete(cache_key)
+    else:
+        _idempotency_cache().set(cache_key, 'done', getattr(settings, 'PAYMENT_TASK_IDEMPOTENCY_TTL', 24 * 60 * 60))
+
+
+def _release(task, escrow_id, amount='', milestone_id=None, idempotency_key=None):
+    try:
+        escrow = EscrowTransaction.objects.select_related('project__client', 'project__freelancer').get(id=escrow_id)
+        milestone = Milestone.objects.get(id=milestone_id) if milestone_id else None
+    except (EscrowTransaction.DoesNotExist, Milestone.DoesNotExist) as e:
+        result = {'status': 'error', 'message': str(e)}
+    else:
+        result = EscrowService().release_funds(escrow, amount=amount or None, milestone=milestone)
+
+    if result.get('status') == 'error':
+        logger.error(f"Queued release for escrow {escrow_id} failed: {result.get('message')}")
+    if idempotency_key:
+        _finish(idempotency_key, result)
+    return result
+
+
+def _refund(task, escrow_id, amount='', reason='Project refund', requested_by=None, idempotency_key=None):
+    try:
+        escrow = EscrowTransaction.objects.select_related('project__client').get(id=escrow_id)
+        user = User.objects.get(id=requested_by) if requested_by else escrow.project.client
+    except (EscrowTransaction.DoesNotExist, User.DoesNotExist) as e:
+        result = {'status': 'error', 'message': str(e)}
+    else:
+        result = EscrowService().refund(
+            user=user,
+            escrow=escrow,
+            amount=Decimal(amount) if amount else None,
+            reason=reason,
+        )
+
+    if result.get('status') == 'error':
+        logger.error(f"Queued refund for escrow {escrow_id} failed: {result.get('message')}")
+    if idempotency_key:
+        _finish(idempotency_key, result)
+    return result
+
+
+class PaymentTask(Task):
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        # Retries exhausted or an unexpected error: let the client request it again.
+        key = kwargs.get('idempotency_key')
+        if key:
+            _idempotency_cache().delete(_idempotency_cache_key(key))
+
+
+def _provider_task(func, name, provider):
+    rate_limits = getattr(settings, 'PAYMENT_TASK_RATE_LIMITS', {})
+    return shared_task(
+        name=name,
+        bind=True,
+        base=PaymentTask,
+        rate_limit=rate_limits.get(provider, rate_limits.get('default')),
+        **_retry_options(),
+    )(func)
+
+
+RELEASE_TASKS = {provider: _provider_task(_release, f'payments.tasks.release.{provider}', provider) for provider in TASK_PROVIDERS}
+REFUND_TASKS = {provider: _provider_task(_refund, f'payments.tasks.refund.{provider}', provider) for provider in TASK_PROVIDERS}
+
+# Earlier task names, kept so messages already in the broker still resolve.
+task_transfer_to_freelancer = _provider_task(_release, 'payments.tasks.task_transfer_to_freelancer', 'default')
+task_refund_to_client = _provider_task(_refund, 'payments.tasks.task_refund_to_client', 'default')
+
+
+def escrow_provider(escrow):
+    """Provider that funded the escrow, which is the one its payouts and refunds go through."""
+    provider = (
+        Payment.objects.filter(escrow=escrow, transaction_type='funding', status='completed')
+        .order_by('-timestamp')
+        .values_list('provider', flat=True)
+        .first()
+    )
+    return provider if provider in TASK_PROVIDERS else 'default'
+
+
+def _enqueue(tasks, escrow, key, *, superseded=None, **kwargs):
+    """
+    Queue an escrow task on its provider's queue unless the same key was queued recently.
+
+    Args:
+        key: Idempotency key, or None to queue without deduplication
+        superseded: Optional callable; True when the request that used the key
+            has since been undone (its payout cancelled or failed), so the key
+            may be reused before its TTL runs out
+
+    Returns:
+        Dict with status 'queued' and the task id, or 'duplicate'
+    """
+    ttl = getattr(settings, 'PAYMENT_TASK_IDEMPOTENCY_TTL', 24 * 60 * 60)
+    cache_key = _idempotency_cache_key(key) if key else None
+    if cache_key and not _idempotency_cache().add(cache_key, 'queued', ttl):
+        if not (superseded and _idempotency_cache().get(cache_key) == 'done' and superseded()):
+            return {'status': 'duplicate', 'idempotency_key': key}
+        _idempotency_cache().set(cache_key, 'queued', ttl)
+
+    provider = escrow_provider(escrow)
+    try:
+        tasks[provider].apply_async(
+            kwargs={'escrow_id': escrow.id, 'idempotency_key': key, **kwargs},
+            queue=f'payments.{provider}',
+            task_id=f'{key or escrow.id}:{uuid.uuid4().hex[:8]}',
+        )
+    except Exception:
+        if cache_key:
+            _idempotency_cache().delete(cache_key)
+        raise
+    return {'status': 'queued', 'idempotency_key': key, 'provider': provider}
+
+
+def enqueue_release(escrow, *, amount=None, milestone_id=None, request_key=None):
+    """
+    Queue a release. Milestone releases are keyed on escrow and milestone, and
+    the key is given up once that milestone's payout was cancelled or failed.
+    Releases of an amount are deduplicated only on the client's
+    Idempotency-Key: two releases of the same amount are two payouts.
+    """
+    superseded = None
+    if milestone_id:
+        key = f'release:{escrow.id}:milestone:{milestone_id}'
+        superseded = lambda: not Payment.objects.filter(
+            escrow=escrow,
+            transaction_type='release',
+            milestone_id=milestone_id,
+            status__in=['pending', 'active', 'completed'],
+        ).exists()
+    else:
+        key = f'release:{escrow.id}:request:{request_key}' if request_key else None
+    return _enqueue(RELEASE_TASKS, escrow, key, superseded=superseded, amount=str(amount or ''), milestone_id=milestone_id)
+
+
+def enqueue_refund(escrow, *, requested_by, amount=None, reason='Project refund', request_key=None):
+    """Queue a refund, deduplicated on the client's Idempotency-Key when one is given."""
+    key = f'refund:{escrow.id}:request:{request_key}' if request_key else None
+    return _enqueue(REFUND_TASKS, escrow, key, amount=str(amount or ''), reason=reason, requested_by=requested_by.id)
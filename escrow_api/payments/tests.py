@@ -1,3 +1,857 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import tempfile
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import stripe
+from celery import Task
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from escrow import ledger
+from escrow.management.commands.check_query_plans import FULL_SCAN_PATTERNS, Command as CheckQueryPlans, hot_queries
+from escrow.models import EscrowTransaction
+from escrow.services import EscrowService
+from user_projects.models import UserProject
+
+from .banks import BankDirectory
+from .models import Bank, ChapaPayoutMethod, Payment, PayoutMethod, PayoutOutbox, StripePayoutMethod, WebhookEvent
+from .outbox import PayoutDispatcher
+from .payout_profiles import payout_profiles
+from .reconciliation import FundingReconciler, TransferStatusPoller
+from .retention import WebhookArchiver
+from .tasks import RELEASE_TASKS, _idempotency_cache, _idempotency_cache_key, enqueue_release
+from .providers import PROVIDER_CLASSES, get_payment_provider, register_payment_provider, reset_payment_providers
+from .providers.chapa import ChapaProvider
+from .providers.fake import FakeProvider
+from .providers.local import LocalChapaAPI, LocalStripeHTTPClient
+from .providers.stripe import StripeProvider
+from .providers.transport import AsyncHttpTransport
+from .webhooks import WebhookInboxProcessor, recent_webhook_ids, record_webhook
+
+User = get_user_model()
+
+CHAPA_RECIPIENT = {'account_name': 'Test Freelancer', 'account_number': '1000123', 'bank_code': '946'}
+STRIPE_RECIPIENT = {'stripe_account_id': 'acct_local', 'user_id': 1}
+
+
+class HotQueryPlanTests(TestCase):
+    """The lookups in check_query_plans.hot_queries() must each be served by an index."""
+
+    def test_hot_queries_do_not_scan(self):
+        pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            self.skipTest(f"Query plan checks are not implemented for {connection.vendor}")
+
+        plans = CheckQueryPlans().explain_all()
+        self.assertEqual(len(plans), len(hot_queries()))
+        for label, plan in plans:
+            with self.subTest(label):
+                scans = [line for line in plan.splitlines() if pattern.search(line)]
+                self.assertEqual(scans, [], f"{label} needs a full table scan:\n{plan}")
+
+
+class LocalChapaProviderTests(TestCase):
+    """ChapaProvider's sync and async paths against the offline Chapa API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='client@example.com', user_type='client')
+
+    def setUp(self):
+        reset_payment_providers()
+        self.api = LocalChapaAPI()
+        self.provider = ChapaProvider(transport=self.api.transport(), async_transport=self.api.async_transport())
+
+    def test_charge_verify_and_refund(self):
+        charge = self.provider.charge(self.user, Decimal('50'), tx_ref='escrow-fund-test')
+        self.assertEqual(charge['tx_ref'], 'escrow-fund-test')
+        self.assertTrue(charge['data']['checkout_url'].endswith('/escrow-fund-test'))
+        self.assertTrue(self.provider.verify('escrow-fund-test'))
+
+        refund = self.provider.refund('escrow-fund-test', Decimal('20'), reference='escrow-refund-test')
+        self.assertEqual(refund['status'], 'success')
+        self.assertIn(('POST', '/v1/refund/escrow-fund-test'), self.api.requests)
+
+    def test_transfer_is_idempotent_on_its_reference(self):
+        self.assertEqual(self.provider.get_transfer_status('escrow-release-1')['status'], 'not_found')
+
+        first = self.provider.transfer_to_account(CHAPA_RECIPIENT, Decimal('10'), reference='escrow-release-1')
+        again = self.provider.transfer_to_account(CHAPA_RECIPIENT, Decimal('10'), reference='escrow-release-1')
+
+        self.assertEqual(first['status'], 'success')
+        self.assertEqual(again['status'], 'unconfirmed')
+        self.assertEqual(self.provider.get_transfer_status('escrow-release-1')['status'], 'success')
+
+    def test_refund_without_an_answer_is_unconfirmed(self):
+        self.api.lost_answers = ('/refund/',)
+        refund = self.provider.refund('escrow-fund-test', Decimal('20'), reference='escrow-refund-test')
+        self.assertEqual((refund['status'], refund['reference']), ('unconfirmed', 'escrow-refund-test'))
+        self.assertIn(('POST', '/v1/refund/escrow-fund-test'), self.api.requests)
+
+    def test_provider_errors_are_reported(self):
+        self.api.status_code = 400
+        self.assertEqual(self.provider.charge(self.user, Decimal('50'))['status'], 'error')
+        self.assertFalse(self.provider.verify('escrow-fund-test'))
+        self.assertEqual(self.provider.get_banks()['status'], 'error')
+
+    async def test_async_charge_and_transfer(self):
+        try:
+            charge = await self.provider.acharge(self.user, Decimal('50'), tx_ref='escrow-fund-async')
+            self.assertEqual(charge['tx_ref'], 'escrow-fund-async')
+            self.assertTrue(await self.provider.averify('escrow-fund-async'))
+
+            first = await self.provider.atransfer_to_account(CHAPA_RECIPIENT, Decimal('10'), reference='escrow-release-2')
+            again = await self.provider.atransfer_to_account(CHAPA_RECIPIENT, Decimal('10'), reference='escrow-release-2')
+            self.assertEqual(first['status'], 'success')
+            self.assertEqual(again['status'], 'unconfirmed')
+            self.assertEqual((await self.provider.aget_transfer_status('escrow-release-2'))['status'], 'success')
+            self.assertEqual((await self.provider.aget_transfer_status('escrow-release-3'))['status'], 'not_found')
+
+            self.api.lost_answers = ('/refund/',)
+            refund = await self.provider.arefund('escrow-fund-async', Decimal('20'), reference='escrow-refund-async')
+            self.assertEqual(refund['status'], 'unconfirmed')
+        finally:
+            await self.provider.async_transport.aclose()
+
+
+class LocalStripeProviderTests(TestCase):
+    """StripeProvider's sync and async paths against the offline Stripe HTTP client."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='client@example.com', user_type='client')
+
+    def setUp(self):
+        reset_payment_providers()
+        self.http_client = LocalStripeHTTPClient()
+        self.provider = StripeProvider(http_client=self.http_client)
+        # The sync methods use the module-level client.
+        previous = stripe.default_http_client
+        stripe.default_http_client = self.http_client
+        self.addCleanup(setattr, stripe, 'default_http_client', previous)
+
+    def test_charge_and_verify(self):
+        charge = self.provider.charge(self.user, Decimal('50'), tx_ref='escrow-fund-test')
+        self.assertEqual(charge['status'], 'success')
+        self.assertEqual(charge['tx_ref'], 'escrow-fund-test')
+        self.assertTrue(self.provider.verify(charge['payment_intent_id']))
+
+    def test_refunds_are_found_by_reference(self):
+        intent = self.provider.charge(self.user, Decimal('50'))['payment_intent_id']
+        self.assertEqual(self.provider.refund(intent, Decimal('10'), reference='escrow-refund-a')['status'], 'success')
+        self.assertEqual(self.provider.refund(intent, Decimal('5'), reference='escrow-refund-b')['status'], 'success')
+
+        self.assertEqual(self.provider.get_refund_status(intent, 'escrow-refund-a')['status'], 'success')
+        self.assertEqual(self.provider.get_refund_status(intent, 'escrow-refund-c')['status'], 'not_found')
+        self.assertEqual(self.provider.get_refund_status('pi_other', 'escrow-refund-a')['status'], 'not_found')
+
+    def test_transfer_status_by_reference(self):
+        self.assertEqual(self.provider.get_transfer_status('escrow-release-1')['status'], 'not_found')
+        transfer = self.provider.transfer_to_account(
+            STRIPE_RECIPIENT, Decimal('10'), reference='escrow-release-1', idempotency_key='escrow-release-1',
+        )
+        self.assertEqual(transfer['status'], 'success')
+        self.assertEqual(self.provider.get_transfer_status('escrow-release-1')['status'], 'paid')
+
+    async def test_async_charge_refund_and_transfer(self):
+        charge = await self.provider.acharge(self.user, Decimal('50'), tx_ref='escrow-fund-async')
+        self.assertEqual(charge['status'], 'success')
+        self.assertTrue(await self.provider.averify(charge['payment_intent_id']))
+
+        refund = await self.provider.arefund(charge['payment_intent_id'], Decimal('10'), reference='escrow-refund-async')
+        self.assertEqual(refund['status'], 'success')
+
+        self.assertEqual((await self.provider.aget_transfer_status('escrow-release-2'))['status'], 'not_found')
+        transfer = await self.provider.atransfer_to_account(
+            STRIPE_RECIPIENT, Decimal('10'), reference='escrow-release-2', idempotency_key='escrow-release-2',
+        )
+        self.assertEqual(transfer['status'], 'success')
+        self.assertEqual((await self.provider.aget_transfer_status('escrow-release-2'))['status'], 'paid')
+
+
+class FakeProviderTests(TestCase):
+
+    def test_settled_outcomes_are_kept_for_recent_references_only(self):
+        provider = FakeProvider(max_outcomes=2)
+        for reference in ('escrow-release-1', 'escrow-release-2'):
+            provider.transfer_to_account({'account_name': 'x'}, Decimal('1'), reference=reference)
+        # Reading a reference keeps it; the least recently used one is evicted.
+        self.assertEqual(provider.get_transfer_status('escrow-release-1')['status'], 'success')
+        provider.transfer_to_account({'account_name': 'x'}, Decimal('1'), reference='escrow-release-3')
+
+        self.assertEqual(len(provider._outcomes), 2)
+        self.assertEqual(provider.get_transfer_status('escrow-release-1')['status'], 'success')
+        self.assertEqual(provider.get_transfer_status('escrow-release-2')['status'], 'not_found')
+
+
+class RecordingAsyncTransport(AsyncHttpTransport):
+    """AsyncHttpTransport that keeps every client it opened, to check they were closed."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.opened = []
+
+    def _get_client(self):
+        client = super()._get_client()
+        if client not in self.opened:
+            self.opened.append(client)
+        return client
+
+
+class LocalChapaProvider(ChapaProvider):
+    """ChapaProvider wired to a LocalChapaAPI, so it can be resolved by name."""
+
+    api = LocalChapaAPI()
+
+    def __init__(self, **kwargs):
+        async_transport = RecordingAsyncTransport(transport=httpx.MockTransport(self.api.handle))
+        super().__init__(transport=self.api.transport(), async_transport=async_transport, **kwargs)
+
+
+class FundingReconcilerTests(TestCase):
+
+    def setUp(self):
+        register_payment_provider('local-chapa', LocalChapaProvider)
+        self.addCleanup(reset_payment_providers)
+        self.addCleanup(PROVIDER_CLASSES.pop, 'local-chapa', None)
+
+    def test_async_run_closes_its_provider_clients(self):
+        client = User.objects.create(email='client@example.com', user_type='client')
+        project = UserProject.objects.create(client=client, title='Project', description='Work', amount=Decimal('50'))
+        escrow = EscrowTransaction.objects.create(project=project)
+        payment = Payment.objects.create(
+            escrow=escrow, user=client, amount=Decimal('50'), provider_transactionn_id='escrow-fund-local',
+            transaction_type='funding', provider='local-chapa', status='pending',
+        )
+
+        report = FundingReconciler(older_than=timedelta(0), mode='async').run()
+
+        self.assertEqual(report.completed, 1)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'completed')
+        # The run's loop is gone; a client left open on it would leak its connections.
+        opened = get_payment_provider('local-chapa').async_transport.opened
+        self.assertEqual(len(opened), 1)
+        self.assertTrue(opened[0].is_closed)
+
+
+class FundedEscrowMixin:
+    """A funded escrow on the fake provider with one queued release of 100."""
+
+    def fund_escrow(self, amount=Decimal('500')):
+        client = User.objects.create(email=f'client{EscrowTransaction.objects.count()}@example.com', user_type='client')
+        freelancer = User.objects.create(email=f'freelancer{EscrowTransaction.objects.count()}@example.com', user_type='freelancer')
+        project = UserProject.objects.create(
+            client=client, freelancer=freelancer, title='Project', description='Work', amount=amount, status='active',
+        )
+        escrow = EscrowTransaction.objects.create(project=project, status='funded')
+        funding = Payment.objects.create(
+            escrow=escrow, user=client, amount=amount, provider_transactionn_id=f'fund-{escrow.id}',
+            transaction_type='funding', provider='fake', status='completed',
+        )
+        ledger.post(escrow.id, 'funding', amount, payment=funding)
+        return escrow
+
+    def queue_release(self, escrow, amount='100'):
+        result = EscrowService().release_funds(escrow, amount=amount)
+        self.assertEqual(result['status'], 'pending', result)
+        return Payment.objects.get(id=result['release_payment_id'])
+
+
+@override_settings(PAYMENT_FAKE_PROVIDER_ENABLED=True, PAYMENT_FAKE_PROVIDER={'seed': 1})
+class PayoutOutboxTests(FundedEscrowMixin, TestCase):
+
+    def setUp(self):
+        self.escrow = self.fund_escrow()
+        self.payment = self.queue_release(self.escrow)
+        self.row = PayoutOutbox.objects.get(payment=self.payment)
+
+    def dispatch(self, **kwargs):
+        PayoutOutbox.objects.update(locked_until=None)
+        return PayoutDispatcher(workers=1, **kwargs).process_batch()
+
+    def test_dispatch_sends_the_payout_once(self):
+        self.assertEqual(self.dispatch()['sent'], 1)
+        self.row.refresh_from_db()
+        self.assertEqual(self.row.status, 'sent')
+        self.assertEqual(self.dispatch()['claimed'], 0)
+
+        result = EscrowService().verify_transfer_to_freelancer(
+            provider_name='fake', transfer_reference=self.row.provider_reference, success=True,
+        )
+        self.assertEqual(result['status'], 'success', result)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+
+    def test_transfer_that_reached_the_provider_is_not_sent_again(self):
+        self.dispatch()
+        # The worker died after the provider took the transfer but before the row was marked sent.
+        PayoutOutbox.objects.filter(id=self.row.id).update(status='pending', sent_at=None)
+
+        with override_settings(PAYMENT_FAKE_PROVIDER={'seed': 1, 'operation_failure_rate': {'transfer': 1.0}}):
+            # Same provider outcomes; only a second transfer call would now fail.
+            get_payment_provider('fake')._record_outcome(self.row.idempotency_key, 'success')
+            self.assertEqual(self.dispatch()['sent'], 1)
+
+        self.row.refresh_from_db()
+        self.assertEqual((self.row.status, self.row.attempts), ('sent', 2))
+
+    @override_settings(PAYMENT_FAKE_PROVIDER={'seed': 1, 'operation_failure_rate': {'transfer': 1.0}})
+    def test_failed_payout_is_cancelled_once_the_provider_confirms_no_transfer(self):
+        counts = [self.dispatch(max_attempts=2, retry_backoff=0) for _ in range(3)]
+        self.assertEqual([c['retried'] for c in counts], [1, 1, 0])
+        self.assertEqual(counts[-1]['failed'], 1)
+
+        self.row.refresh_from_db()
+        self.payment.refresh_from_db()
+        self.assertEqual(self.row.status, 'failed')
+        self.assertEqual(self.payment.status, 'cancelled')
+
+    @override_settings(PAYMENT_FAKE_PROVIDER={'seed': 1, 'operation_failure_rate': {'transfer': 1.0, 'transfer_status': 1.0}})
+    def test_payout_is_never_cancelled_while_its_transfer_state_is_unknown(self):
+        for _ in range(4):
+            self.dispatch(max_attempts=2, retry_backoff=0)
+
+        self.row.refresh_from_db()
+        self.payment.refresh_from_db()
+        self.assertEqual(self.row.status, 'pending')
+        self.assertEqual(self.payment.status, 'pending')
+
+    @override_settings(
+        PAYMENT_PROVIDER_RATE_LIMITS={'fake': {'transfer': {'rate': '1/h', 'burst': 1}}},
+        PAYMENT_PROVIDER_RATE_LIMIT_WAIT=0,
+    )
+    def test_throttled_payout_keeps_its_attempts(self):
+        second = self.queue_release(self.fund_escrow())
+        counts = self.dispatch()
+        self.assertEqual((counts['sent'], counts['throttled']), (1, 1))
+
+        throttled = PayoutOutbox.objects.exclude(status='sent').get()
+        self.assertIn(throttled.payment_id, (self.payment.id, second.id))
+        self.assertEqual(throttled.status, 'pending')
+        self.assertEqual(throttled.attempts, 0)
+
+
+@override_settings(PAYMENT_FAKE_PROVIDER_ENABLED=True)
+class WebhookInboxTests(FundedEscrowMixin, TestCase):
+
+    def setUp(self):
+        recent_webhook_ids.clear()
+        self.addCleanup(recent_webhook_ids.clear)
+
+    def deliver(self, event_id, **data):
+        return self.client.post('/payments/webhooks/fake/', {'id': event_id, **data}, content_type='application/json')
+
+    def test_redelivered_event_is_stored_once(self):
+        self.assertEqual(self.deliver('evt-1', reference='escrow-release-x', status='success').data['status'], 'accepted')
+        self.assertEqual(self.deliver('evt-1', reference='escrow-release-x', status='success').data['status'], 'duplicate')
+        self.assertEqual(WebhookEvent.objects.filter(event_id='evt-1').count(), 1)
+
+    def test_insert_rejects_duplicates_the_id_cache_missed(self):
+        _, created = record_webhook(provider='fake', event_id='evt-2', event_type='', reference='', payload={})
+        recent_webhook_ids.clear()
+        _, created_again = record_webhook(provider='fake', event_id='evt-2', event_type='', reference='', payload={})
+        self.assertEqual((created, created_again), (True, False))
+
+    def test_payout_confirmed_by_two_events_is_posted_once(self):
+        escrow = self.fund_escrow()
+        payment = self.queue_release(escrow)
+        PayoutDispatcher(workers=1).process_batch()
+        reference = PayoutOutbox.objects.get(payment=payment).provider_reference
+
+        for event_id in ('evt-3', 'evt-4'):
+            self.deliver(event_id, type='transfer.success', reference=reference, status='success')
+        counts = WebhookInboxProcessor(workers=1).run(once=True)
+
+        self.assertEqual(counts['processed'], 2)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'completed')
+        self.assertEqual(escrow.ledger_entries.filter(entry_type='release').values('posting_id').distinct().count(), 1)
+        self.assertTrue(ledger.replay().ok)
+
+    def sent_payout(self):
+        escrow = self.fund_escrow()
+        payment = self.queue_release(escrow)
+        PayoutDispatcher(workers=1).process_batch()
+        return escrow, payment, PayoutOutbox.objects.get(payment=payment).provider_reference
+
+    def test_failed_transfer_is_recorded_without_retries(self):
+        escrow, payment, reference = self.sent_payout()
+        # The same failure redelivered under a new event id.
+        for event_id in ('evt-5', 'evt-6'):
+            self.deliver(event_id, type='transfer.failed', reference=reference, status='failed')
+        counts = WebhookInboxProcessor(workers=1).run(once=True)
+
+        self.assertEqual((counts['processed'], counts['retried'], counts['failed']), (2, 0, 0))
+        self.assertEqual(
+            list(WebhookEvent.objects.order_by('id').values_list('status', 'attempts')),
+            [('processed', 1), ('processed', 1)],
+        )
+        payment.refresh_from_db()
+        escrow.refresh_from_db()
+        self.assertEqual((payment.status, escrow.status), ('failed', 'funded'))
+
+    def test_late_failure_for_a_confirmed_payout_does_not_hold_back_the_escrow(self):
+        escrow, payment, reference = self.sent_payout()
+        self.deliver('evt-7', type='transfer.success', reference=reference, status='success')
+        self.deliver('evt-8', type='transfer.failed', reference=reference, status='failed')
+        self.deliver('evt-9', type='transfer.success', reference='escrow-release-unknown', status='success')
+        counts = WebhookInboxProcessor(workers=1).run(once=True)
+
+        self.assertEqual((counts['processed'], counts['retried']), (3, 0))
+        self.assertFalse(WebhookEvent.objects.exclude(status='processed').exists())
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'completed')
+        self.assertTrue(ledger.replay().ok)
+
+
+class ChapaShapedBanksProvider(FakeProvider):
+    """FakeProvider listing banks the way Chapa does, including one code too long for Bank.code."""
+
+    def get_banks(self):
+        return {'status': 'success', 'banks': [
+            {'id': 'CBE01', 'name': 'Commercial Bank', 'swift': 'CBETETAA', 'acct_length': 13},
+            {'id': 'X' * 11, 'name': 'Long Code Bank'},
+        ]}
+
+
+@override_settings(PAYMENT_FAKE_PROVIDER_ENABLED=True)
+class BankDirectoryTests(TestCase):
+
+    def setUp(self):
+        register_payment_provider('fake', ChapaShapedBanksProvider)
+        self.directory = BankDirectory(provider_name='fake')
+
+    def test_over_long_codes_are_skipped_not_truncated(self):
+        result = self.directory.sync()
+        self.assertEqual((result['synced'], result['skipped']), (1, 1))
+        self.assertEqual(list(Bank.objects.values_list('code', flat=True)), ['CBE01'])
+
+    def test_provider_entries_are_served_unchanged(self):
+        self.directory.sync()
+        self.assertEqual(
+            self.directory.get().banks,
+            [{'id': 'CBE01', 'name': 'Commercial Bank', 'swift': 'CBETETAA', 'acct_length': 13}],
+        )
+
+
+@override_settings(PAYMENT_FAKE_PROVIDER_ENABLED=True)
+class PaymentTaskTests(FundedEscrowMixin, TestCase):
+
+    def setUp(self):
+        _idempotency_cache().clear()
+        self.escrow = self.fund_escrow()
+        self.api = APIClient()
+        self.api.force_authenticate(self.escrow.project.client)
+        patcher = mock.patch.object(Task, 'apply_async', autospec=True)
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, url, key=None, **data):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.api.post(url, {'escrow_id': self.escrow.id, 'amount': '100', **data}, **headers)
+
+    def queued(self):
+        return [(call.args[0].name, call.kwargs['queue']) for call in self.apply_async.call_args_list]
+
+    def test_repeated_idempotency_key_is_queued_once(self):
+        for url, task in (('/payments/release/', 'release'), ('/payments/refund/', 'refund')):
+            with self.subTest(url):
+                self.apply_async.reset_mock()
+                first = self.post(url, key=f'{task}-key')
+                again = self.post(url, key=f'{task}-key')
+
+                self.assertEqual(first.data['idempotency_key'], again.data['idempotency_key'])
+                self.assertIn('already queued', again.data['message'])
+                # Release and refund tasks go to the funding provider's own queue.
+                self.assertEqual(self.queued(), [(f'payments.tasks.{task}.fake', 'payments.fake')])
+
+    def test_requests_without_a_key_are_always_queued(self):
+        self.post('/payments/release/')
+        self.post('/payments/release/')
+        self.assertEqual(len(self.queued()), 2)
+
+    def test_rejected_task_frees_its_key(self):
+        key = enqueue_release(self.escrow, amount='5000', request_key='retry-me')['idempotency_key']
+
+        result = RELEASE_TASKS['fake'].apply(kwargs={'escrow_id': self.escrow.id, 'amount': '5000', 'idempotency_key': key}).get()
+
+        self.assertEqual(result['status'], 'error')
+        self.assertIsNone(_idempotency_cache().get(_idempotency_cache_key(key)))
+
+    def test_completed_task_keeps_its_key(self):
+        key = enqueue_release(self.escrow, amount='100', request_key='once')['idempotency_key']
+
+        RELEASE_TASKS['fake'].apply(kwargs={'escrow_id': self.escrow.id, 'amount': '100', 'idempotency_key': key})
+
+        self.assertEqual(_idempotency_cache().get(_idempotency_cache_key(key)), 'done')
+        self.assertEqual(enqueue_release(self.escrow, amount='100', request_key='once')['status'], 'duplicate')
+
+    def test_failed_task_frees_its_key(self):
+        key = enqueue_release(self.escrow, request_key='crash')['idempotency_key']
+
+        with mock.patch.object(EscrowService, 'release_funds', side_effect=RuntimeError('boom')):
+            outcome = RELEASE_TASKS['fake'].apply(kwargs={'escrow_id': self.escrow.id, 'idempotency_key': key}, throw=False)
+
+        self.assertTrue(outcome.failed())
+        self.assertIsNone(_idempotency_cache().get(_idempotency_cache_key(key)))
+
+
+class ScriptedTransferStatusProvider(FakeProvider):
+    """FakeProvider answering every transfer status check with transfer_status."""
+
+    transfer_status = 'success'
+
+    def get_transfer_status(self, transfer_reference):
+        return {'status': self.transfer_status, 'transfer_data': {'reference': transfer_reference}}
+
+
+@override_settings(PAYMENT_FAKE_PROVIDER_ENABLED=True)
+class TransferStatusPollerTests(FundedEscrowMixin, TestCase):
+
+    def setUp(self):
+        register_payment_provider('fake', ScriptedTransferStatusProvider)
+        self.addCleanup(setattr, ScriptedTransferStatusProvider, 'transfer_status', 'success')
+        self.escrow = self.fund_escrow()
+        self.payment = self.queue_release(self.escrow)
+        PayoutDispatcher(workers=1).process_batch()
+        self.make_due()
+
+    def make_due(self):
+        sent_at = timezone.now() - timedelta(hours=1)
+        Payment.objects.filter(id=self.payment.id).update(timestamp=sent_at)
+        PayoutOutbox.objects.filter(payment=self.payment).update(sent_at=sent_at, next_status_check_at=None)
+
+    def poll(self, **kwargs):
+        return TransferStatusPoller(older_than=timedelta(minutes=30), workers=1, backoff=60, backoff_max=300, **kwargs).run()
+
+    def test_paid_transfer_settles_the_payout(self):
+        report = self.poll()
+
+        self.assertEqual((report.scanned, report.paid), (1, 1))
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertTrue(ledger.replay().ok)
+
+    def test_transfer_unknown_to_the_provider_is_sent_again(self):
+        ScriptedTransferStatusProvider.transfer_status = 'not_found'
+
+        report = self.poll()
+
+        self.assertEqual(report.requeued, 1)
+        row = PayoutOutbox.objects.get(payment=self.payment)
+        self.assertEqual((row.status, row.status_checks, row.next_status_check_at), ('pending', 0, None))
+
+    def test_unresolved_checks_back_off_exponentially(self):
+        ScriptedTransferStatusProvider.transfer_status = 'pending'
+        delays = []
+        for _ in range(4):
+            started = timezone.now()
+            self.assertEqual(self.poll().still_pending, 1)
+            # Not due again until the backoff has passed.
+            self.assertEqual(self.poll().scanned, 0)
+            row = PayoutOutbox.objects.get(payment=self.payment)
+            delays.append(round((row.next_status_check_at - started).total_seconds() / 60))
+            PayoutOutbox.objects.filter(id=row.id).update(next_status_check_at=started)
+
+        self.assertEqual(row.status_checks, 4)
+        self.assertEqual(delays, [1, 2, 4, 5])
+
+    def test_settlement_is_judged_by_the_payment_row(self):
+        def settled_by_a_webhook_meanwhile(**kwargs):
+            Payment.objects.filter(id=self.payment.id).update(status='completed')
+            return {'status': 'ignored', 'message': 'Payout was already confirmed'}
+
+        service = mock.Mock()
+        service.verify_transfer_to_freelancer.side_effect = settled_by_a_webhook_meanwhile
+        self.assertEqual(self.poll(escrow_service=service).paid, 1)
+
+        Payment.objects.filter(id=self.payment.id).update(status='pending')
+        self.make_due()
+        report = self.poll(escrow_service=mock.Mock())
+        self.assertEqual((report.paid, report.errors), (0, 1))
+        self.assertEqual(PayoutOutbox.objects.get(payment=self.payment).status_checks, 1)
+
+
+class PayoutProfileCacheTests(TestCase):
+
+    def setUp(self):
+        payout_profiles.cache.clear()
+        payout_profiles.reset_stats()
+        self.freelancer = User.objects.create(email='freelancer@example.com', user_type='freelancer')
+        self.method = PayoutMethod.objects.create(user=self.freelancer, provider='chapa', is_default=True)
+        self.details = ChapaPayoutMethod.objects.create(payout_method=self.method, **CHAPA_RECIPIENT)
+
+    def test_repeated_lookups_are_served_from_the_cache(self):
+        with self.assertNumQueries(1):
+            profile = payout_profiles.get(self.freelancer.id, 'chapa')
+        with self.assertNumQueries(0):
+            self.assertEqual(payout_profiles.get(self.freelancer.id, 'chapa'), profile)
+        self.assertEqual(profile['account_number'], CHAPA_RECIPIENT['account_number'])
+
+        # No usable method is cached as well.
+        payout_profiles.get(self.freelancer.id, 'stripe')
+        with self.assertNumQueries(0):
+            self.assertIsNone(payout_profiles.get(self.freelancer.id, 'stripe'))
+        self.assertEqual(payout_profiles.stats(), {'hits': 2, 'misses': 2, 'hit_rate': 0.5})
+
+    def test_saving_the_details_invalidates_the_profile(self):
+        payout_profiles.get(self.freelancer.id, 'chapa')
+        self.details.account_number = '2000456'
+        self.details.save()
+
+        self.assertEqual(payout_profiles.get(self.freelancer.id, 'chapa')['account_number'], '2000456')
+
+    def test_profile_cached_before_commit_is_dropped_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.method.is_active = False
+            self.method.save()
+            # A reader that cached the profile while the save was uncommitted.
+            payout_profiles.cache.set(payout_profiles._key(self.freelancer.id, 'chapa'), {'profile': CHAPA_RECIPIENT})
+
+        self.assertIsNone(payout_profiles.get(self.freelancer.id, 'chapa'))
+
+    def test_changing_the_provider_invalidates_both_profiles(self):
+        StripePayoutMethod.objects.create(payout_method=self.method, stripe_account_id='acct_1', payouts_enabled=True)
+        self.assertIsNotNone(payout_profiles.get(self.freelancer.id, 'chapa'))
+        self.assertIsNone(payout_profiles.get(self.freelancer.id, 'stripe'))
+
+        self.method.provider = 'stripe'
+        self.method.save()
+
+        self.assertIsNone(payout_profiles.get(self.freelancer.id, 'chapa'))
+        self.assertEqual(payout_profiles.get(self.freelancer.id, 'stripe')['stripe_account_id'], 'acct_1')
+
+
+class WebhookArchiverTests(TestCase):
+
+    def setUp(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        self.archive_dir = Path(archive_dir.name)
+
+    def create_event(self, event_id, status, age):
+        event = WebhookEvent.objects.create(
+            provider='fake', event_id=event_id, reference=f'ref-{event_id}', payload={'id': event_id}, status=status,
+        )
+        WebhookEvent.objects.filter(id=event.id).update(received_at=timezone.now() - age)
+        return event
+
+    def archived_lines(self):
+        lines = []
+        for path in sorted(self.archive_dir.rglob('*.ndjson.gz')):
+            with gzip.open(path, 'rt') as archive:
+                lines.extend(json.loads(line) for line in archive)
+        return lines
+
+    def test_only_settled_events_past_the_window_are_archived(self):
+        self.create_event('old-processed', 'processed', timedelta(days=40))
+        self.create_event('old-failed', 'failed', timedelta(days=40))
+        self.create_event('old-pending', 'pending', timedelta(days=40))
+        self.create_event('old-processing', 'processing', timedelta(days=40))
+        self.create_event('recent', 'processed', timedelta(days=5))
+
+        report = WebhookArchiver(retention=timedelta(days=30), archive_dir=self.archive_dir, chunk_size=1).run()
+
+        self.assertEqual(report.rows, 2)
+        self.assertEqual(
+            set(WebhookEvent.objects.values_list('event_id', flat=True)), {'old-pending', 'old-processing', 'recent'},
+        )
+        lines = self.archived_lines()
+        self.assertEqual({line['event_id'] for line in lines}, {'old-processed', 'old-failed'})
+        self.assertEqual(lines[0]['payload'], {'id': lines[0]['event_id']})
+
+    def test_chunk_is_deleted_only_after_it_was_written(self):
+        for number in range(3):
+            self.create_event(f'evt-{number}', 'processed', timedelta(days=40))
+        archiver = WebhookArchiver(retention=timedelta(days=30), archive_dir=self.archive_dir, chunk_size=1)
+        write_chunk = archiver._write_chunk
+
+        def disk_full_on_second_chunk(chunk):
+            if chunk[0]['event_id'] == 'evt-1':
+                raise OSError('No space left on device')
+            return write_chunk(chunk)
+
+        with mock.patch.object(archiver, '_write_chunk', side_effect=disk_full_on_second_chunk):
+            with self.assertRaises(OSError):
+                archiver.run()
+
+        self.assertEqual([line['event_id'] for line in self.archived_lines()], ['evt-0'])
+        self.assertEqual(set(WebhookEvent.objects.values_list('event_id', flat=True)), {'evt-1', 'evt-2'})
+
+    def test_command_archives_and_reports(self):
+        self.create_event('old', 'processed', timedelta(days=40))
+        options = ['--archive-dir', str(self.archive_dir), '--older-than-days', '30']
+
+        out = StringIO()
+        call_command('archive_webhooks', *options, '--dry-run', stdout=out)
+        self.assertIn('1 events would be archived', out.getvalue())
+        self.assertTrue(WebhookEvent.objects.exists())
+
+        out = StringIO()
+        call_command('archive_webhooks', *options, stdout=out)
+        self.assertIn('Archived 1 events', out.getvalue())
+        self.assertFalse(WebhookEvent.objects.exists())
+        self.assertEqual(len(self.archived_lines()), 1)
+
+
+class PaymentExportTests(FundedEscrowMixin, TestCase):
+
+    def setUp(self):
+        self.escrow = self.fund_escrow()
+        self.api = APIClient()
+        self.api.force_authenticate(User.objects.create(email='finance@example.com', is_staff=True))
+
+    def create_payment(self, at, reference, user=None):
+        payment = Payment.objects.create(
+            escrow=self.escrow, user=user or self.escrow.project.client, amount=Decimal('10'),
+            provider_transactionn_id=reference, transaction_type='release', provider='fake', status='completed',
+        )
+        Payment.objects.filter(id=payment.id).update(timestamp=at)
+        return payment
+
+    def at(self, day, moment):
+        return timezone.make_aware(datetime.combine(day, moment))
+
+    def export(self, **params):
+        response = self.api.get('/payments/exports/payments/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_date_range_includes_both_whole_days(self):
+        last_moment = time(23, 59, 59, 999999)
+        self.create_payment(self.at(date(2025, 3, 31), last_moment), 'day-before')
+        self.create_payment(self.at(date(2025, 4, 1), time.min), 'first-day')
+        self.create_payment(self.at(date(2025, 4, 2), last_moment), 'last-day')
+        self.create_payment(self.at(date(2025, 4, 3), time.min), 'day-after')
+
+        rows = list(csv.DictReader(self.export(date_from='2025-04-01', date_to='2025-04-02').decode().splitlines()))
+
+        self.assertEqual([row['provider_transaction_id'] for row in rows], ['first-day', 'last-day'])
+
+    def test_csv_and_ndjson_carry_the_same_rows(self):
+        payment = self.create_payment(self.at(date(2025, 4, 1), time(12, 30, 0, 123456)), 'release-1')
+        params = {'date_from': '2025-04-01', 'date_to': '2025-04-01'}
+        expected = {
+            'id': payment.id, 'escrow_id': self.escrow.id, 'project_id': self.escrow.project_id,
+            'user_id': payment.user_id, 'user_email': payment.user.email, 'transaction_type': 'release',
+            'status': 'completed', 'provider': 'fake', 'provider_transaction_id': 'release-1',
+            'milestone_id': None, 'amount': '10.00',
+        }
+
+        [row] = csv.DictReader(self.export(**params).decode().splitlines())
+        self.assertEqual(row.pop('timestamp'), '2025-04-01 12:30:00.123456+00:00')
+        self.assertEqual(row, {name: '' if value is None else str(value) for name, value in expected.items()})
+
+        [line] = self.export(export_format='ndjson', **params).decode().splitlines()
+        record = json.loads(line)
+        self.assertEqual(record.pop('timestamp'), '2025-04-01T12:30:00.123456+00:00')
+        self.assertEqual(record, expected)
+
+    def test_gzip_export_decompresses_to_the_plain_one(self):
+        for number in range(50):
+            self.create_payment(self.at(date(2025, 4, 1), time(12, number)), f'release-{number}')
+
+        for export_format in ('csv', 'ndjson'):
+            with self.subTest(export_format):
+                self.assertEqual(
+                    gzip.decompress(self.export(export_format=export_format, gzip='true')),
+                    self.export(export_format=export_format),
+                )
+
+    def test_csv_cells_that_look_like_formulas_are_quoted(self):
+        mallory = User.objects.create(email='=HYPERLINK("http://evil")@example.com', user_type='client')
+        self.create_payment(self.at(date(2025, 4, 1), time.min), '-1+1', user=mallory)
+        params = {'date_from': '2025-04-01', 'date_to': '2025-04-01'}
+
+        [row] = csv.DictReader(self.export(**params).decode().splitlines())
+        self.assertEqual(row['user_email'], '\'=HYPERLINK("http://evil")@example.com')
+        self.assertEqual(row['provider_transaction_id'], "'-1+1")
+        self.assertEqual(row['amount'], '10.00')
+
+        [line] = self.export(export_format='ndjson', **params).decode().splitlines()
+        self.assertEqual(json.loads(line)['user_email'], mallory.email)
+
+    def test_export_is_staff_only(self):
+        self.api.force_authenticate(self.escrow.project.client)
+        self.assertEqual(self.api.get('/payments/exports/payments/').status_code, 403)
+
+
+class EscrowPaymentsViewTests(FundedEscrowMixin, TestCase):
+
+    def setUp(self):
+        self.escrow = self.fund_escrow()
+        self.url = f'/payments/escrows/{self.escrow.id}/payments/'
+        self.api = APIClient()
+
+    def get(self, user, **params):
+        self.api.force_authenticate(user)
+        return self.api.get(self.url, params)
+
+    def test_history_is_limited_to_participants_and_staff(self):
+        project = self.escrow.project
+        staff = User.objects.create(email='staff@example.com', is_staff=True)
+        for user in (project.client, project.freelancer, staff):
+            with self.subTest(user.email):
+                self.assertEqual(len(self.get(user).data['results']), 1)
+
+        outsider = User.objects.create(email='outsider@example.com', user_type='client')
+        self.assertEqual(self.get(outsider).status_code, 403)
+        self.assertEqual(self.get(outsider, stream='ndjson').status_code, 403)
+
+    def create_payments(self, count, at):
+        client = self.escrow.project.client
+        payments = [
+            Payment.objects.create(
+                escrow=self.escrow, user=client, amount=Decimal('10'), provider_transactionn_id=f'release-{number}',
+                transaction_type='release', provider='fake', status='completed',
+            )
+            for number in range(count)
+        ]
+        Payment.objects.filter(id__in=[payment.id for payment in payments]).update(timestamp=at)
+        return payments
+
+    def test_equal_timestamps_are_paged_by_id(self):
+        # Every payment shares one timestamp, later than the funding's.
+        payments = self.create_payments(5, timezone.now() + timedelta(minutes=1))
+        client = self.escrow.project.client
+
+        page = self.get(client, page_size=2).data
+        seen = [payment['id'] for payment in page['results']]
+        while page['next']:
+            page = self.api.get(page['next']).data
+            seen.extend(payment['id'] for payment in page['results'])
+
+        funding = Payment.objects.get(escrow=self.escrow, transaction_type='funding')
+        self.assertEqual(seen, sorted((payment.id for payment in payments), reverse=True) + [funding.id])
+
+    def test_invalid_cursor_is_rejected(self):
+        client = self.escrow.project.client
+        for cursor in ('not-base64!', 'bm90LWEtY3Vyc29y', 'MjAyNS0wNC0wMXxhYmM='):
+            with self.subTest(cursor):
+                response = self.get(client, cursor=cursor)
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(str(response.data['detail']), 'Invalid cursor')
+
+    def test_ndjson_stream_returns_the_full_history(self):
+        self.create_payments(120, timezone.now() + timedelta(minutes=1))
+
+        response = self.get(self.escrow.project.client, stream='ndjson')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(lines), 121)
+        self.assertEqual([line['id'] for line in lines], list(
+            Payment.objects.filter(escrow=self.escrow).order_by('-timestamp', '-id').values_list('id', flat=True)
+        ))
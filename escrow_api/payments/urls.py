@@ -0,0 +1,29 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    # Funding, release and refund
+    path('funding/initiate/', views.InitiateFundingView.as_view(), name='funding-initiate'),
+    path('funding/verify/', views.VerifyFundingView.as_view(), name='funding-verify'),
+    path('release/', views.ReleaseFundsView.as_view(), name='release-funds'),
+    path('refund/', views.RefundView.as_view(), name='refund'),
+
+    # Escrow payment history
+    path('escrows/<int:escrow_id>/', views.EscrowDetailView.as_view(), name='payments-escrow-detail'),
+    path('escrows/<int:escrow_id>/payments/', views.EscrowPaymentsView.as_view(), name='escrow-payments'),
+
+    # Finance exports
+    path('exports/payments/', views.PaymentExportView.as_view(), name='payment-export'),
+
+    # Payout methods
+    path('payout-methods/', views.PayoutMethodListCreateView.as_view(), name='payout-method-list-create'),
+    path('payout-methods/<int:method_id>/', views.PayoutMethodDetailView.as_view(), name='payout-method-detail'),
+    path('banks/', views.ChapaBanksView.as_view(), name='chapa-banks'),
+    path('stripe/onboarding-link/', views.StripeOnboardingLinkView.as_view(), name='stripe-onboarding-link'),
+
+    # Provider webhooks
+    path('webhooks/stripe/', views.StripeWebhookView.as_view(), name='stripe-webhook'),
+    path('webhooks/chapa/', views.ChapaWebhookView.as_view(), name='chapa-webhook'),
+    path('webhooks/fake/', views.FakeWebhookView.as_view(), name='fake-webhook'),
+]
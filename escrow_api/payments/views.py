@@ -1,12 +1,17 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
+import json
 import logging
 
 from .serializers import (
     PaymentSerializer,
-    EscrowTransactionSerializer,
+    PaymentExportSerializer,
     FundingInitiateSerializer,
     FundingVerifySerializer,
     ReleaseFundsSerializer,
@@ -15,16 +20,20 @@ from .serializers import (
     ChapaPayoutMethodCreateSerializer,
     StripePayoutMethodCreateSerializer,
     SetPayoutMethodFlagsSerializer,
-    BankSerializer,
     ChapaWebhookSerializer,
     StripeWebhookSerializer,
 )
-from .models import Payment, PayoutMethod, Bank, WebhookEvent
+from .models import Payment, PayoutMethod
+from .pagination import EscrowPaymentPagination
+from .permissions import IsEscrowParticipant
 from escrow.models import EscrowTransaction
+from escrow.serializers import EscrowTransactionSerializer, with_payment_summary
 from escrow.services import EscrowService
-from user_projects.models import UserProject
 from .providers import get_payment_provider
-from .tasks import task_transfer_to_freelancer, task_refund_to_client
+from .banks import bank_directory
+from .exports import CONTENT_TYPES, export_filename, export_queryset, iter_export
+from .webhooks import record_webhook
+from .tasks import enqueue_release, enqueue_refund
 
 
 logger = logging.getLogger(__name__)
@@ -33,13 +42,12 @@ class InitiateFundingView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        serializer = FundingInitiateSerializer(data=request.data)
+        serializer = FundingInitiateSerializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
-        project = get_object_or_404(UserProject, id=serializer.validated_data['project_id'])
         escrow_service = EscrowService()
         result = escrow_service.initiate_funding(
             user=request.user,
-            project=project,
+            project=serializer.validated_data['project'],
             amount=serializer.validated_data['amount'],
             provider_name=serializer.validated_data['provider_name'],
         )
@@ -65,20 +73,20 @@ class ReleaseFundsView(APIView):
     def post(self, request):
         serializer = ReleaseFundsSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        escrow = get_object_or_404(EscrowTransaction, id=serializer.validated_data['escrow_id'])
-        escrow_service = EscrowService()
+        escrow = get_object_or_404(EscrowTransaction.objects.select_related('project'), id=serializer.validated_data['escrow_id'])
         # ownership check (client only)
         if request.user.id != escrow.project.client_id:
             return Response({'status': 'error', 'message': 'Only the project client can release funds'}, status=status.HTTP_403_FORBIDDEN)
-        # Enqueue async transfer
-        task_transfer_to_freelancer.delay(
-            escrow.id,
-            str(serializer.validated_data.get('amount') or ''),
-            serializer.validated_data.get('milestone_id')
+        # Enqueue async transfer on the escrow provider's queue
+        queued = enqueue_release(
+            escrow,
+            amount=serializer.validated_data.get('amount'),
+            milestone_id=serializer.validated_data.get('milestone_id'),
+            request_key=request.headers.get('Idempotency-Key'),
         )
-        result = {'status': 'success', 'message': 'Payout queued'}
-        code = status.HTTP_200_OK if result.get('status') == 'success' else status.HTTP_400_BAD_REQUEST
-        return Response(result, status=code)
+        if queued['status'] == 'duplicate':
+            return Response({'status': 'success', 'message': 'Payout already queued', 'idempotency_key': queued['idempotency_key']})
+        return Response({'status': 'success', 'message': 'Payout queued', 'idempotency_key': queued['idempotency_key']})
 
 
 
@@ -88,32 +96,89 @@ class RefundView(APIView):
     def post(self, request):
         serializer = RefundSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        escrow = get_object_or_404(EscrowTransaction, id=serializer.validated_data['escrow_id'])
-        escrow_service = EscrowService()
-        # Enqueue async refund
-        task_refund_to_client.delay(escrow.id, str(serializer.validated_data.get('amount') or ''), serializer.validated_data.get('reason', 'Project refund'))
-        result = {'status': 'success', 'message': 'Refund queued'}
-        code = status.HTTP_200_OK if result.get('status') == 'success' else status.HTTP_400_BAD_REQUEST
-        return Response(result, status=code)
+        escrow = get_object_or_404(EscrowTransaction.objects.select_related('project'), id=serializer.validated_data['escrow_id'])
+        # ownership check (client only); the task re-checks it against the requester
+        if request.user.id != escrow.project.client_id:
+            return Response({'status': 'error', 'message': 'Only the project client can request a refund'}, status=status.HTTP_403_FORBIDDEN)
+        # Enqueue async refund on the escrow provider's queue
+        queued = enqueue_refund(
+            escrow,
+            requested_by=request.user,
+            amount=serializer.validated_data.get('amount'),
+            reason=serializer.validated_data.get('reason') or 'Project refund',
+            request_key=request.headers.get('Idempotency-Key'),
+        )
+        if queued['status'] == 'duplicate':
+            return Response({'status': 'success', 'message': 'Refund already queued', 'idempotency_key': queued['idempotency_key']})
+        return Response({'status': 'success', 'message': 'Refund queued', 'idempotency_key': queued['idempotency_key']})
 
 
 class EscrowDetailView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, escrow_id):
-        escrow = get_object_or_404(EscrowTransaction, id=escrow_id)
+        escrow = get_object_or_404(with_payment_summary(EscrowTransaction.objects.all()), id=escrow_id)
         data = EscrowTransactionSerializer(escrow).data
         return Response(data)
 
 
 class EscrowPaymentsView(APIView):
-    permission_classes = [permissions.IsAuthenticated]
+    """
+    Full payment history of one escrow, newest first, keyset paginated on (timestamp, id).
+
+    With ?stream=ndjson the whole history (from ?cursor= if given) is streamed
+    as one JSON object per line, read through a server-side cursor so worker
+    memory stays flat however long the history is.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsEscrowParticipant]
+    stream_chunk_size = 500
 
     def get(self, request, escrow_id):
-        escrow = get_object_or_404(EscrowTransaction, id=escrow_id)
-        payments = Payment.objects.filter(escrow=escrow).order_by('-timestamp')
-        data = PaymentSerializer(payments, many=True).data
-        return Response(data)
+        escrow = get_object_or_404(EscrowTransaction.objects.select_related('project'), id=escrow_id)
+        self.check_object_permissions(request, escrow)
+        paginator = EscrowPaymentPagination()
+        payments = Payment.objects.filter(escrow=escrow)
+
+        if request.query_params.get('stream') == 'ndjson':
+            rows = paginator.after(payments, paginator.decode_cursor(request))
+            response = StreamingHttpResponse(self._ndjson(rows), content_type='application/x-ndjson')
+            response['Content-Disposition'] = f'attachment; filename="escrow-{escrow.id}-payments.ndjson"'
+            return response
+
+        page = paginator.paginate_queryset(payments, request, view=self)
+        data = PaymentSerializer(page, many=True).data
+        return paginator.get_paginated_response(data)
+
+    def _ndjson(self, payments):
+        serializer = PaymentSerializer()
+        for payment in payments.iterator(chunk_size=self.stream_chunk_size):
+            yield json.dumps(serializer.to_representation(payment), cls=DjangoJSONEncoder) + '\n'
+
+
+class PaymentExportView(APIView):
+    """
+    Streams payment history for finance as CSV or NDJSON, optionally gzipped.
+
+    Query params: date_from, date_to (inclusive days), provider,
+    transaction_type, status, export_format (csv|ndjson), gzip.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        serializer = PaymentExportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = dict(serializer.validated_data)
+        export_format = params.pop('export_format')
+        compress = params.pop('gzip')
+
+        stream = iter_export(export_queryset(**params), export_format, compress=compress)
+        response = StreamingHttpResponse(
+            stream,
+            content_type='application/gzip' if compress else CONTENT_TYPES[export_format],
+        )
+        filename = export_filename(export_format, compress=compress, date_from=params.get('date_from'), date_to=params.get('date_to'))
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
 
 class PayoutMethodListCreateView(APIView):
@@ -159,20 +224,26 @@ class ChapaBanksView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        provider = get_payment_provider('chapa')
-        res = provider.get_banks()
-        if res.get('status') == 'success':
-            return Response({'banks': res.get('banks', [])})
-        return Response(res, status=status.HTTP_400_BAD_REQUEST)
+        snapshot = bank_directory.get()
+        if not snapshot.banks:
+            return Response({'status': 'error', 'message': 'Bank list is currently unavailable'}, status=status.HTTP_400_BAD_REQUEST)
+
+        headers = {
+            'ETag': snapshot.etag,
+            'Cache-Control': f'private, max-age={bank_directory.cache_seconds}',
+        }
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if '*' in if_none_match or snapshot.etag in if_none_match:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response({'banks': snapshot.banks}, headers=headers)
 
 
 class StripeOnboardingLinkView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        from .providers.stripe import StripeProvider
         account_id = request.data.get('stripe_account_id')
-        provider = StripeProvider()
+        provider = get_payment_provider('stripe')
         if not account_id:
             return Response({'detail': 'stripe_account_id is required'}, status=status.HTTP_400_BAD_REQUEST)
         link = provider.get_account_link(account_id)
@@ -186,147 +257,40 @@ class StripeWebhookView(APIView):
     def post(self, request):
         serializer = StripeWebhookSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        event_id = serializer.validated_data['id']
-
-        if WebhookEvent.objects.filter(provider='stripe', event_id=event_id).exists():
-            return Response({'status': 'duplicate'})
-
-        event_type = serializer.validated_data['type']
-        payment_intent_id = serializer.validated_data.get('payment_intent_id')
-        transfer_id = serializer.validated_data.get('transfer_id')
-
-        result = {'status': 'ignored', 'message': f'Unhandled event {event_type}'}
-
-        if event_type == 'payment_intent.succeeded' and payment_intent_id:
-            escrow_service = EscrowService()
-            verification = escrow_service.verify_funding(tx_ref=payment_intent_id)
-            result = {
-                'status': verification.get('status'),
-                'message': verification.get('message'),
-                'escrow_id': verification.get('escrow_id'),
-            }
-        elif event_type == 'payment_intent.payment_failed' and payment_intent_id:
-            payment = Payment.objects.filter(
-                provider_transactionn_id=payment_intent_id,
-                provider='stripe',
-            ).first()
-            if payment:
-                payment.status = 'failed'
-                payment.save(update_fields=['status'])
-                result = {
-                    'status': 'failed',
-                    'message': 'Payment marked as failed',
-                    'payment_id': payment.id,
-                }
-        elif event_type.startswith('transfer') and transfer_id:
-            success_events = {'transfer.paid', 'transfer.succeeded', 'transfer.completed'}
-            failure_events = {'transfer.failed', 'transfer.canceled', 'transfer.reversed'}
-            if event_type in success_events or event_type in failure_events:
-                logger.info(
-                    "Processing Stripe transfer webhook",
-                    extra={'transfer_id': transfer_id, 'event_type': event_type}
-                )
-                escrow_service = EscrowService()
-                verification = escrow_service.verify_transfer_to_freelancer(
-                    provider_name='stripe',
-                    transfer_reference=transfer_id,
-                    success=event_type in success_events,
-                    details=request.data,
-                )
-                result = verification
-        elif event_type.startswith('payout') and transfer_id:
-            # Some Stripe accounts may emit payout.* events instead of transfer.*
-            success_events = {'payout.paid', 'payout.succeeded'}
-            failure_events = {'payout.failed', 'payout.canceled'}
-            if event_type in success_events or event_type in failure_events:
-                logger.info(
-                    "Processing Stripe payout webhook",
-                    extra={'transfer_id': transfer_id, 'event_type': event_type}
-                )
-                escrow_service = EscrowService()
-                verification = escrow_service.verify_transfer_to_freelancer(
-                    provider_name='stripe',
-                    transfer_reference=transfer_id,
-                    success=event_type in success_events,
-                    details=request.data,
-                )
-                result = verification
-
-        WebhookEvent.objects.create(provider='stripe', event_id=event_id)
-        return Response(result)
+
+        _, created = record_webhook(
+            provider='stripe',
+            event_id=serializer.validated_data['id'],
+            event_type=serializer.validated_data['type'],
+            reference=serializer.validated_data.get('payment_intent_id') or serializer.validated_data.get('transfer_id'),
+            payload=request.data,
+        )
+        return Response({'status': 'accepted' if created else 'duplicate'})
 
 
 class ChapaWebhookView(APIView):
     permission_classes = [permissions.AllowAny]
+    provider = 'chapa'
 
     def post(self, request):
         serializer = ChapaWebhookSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        event_id = serializer.validated_data['event_id']
-
-        if WebhookEvent.objects.filter(provider='chapa', event_id=event_id).exists():
-            return Response({'status': 'duplicate'})
-
-        tx_ref = serializer.validated_data.get('tx_ref')
-        transfer_reference = serializer.validated_data.get('transfer_reference')
-        status_value = serializer.validated_data.get('normalized_status', '')
-        event_type = serializer.validated_data.get('event_type', '')
-
-        result = {'status': 'ignored', 'message': 'Event does not indicate success'}
-
-        success_statuses = {'success', 'completed', 'paid'}
-        failure_statuses = {'failed', 'declined', 'expired', 'cancelled'}
-
-        if transfer_reference:
-            success_event_markers = {'transfer.success', 'transfer.completed', 'transfer.paid'}
-            failure_event_markers = {'transfer.failed', 'transfer.cancelled', 'transfer.reversed'}
-
-            if status_value in success_statuses or event_type in success_event_markers:
-                success_flag = True
-            elif status_value in failure_statuses or event_type in failure_event_markers:
-                success_flag = False
-            else:
-                success_flag = None
-
-            if success_flag is not None:
-                logger.info(
-                    "Processing Chapa transfer webhook",
-                    extra={
-                        'transfer_reference': transfer_reference,
-                        'status_value': status_value,
-                        'event_type': event_type,
-                        'success': success_flag,
-                    }
-                )
-                escrow_service = EscrowService()
-                verification = escrow_service.verify_transfer_to_freelancer(
-                    provider_name='chapa',
-                    transfer_reference=transfer_reference,
-                    success=success_flag,
-                    details=request.data,
-                )
-                result = verification
-        elif tx_ref and status_value in success_statuses:
-            escrow_service = EscrowService()
-            verification = escrow_service.verify_funding(tx_ref=tx_ref)
-            result = {
-                'status': verification.get('status'),
-                'message': verification.get('message'),
-                'escrow_id': verification.get('escrow_id'),
-            }
-        elif tx_ref and status_value in failure_statuses:
-            payment = Payment.objects.filter(
-                provider_transactionn_id=tx_ref,
-                provider='chapa',
-            ).first()
-            if payment:
-                payment.status = 'failed'
-                payment.save(update_fields=['status'])
-                result = {
-                    'status': 'failed',
-                    'message': 'Payment marked as failed',
-                    'payment_id': payment.id,
-                }
-
-        WebhookEvent.objects.create(provider='chapa', event_id=event_id)
-        return Response(result)
+
+        _, created = record_webhook(
+            provider=self.provider,
+            event_id=serializer.validated_data['event_id'],
+            event_type=serializer.validated_data.get('event_type', ''),
+            reference=serializer.validated_data.get('transfer_reference') or serializer.validated_data.get('tx_ref'),
+            payload=request.data,
+        )
+        return Response({'status': 'accepted' if created else 'duplicate'})
+
+
+class FakeWebhookView(ChapaWebhookView):
+    """Receives webhooks emitted by the fake provider while it is enabled."""
+    provider = 'fake'
+
+    def post(self, request):
+        if not getattr(settings, 'PAYMENT_FAKE_PROVIDER_ENABLED', False):
+            raise Http404
+        return super().post(request)
@@ -0,0 +1,465 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Max, Min, Q
+from django.utils import timezone
+
+from .models import Payment, WebhookEvent
+from .serializers import ChapaWebhookSerializer, StripeWebhookSerializer
+
+logger = logging.getLogger(__name__)
+
+
+class RecentWebhookIds:
+    """
+    Event ids the inbox already holds, checked before the insert so that a
+    redelivery storm is answered without touching the database.
+
+    Two tiers: a bounded in-process LRU, then the WEBHOOK_RECENT_IDS_CACHE
+    Django cache, which is shared across workers when it is Redis or
+    Memcached. An id is only remembered after the inbox has it, so a miss
+    always falls through to the insert and nothing is ever dropped; a
+    failing cache is skipped the same way.
+    """
+
+    def __init__(self):
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'WEBHOOK_RECENT_IDS_SIZE', 10000)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'WEBHOOK_RECENT_IDS_TTL', 60 * 60)
+
+    @property
+    def shared_cache(self):
+        alias = getattr(settings, 'WEBHOOK_RECENT_IDS_CACHE', 'default')
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def _key(event_id):
+        return 'webhook-seen:' + hashlib.sha1(event_id.encode()).hexdigest()
+
+    def seen(self, event_id) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            expires = self._local.get(event_id)
+            if expires is not None:
+                if expires > now:
+                    self._local.move_to_end(event_id)
+                    return True
+                del self._local[event_id]
+
+        cache = self.shared_cache
+        if cache is None:
+            return False
+        try:
+            found = cache.get(self._key(event_id)) is not None
+        except Exception as e:
+            logger.error(f"Webhook id cache lookup failed: {str(e)}")
+            return False
+        if found:
+            self._remember_locally(event_id, now)
+        return found
+
+    def remember(self, event_id):
+        self._remember_locally(event_id, time.monotonic())
+        cache = self.shared_cache
+        if cache is None:
+            return
+        try:
+            cache.set(self._key(event_id), 1, self.ttl)
+        except Exception as e:
+            logger.error(f"Webhook id cache write failed: {str(e)}")
+
+    def _remember_locally(self, event_id, now):
+        with self._lock:
+            self._local[event_id] = now + self.ttl
+            self._local.move_to_end(event_id)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+
+recent_webhook_ids = RecentWebhookIds()
+
+
+def record_webhook(*, provider: str, event_id: str, event_type: str, reference: str, payload: dict):
+    """
+    Store a webhook delivery in the inbox.
+
+    The insert itself is the duplicate check: a redelivered event_id violates
+    the unique constraint and is reported as a duplicate. Ids recently seen
+    by recent_webhook_ids are reported as duplicates without the insert.
+
+    Returns:
+        Tuple of (WebhookEvent or None, created)
+    """
+    if recent_webhook_ids.seen(event_id):
+        return None, False
+    try:
+        with transaction.atomic():
+            event = WebhookEvent.objects.create(
+                provider=provider,
+                event_id=event_id,
+                event_type=event_type or '',
+                reference=reference or '',
+                payload=payload,
+            )
+    except IntegrityError:
+        recent_webhook_ids.remember(event_id)
+        return None, False
+    recent_webhook_ids.remember(event_id)
+    return event, True
+
+
+def _mark_payment_failed(provider, reference):
+    payment = Payment.objects.filter(
+        provider_transactionn_id=reference,
+        provider=provider,
+    ).first()
+    if not payment:
+        return {'status': 'ignored', 'message': 'No matching payment'}
+    payment.status = 'failed'
+    payment.save(update_fields=['status'])
+    return {
+        'status': 'failed',
+        'message': 'Payment marked as failed',
+        'payment_id': payment.id,
+    }
+
+
+def process_stripe_event(event: WebhookEvent, escrow_service) -> dict:
+    serializer = StripeWebhookSerializer(data=event.payload)
+    serializer.is_valid(raise_exception=True)
+
+    event_type = serializer.validated_data['type']
+    payment_intent_id = serializer.validated_data.get('payment_intent_id')
+    transfer_id = serializer.validated_data.get('transfer_id')
+
+    if event_type == 'payment_intent.succeeded' and payment_intent_id:
+        verification = escrow_service.verify_funding(tx_ref=payment_intent_id)
+        return {
+            'status': verification.get('status'),
+            'message': verification.get('message'),
+            'escrow_id': verification.get('escrow_id'),
+        }
+    if event_type == 'payment_intent.payment_failed' and payment_intent_id:
+        return _mark_payment_failed('stripe', payment_intent_id)
+
+    if transfer_id and event_type.startswith(('transfer', 'payout')):
+        # Some Stripe accounts may emit payout.* events instead of transfer.*
+        success_events = {'transfer.paid', 'transfer.succeeded', 'transfer.completed', 'payout.paid', 'payout.succeeded'}
+        failure_events = {'transfer.failed', 'transfer.canceled', 'transfer.reversed', 'payout.failed', 'payout.canceled'}
+        if event_type in success_events or event_type in failure_events:
+            logger.info(
+                "Processing Stripe transfer webhook",
+                extra={'transfer_id': transfer_id, 'event_type': event_type}
+            )
+            return escrow_service.verify_transfer_to_freelancer(
+                provider_name='stripe',
+                transfer_reference=transfer_id,
+                success=event_type in success_events,
+                details=event.payload,
+            )
+
+    return {'status': 'ignored', 'message': f'Unhandled event {event_type}'}
+
+
+def process_chapa_event(event: WebhookEvent, escrow_service) -> dict:
+    """Handles Chapa-format events; the provider name is taken from the stored event."""
+    serializer = ChapaWebhookSerializer(data=event.payload)
+    serializer.is_valid(raise_exception=True)
+
+    tx_ref = serializer.validated_data.get('tx_ref')
+    transfer_reference = serializer.validated_data.get('transfer_reference')
+    status_value = serializer.validated_data.get('normalized_status', '')
+    event_type = serializer.validated_data.get('event_type', '')
+
+    success_statuses = {'success', 'completed', 'paid'}
+    failure_statuses = {'failed', 'declined', 'expired', 'cancelled'}
+
+    if transfer_reference:
+        success_event_markers = {'transfer.success', 'transfer.completed', 'transfer.paid'}
+        failure_event_markers = {'transfer.failed', 'transfer.cancelled', 'transfer.reversed'}
+
+        if status_value in success_statuses or event_type in success_event_markers:
+            success_flag = True
+        elif status_value in failure_statuses or event_type in failure_event_markers:
+            success_flag = False
+        else:
+            return {'status': 'ignored', 'message': 'Event does not indicate success'}
+
+        logger.info(
+            "Processing Chapa transfer webhook",
+            extra={
+                'transfer_reference': transfer_reference,
+                'status_value': status_value,
+                'event_type': event_type,
+                'success': success_flag,
+            }
+        )
+        return escrow_service.verify_transfer_to_freelancer(
+            provider_name=event.provider,
+            transfer_reference=transfer_reference,
+            success=success_flag,
+            details=event.payload,
+        )
+
+    if tx_ref and status_value in success_statuses:
+        verification = escrow_service.verify_funding(tx_ref=tx_ref)
+        return {
+            'status': verification.get('status'),
+            'message': verification.get('message'),
+            'escrow_id': verification.get('escrow_id'),
+        }
+    if tx_ref and status_value in failure_statuses:
+        return _mark_payment_failed(event.provider, tx_ref)
+
+    return {'status': 'ignored', 'message': 'Event does not indicate success'}
+
+
+EVENT_HANDLERS = {
+    'chapa': process_chapa_event,
+    'stripe': process_stripe_event,
+    # The fake provider emits Chapa-shaped events.
+    'fake': process_chapa_event,
+}
+
+
+class WebhookInboxProcessor:
+    """
+    Drains the webhook inbox.
+
+    Each batch of pending events is grouped by the escrow it concerns (resolved
+    through the referenced Payment). Groups run concurrently on a thread pool;
+    events inside a group run one at a time in arrival order. An event whose
+    handler raised or returned an error is retried with backoff and holds back
+    every later event for the same escrow until it succeeds or is parked as
+    failed. Handled outcomes, such as a payout failure being recorded or a
+    late duplicate being ignored, mark the event processed.
+
+    Args:
+        batch_size: Events claimed per batch
+        workers: Groups processed concurrently
+        max_attempts: Attempts before an event is parked as failed
+        claim_timeout: Seconds after which a 'processing' row is assumed abandoned
+        retry_backoff: Base delay in seconds before a failed event is retried
+    """
+
+    def __init__(self, *, batch_size=200, workers=8, max_attempts=5, claim_timeout=300, retry_backoff=5, escrow_service=None):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.claim_timeout = claim_timeout
+        self.retry_backoff = retry_backoff
+
+        if escrow_service is None:
+            from escrow.services import EscrowService
+            escrow_service = EscrowService()
+        self.escrow_service = escrow_service
+
+    def claim(self):
+        """
+        Lock the next batch of available events for processing.
+
+        Pending rows whose retry delay has passed and 'processing' rows whose
+        claim expired (crashed worker) are both available.
+
+        Returns:
+            List of WebhookEvent in id order
+        """
+        now = timezone.now()
+        available = Q(status__in=['pending', 'processing']) & (Q(locked_until__isnull=True) | Q(locked_until__lte=now))
+        with transaction.atomic():
+            ids = list(
+                WebhookEvent.objects.select_for_update(skip_locked=True)
+                .filter(available)
+                .order_by('id')
+                .values_list('id', flat=True)[:self.batch_size]
+            )
+            WebhookEvent.objects.filter(id__in=ids).update(
+                status='processing',
+                locked_until=now + timedelta(seconds=self.claim_timeout),
+            )
+        return list(WebhookEvent.objects.filter(id__in=ids).order_by('id'))
+
+    def group_by_escrow(self, events):
+        """
+        Split claimed events into per-escrow groups.
+
+        Groups with an older event still waiting for a retry are left out
+        and released, so they never overtake it.
+
+        Returns:
+            Tuple of (groups to process, events deferred)
+        """
+        claimed_ids = [event.id for event in events]
+        waiting = list(
+            WebhookEvent.objects.filter(status__in=['pending', 'processing'], id__lt=claimed_ids[-1])
+            .exclude(id__in=claimed_ids)
+            .values_list('reference', 'event_id')
+        )
+
+        references = {event.reference for event in events if event.reference}
+        references.update(reference for reference, _ in waiting if reference)
+        escrow_by_reference = dict(
+            Payment.objects.filter(provider_transactionn_id__in=references)
+            .values_list('provider_transactionn_id', 'escrow_id')
+        )
+
+        def group_key(reference, event_id):
+            escrow_id = escrow_by_reference.get(reference)
+            return f'escrow:{escrow_id}' if escrow_id else f'ref:{reference or event_id}'
+
+        blocked = {group_key(reference, event_id) for reference, event_id in waiting}
+        groups = OrderedDict()
+        deferred = []
+        for event in events:
+            key = group_key(event.reference, event.event_id)
+            if key in blocked:
+                deferred.append(event)
+            else:
+                groups.setdefault(key, []).append(event)
+
+        if deferred:
+            WebhookEvent.objects.filter(id__in=[event.id for event in deferred]).update(status='pending', locked_until=None)
+        return list(groups.values()), deferred
+
+    def process_batch(self):
+        """
+        Claim and process one batch.
+
+        Returns:
+            Dict of counts for the batch
+        """
+        events = self.claim()
+        counts = {'claimed': len(events), 'processed': 0, 'retried': 0, 'failed': 0, 'deferred': 0}
+        if not events:
+            return counts
+
+        groups, deferred = self.group_by_escrow(events)
+        counts['deferred'] = len(deferred)
+        if len(groups) <= 1 or self.workers <= 1:
+            results = [self._process_group(group) for group in groups]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(groups)), thread_name_prefix='webhook-inbox') as executor:
+                results = list(executor.map(self._process_group_in_thread, groups))
+
+        for group_counts in results:
+            for key, value in group_counts.items():
+                counts[key] += value
+        return counts
+
+    def run(self, *, once=False, poll_interval=1.0):
+        """
+        Process batches until nothing is available (once=True) or forever.
+
+        Returns:
+            Dict of counts summed over all batches (once=True only)
+        """
+        totals = {'claimed': 0, 'processed': 0, 'retried': 0, 'failed': 0, 'deferred': 0}
+        while True:
+            counts = self.process_batch()
+            for key, value in counts.items():
+                totals[key] += value
+            if counts['claimed'] == counts['deferred']:
+                if once:
+                    return totals
+                time.sleep(poll_interval)
+
+    def _process_group_in_thread(self, group):
+        try:
+            return self._process_group(group)
+        finally:
+            connection.close()
+
+    def _process_group(self, group):
+        counts = {'processed': 0, 'retried': 0, 'failed': 0}
+        for index, event in enumerate(group):
+            if self._process_event(event):
+                counts['processed'] += 1
+                continue
+
+            if event.status == 'failed':
+                counts['failed'] += 1
+            else:
+                counts['retried'] += 1
+            # Later events for the same escrow wait behind the failed one.
+            held_back = [later.id for later in group[index + 1:]]
+            WebhookEvent.objects.filter(id__in=held_back).update(status='pending', locked_until=event.locked_until)
+            break
+        return counts
+
+    def _process_event(self, event):
+        handler = EVENT_HANDLERS.get(event.provider)
+        event.attempts += 1
+        try:
+            if handler is None:
+                raise ValueError(f"No webhook handler for provider {event.provider}")
+            result = handler(event, self.escrow_service)
+            if result.get('status') == 'error':
+                # Services report unexpected failures as error dicts; retry them like exceptions.
+                # 'failed' and 'ignored' are final outcomes and mark the event processed.
+                raise RuntimeError(result.get('message') or 'Webhook handler returned an error')
+        except Exception as e:
+            logger.error(f"Webhook {event.provider}:{event.event_id} failed (attempt {event.attempts}): {str(e)}")
+            event.last_error = str(e)
+            if event.attempts >= self.max_attempts:
+                event.status = 'failed'
+                event.locked_until = None
+            else:
+                event.status = 'pending'
+                event.locked_until = timezone.now() + timedelta(seconds=self.retry_backoff * 2 ** (event.attempts - 1))
+            event.save(update_fields=['status', 'attempts', 'last_error', 'locked_until'])
+            return False
+
+        event.status = 'processed'
+        event.processed_at = timezone.now()
+        event.locked_until = None
+        event.last_error = ''
+        event.save(update_fields=['status', 'attempts', 'last_error', 'processed_at', 'locked_until'])
+        return True
+
+
+def inbox_metrics(window=timedelta(minutes=15)) -> dict:
+    """
+    Inbox depth and processing lag.
+
+    Returns:
+        Dict with pending/processing/failed counts, the age of the oldest
+        unprocessed event and receive-to-processed lag over the window (seconds).
+    """
+    now = timezone.now()
+    depth = {
+        row['status']: row['count']
+        for row in WebhookEvent.objects.filter(status__in=['pending', 'processing', 'failed'])
+        .values('status').annotate(count=Count('id'))
+    }
+    oldest = WebhookEvent.objects.filter(status__in=['pending', 'processing']).aggregate(oldest=Min('received_at'))['oldest']
+    lag = WebhookEvent.objects.filter(status='processed', processed_at__gte=now - window).annotate(
+        lag=ExpressionWrapper(F('processed_at') - F('received_at'), output_field=DurationField())
+    ).aggregate(avg=Avg('lag'), max=Max('lag'))
+
+    return {
+        'pending': depth.get('pending', 0),
+        'processing': depth.get('processing', 0),
+        'failed': depth.get('failed', 0),
+        'oldest_unprocessed_age': (now - oldest).total_seconds() if oldest else 0.0,
+        'lag_avg': lag['avg'].total_seconds() if lag['avg'] else 0.0,
+        'lag_max': lag['max'].total_seconds() if lag['max'] else 0.0,
+    }
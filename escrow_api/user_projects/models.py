@@ -24,6 +24,12 @@ class UserProject(models.Model):
     is_public = models.BooleanField(default=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Public project listings, and the open (unassigned) subset of them.
+            models.Index(fields=['is_public', 'freelancer'], name='project_public_freelancer_idx'),
+        ]
+
     def __str__(self):
         return f"{self.title} ({self.client} -> {self.freelancer})"
 
@@ -42,6 +48,15 @@ class Proposal(models.Model):
     is_withdrawn = models.BooleanField(default=False)
     accepted_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Accept flow: an accepted proposal on the project, rejecting the rest.
+            models.Index(fields=['project', 'status'], name='proposal_project_status_idx'),
+            # One proposal per freelancer per project, and the client's non-withdrawn list.
+            models.Index(fields=['project', 'freelancer'], name='proposal_project_fl_idx'),
+            models.Index(fields=['project', '-submitted_at'], name='proposal_active_idx', condition=models.Q(is_withdrawn=False)),
+        ]
+
 
 class Milestone(models.Model):
     project = models.ForeignKey(UserProject, on_delete=models.PROTECT, related_name="milestones")
@@ -1,10 +1,12 @@
 from rest_framework.permissions import BasePermission
+
+from accounts.roles import request_role
 from .models import UserProject
 
 
 class IsClient(BasePermission):
     def has_permission(self, request, view):
-        return request.user and request.user.user_type == 'client'
+        return request_role(request, 'user_type') == 'client'
 
 
 class IsOwner(BasePermission):
@@ -19,7 +21,7 @@ class IsOwnerFreelancer(BasePermission):
 
 class IsFreelancer(BasePermission):
     def has_permission(self, request, view):
-        return request.user and request.user.user_type == 'freelancer'
+        return request_role(request, 'user_type') == 'freelancer'
 
 
 class IsClientOrAssignedFreelancer(BasePermission):
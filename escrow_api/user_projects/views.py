@@ -1,7 +1,7 @@
 from django.shortcuts import render
 from rest_framework import views as drf_views, generics, permissions, status, filters
 from rest_framework.response import Response
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from accounts.authentication import CachedJWTAuthentication
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from django.shortcuts import get_object_or_404
 from django.core.exceptions import PermissionDenied, ValidationError
@@ -19,7 +19,7 @@ from .models import UserProject, Milestone, Review, Proposal
 class CreateProjectClientAPIView(generics.CreateAPIView):
     serializer_class = my_serializers.CreateProjectClientSerializer
     permission_classes = [IsAuthenticated, IsClient]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data, context={'request': request})
@@ -35,14 +35,14 @@ class CreateProjectClientAPIView(generics.CreateAPIView):
 class ListProjectAdminAPIView(generics.ListAPIView):
     serializer_class = my_serializers.ListProjectAdminSerializer
     permission_classes = [IsAuthenticated, IsAdminUser]    
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     queryset = UserProject.objects.all()
 
 
 class ListProjectClientAPIView(generics.ListAPIView):
     serializer_class = my_serializers.ListProjectClientSerializer
     permission_classes = [IsAuthenticated, IsClient]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
 
     def get_queryset(self):
         return UserProject.objects.filter(client=self.request.user)
@@ -51,16 +51,16 @@ class ListProjectClientAPIView(generics.ListAPIView):
 class ListProjectFreelancerAPIView(generics.ListAPIView):
     serializer_class = my_serializers.ListProjectFreelancerSerializer
     permission_classes = [IsAuthenticated, IsFreelancer]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     
     def get_queryset(self):
         return UserProject.objects.filter(is_public=True).filter(freelancer__isnull=True)
     
 
 class RetrieveUpdateDeleteProjectClientAPIView(generics.RetrieveUpdateDestroyAPIView):
-    serializer_class = my_serializers.RetrieveUpdateDeleteProjectClientSeriailzer
+    serializer_class = my_serializers.RetrieveUpdateDeleteProjectClientSerializer
     permission_classes = [IsAuthenticated, IsClient, IsOwner]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     lookup_field = 'id'
 
     def get_object(self):
@@ -70,15 +70,15 @@ class RetrieveUpdateDeleteProjectClientAPIView(generics.RetrieveUpdateDestroyAPI
 class RetrieveProjectFreelancerAPIView(generics.RetrieveAPIView):
     serializer_class = my_serializers.RetrieveProjectFreelancerSerializer
     permission_classes = [IsAuthenticated, IsFreelancer]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     queryset = UserProject.objects.filter(is_public=True)
     lookup_field = 'id'
 
 
 class RetrieveProjectAdminAPIView(generics.RetrieveAPIView):
-    serializer_class = my_serializers.RetrieveProjectAdminSerializer
+    serializer_class = my_serializers.RetrieveProjectAdminSeriailzer
     permission_classes = [IsAdminUser, IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     queryset = UserProject.objects.all()
     lookup_field = 'id'
 
@@ -86,7 +86,7 @@ class RetrieveProjectAdminAPIView(generics.RetrieveAPIView):
 class CreateProposalFreelancerAPIView(generics.CreateAPIView):
     serializer_class = my_serializers.CreateProposalFreelancerSerializer
     permission_classes = [IsFreelancer, IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
 
     def get_project(self):
         return get_object_or_404(UserProject, id=self.kwargs['project_id'])
@@ -106,7 +106,7 @@ class CreateProposalFreelancerAPIView(generics.CreateAPIView):
 class ListProjectProposalsClientAPIView(generics.ListAPIView):
     serializer_class = my_serializers.ListProjectProposalsClientSerializer
     permission_classes = [IsAuthenticated, IsClient]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['submitted_at']
     ordering = ['-submitted_at']
@@ -122,7 +122,7 @@ class ListProjectProposalsClientAPIView(generics.ListAPIView):
 class RetrieveUpdateProposalClientAPIView(generics.RetrieveUpdateAPIView):
     serializer_class = my_serializers.RetrieveUpdateProposalClientSerializer
     permission_classes = [IsClient, IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     lookup_field = 'id'
     queryset = Proposal.objects.all()
 
@@ -141,7 +141,7 @@ class RetrieveUpdateProposalClientAPIView(generics.RetrieveUpdateAPIView):
 
 class AcceptProposalClientAPIView(drf_views.APIView):
     permission_classes = [IsClient, IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
 
     def post(self, request, id):
         proposal = get_object_or_404(Proposal, id=id)
@@ -209,7 +209,7 @@ class RejectProposalClientAPIView(drf_views.APIView):
 
 class ListProposalFreelancerAPIView(generics.ListAPIView):
     serializer_class = my_serializers.ListProposalsFreelancerSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsFreelancer, IsAuthenticated]
     filter_backends = [OrderingFilter]
     ordering_fields = ['submitted_at', 'bid_amount', 'estimated_delivery_days',]
@@ -221,7 +221,7 @@ class ListProposalFreelancerAPIView(generics.ListAPIView):
 
 class RetrieveUpdateProposalFreelancerAPIView(generics.RetrieveUpdateAPIView):
     serializer_class = my_serializers.RetrieveUpdateProposalFreelancerSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsFreelancer, IsAuthenticated, IsOwner]
     queryset = Proposal.objects.all()
     lookup_field = 'id'
@@ -247,7 +247,7 @@ class RetrieveUpdateProposalFreelancerAPIView(generics.RetrieveUpdateAPIView):
 
 class WithdrawProposalFreelancerAPIView(drf_views.APIView):
     permission_classes = [IsAuthenticated, IsFreelancer]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
 
     def post(self, request, id):
         proposal = get_object_or_404(Proposal, id=id)
@@ -272,7 +272,7 @@ class WithdrawProposalFreelancerAPIView(drf_views.APIView):
 class ListProjectProposalsAdminAPIView(generics.ListAPIView):
     serializer_class = my_serializers.ListProjectProposalsAdminSerializer
     permission_classes = [IsAuthenticated, IsAdminUser]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     filter_backends = [OrderingFilter]
     ordering_fields = ['submitted_at', 'updated_at', 'accepted_at']
     ordering = ['-submitted_at']
@@ -288,7 +288,7 @@ class ListProjectProposalsAdminAPIView(generics.ListAPIView):
 class CreateMilestoneClientAPIView(generics.CreateAPIView):
     serializer_class = my_serializers.CreateMilestoneClientSerializer
     permission_classes = [permissions.IsAuthenticated, IsClient]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
 
     def get_project(self):
         return get_object_or_404(UserProject, id=self.kwargs['project_id'], client=self.request.user)
@@ -308,7 +308,7 @@ class CreateMilestoneClientAPIView(generics.CreateAPIView):
 class ListProjectMilestonesClientFreelancerAPIView(generics.ListAPIView):
     serializer_class = my_serializers.ListProjectMilestonesClientFreelancerSerializer
     permission_classes = [permissions.IsAuthenticated, IsClientOrAssignedFreelancer]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
 
     def get_queryset(self):
         project = get_object_or_404(UserProject, id=self.kwargs['project_id'])
@@ -319,9 +319,9 @@ class ListProjectMilestonesClientFreelancerAPIView(generics.ListAPIView):
     
 
 class SubmitMilestoneFreelancerAPIView(generics.UpdateAPIView):
-    serializer_class = my_serializers.MilestoneSubmitSerializer
+    serializer_class = my_serializers.SubmitMilestoneFreelancerSerializer
     permission_classes = [permissions.IsAuthenticated, IsFreelancer]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     queryset = Milestone.objects.all()
     lookup_field = 'id'
 
@@ -347,7 +347,7 @@ class SubmitMilestoneFreelancerAPIView(generics.UpdateAPIView):
 class RetrieveUpdateDeleteMilestoneClientAPIView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = my_serializers.RetrieveUpdateDeleteMilestoneClientSerializer
     permission_classes = [IsAuthenticated, IsClient]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     queryset = Milestone.objects.all()
     lookup_field = 'id'
 
@@ -382,9 +382,9 @@ class RetrieveUpdateDeleteMilestoneClientAPIView(generics.RetrieveUpdateDestroyA
 
 
 class RetrieveMilestoneFreelancerAPIView(generics.RetrieveAPIView):
-    serializer_class = my_serializers.RetrieveUpdateMilestoneFreelancerSerializer
+    serializer_class = my_serializers.RetrieveMilestoneFreelancerSerializer
     permission_classes = [IsAuthenticated, IsFreelancer]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     queryset = Milestone.objects.all()
     lookup_field = 'id'
 
@@ -398,7 +398,7 @@ class RetrieveMilestoneFreelancerAPIView(generics.RetrieveAPIView):
 class ApproveMilestoneClientAPIView(generics.UpdateAPIView):
     serializer_class = my_serializers.ApproveMilestoneClientSerializer
     permission_classes = [permissions.IsAuthenticated, IsClient]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     queryset = Milestone.objects.all()
     lookup_field = 'id'
 
@@ -424,7 +424,7 @@ class ApproveMilestoneClientAPIView(generics.UpdateAPIView):
 class RejectMilestoneClientAPIView(generics.UpdateAPIView):
     serializer_class = my_serializers.RejectMilestoneClientSerializer
     permission_classes = [permissions.IsAuthenticated, IsClient]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     queryset = Milestone.objects.all()
     lookup_field = 'id'
 